@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import random
+import threading
+import time
+
+from gpt_subtitle_translator.constants import TOKENS_PER_CHUNK, MAX_RETRIES, MAX_CONCURRENCY
+from gpt_subtitle_translator.logger import logger
+from gpt_subtitle_translator.models.mock_model import MockModel, FAILURE_MODES, LATENCY_DISTRIBUTIONS
+from gpt_subtitle_translator.request_scheduler import RequestScheduler
+from gpt_subtitle_translator.subtitle_translator import SubtitleTranslator, TranslationError
+
+WORDS = (
+    "the a you I we they it is was not what why how where when here there now never always maybe come go "
+    "know think want need look tell say take give find leave stay wait listen please sorry thanks okay yes no "
+    "man woman kid friend father mother brother sister house car door night day time money work home world"
+).split()
+
+
+def make_srt(num_cues: int, seed: int = 0) -> str:
+    """
+    Generate a synthetic SRT file, with cues of one or two lines of random words, a few of them repeated.
+    """
+    rng = random.Random(seed)
+    cues = []
+    for index in range(1, num_cues + 1):
+        if cues and rng.random() < 0.05:
+            text = rng.choice(cues)[1]
+        else:
+            lines = [" ".join(rng.choices(WORDS, k=rng.randint(2, 8))).capitalize() for _ in range(rng.randint(1, 2))]
+            text = "\n".join(lines)
+        cues.append((index, text))
+    return "".join(
+        f"{index}\n{format_timestamp(index * 3)} --> {format_timestamp(index * 3 + 2)}\n{text}\n\n"
+        for index, text in cues
+    )
+
+
+def format_timestamp(seconds: int) -> str:
+    return f"{seconds // 3600:02}:{seconds // 60 % 60:02}:{seconds % 60:02},000"
+
+
+class ProcessorTimer:
+    """
+    Measures the CPU time spent in the methods of a `SubtitleProcessor`, across all threads.
+    Only the outermost call is counted, when processor methods call each other.
+    """
+
+    def __init__(self, processor):
+        self.cpu_time = 0.0
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        for name in dir(processor):
+            method = getattr(processor, name)
+            if not name.startswith("_") and callable(method):
+                setattr(processor, name, self.wrap(method))
+
+    def wrap(self, method):
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            depth = getattr(self.local, "depth", 0)
+            self.local.depth = depth + 1
+            start = time.thread_time()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.local.depth = depth
+                if depth == 0:
+                    with self.lock:
+                        self.cpu_time += time.thread_time() - start
+        return timed
+
+
+def run_benchmark(num_cues: int, args) -> dict:
+    model = MockModel(
+        latency=args.latency,
+        latency_distribution=args.latency_distribution,
+        tokens_per_second=args.tokens_per_second,
+        failure_rates={mode: rate for mode, rate in zip(FAILURE_MODES, args.failure_rates) if rate},
+        seed=args.seed
+    )
+    scheduler = RequestScheduler(
+        max_concurrency=MAX_CONCURRENCY if args.adaptive else args.threads,
+        adaptive=args.adaptive,
+        base_backoff=args.backoff,
+        max_backoff=args.backoff * 10
+    )
+    translator = SubtitleTranslator(
+        model=model,
+        lang="English",
+        num_threads=args.threads,
+        tokens_per_chunk=args.chunk_size,
+        max_retries=args.retries,
+        retry_on_refusal=True,
+        scheduler=scheduler,
+        stream=args.stream
+    )
+    srt_data = make_srt(num_cues, args.seed)
+    num_chunks = len(translator.prepare(srt_data).chunks)
+    timer = ProcessorTimer(translator.processor)
+
+    error = None
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        if args.use_async:
+            asyncio.run(translator.translate_subtitles_async(srt_data))
+        else:
+            translator.translate_subtitles(srt_data)
+    except TranslationError as e:
+        error = type(e.original_exception).__name__
+    wall_time = time.perf_counter() - start_wall
+    cpu_time = time.process_time() - start_cpu
+
+    return {
+        "cues": num_cues,
+        "chunks": num_chunks,
+        "wall_time": wall_time,
+        "chunks_per_second": num_chunks / wall_time,
+        "cpu_time": cpu_time,
+        "processor_cpu_time": timer.cpu_time,
+        "requests": model.request_count,
+        "retries": model.request_count - num_chunks,
+        "rate_limit_retries": scheduler.rate_limit_count,
+        "failures": dict(model.failure_counts),
+        "input_tokens": model.total_input_tokens,
+        "output_tokens": model.total_output_tokens,
+        "cost": model.get_total_cost(),
+        "error": error,
+    }
+
+
+def print_report(results: list[dict]):
+    header = f"{'cues':>7} {'chunks':>7} {'wall s':>8} {'chunks/s':>9} {'cpu s':>7} {'proc cpu s':>10} " \
+             f"{'requests':>9} {'retries':>8} {'429s':>5} {'tokens':>10}  error"
+    print(header)
+    for r in results:
+        print(
+            f"{r['cues']:>7} {r['chunks']:>7} {r['wall_time']:>8.2f} {r['chunks_per_second']:>9.1f} "
+            f"{r['cpu_time']:>7.2f} {r['processor_cpu_time']:>10.3f} {r['requests']:>9} {r['retries']:>8} "
+            f"{r['rate_limit_retries']:>5} {r['input_tokens'] + r['output_tokens']:>10}  {r['error'] or ''}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the translation pipeline offline, against a mock model.')
+    parser.add_argument('-c', '--cues', type=int, nargs='+', default=[100, 1000, 5000, 20000],
+                        help='Number of cues of each synthetic SRT file.')
+    parser.add_argument('-t', '--threads', type=int, default=8, help='Number of threads to use.')
+    parser.add_argument('-s', '--chunk_size', type=int, default=TOKENS_PER_CHUNK, help='Number of tokens per chunk.')
+    parser.add_argument('-r', '--retries', type=int, default=MAX_RETRIES, help='Number of retries.')
+    parser.add_argument('--latency', type=float, default=0.05, help='Mean latency of a request, in seconds.')
+    parser.add_argument('--latency_distribution', type=str, default='lognormal', choices=LATENCY_DISTRIBUTIONS,
+                        help='Distribution of request latencies.')
+    parser.add_argument('--tokens_per_second', type=float, default=None, help='Output speed of the mock model.')
+    parser.add_argument('--failure_rates', type=float, nargs=len(FAILURE_MODES), default=[0.0] * len(FAILURE_MODES),
+                        metavar=tuple(mode.upper() for mode in FAILURE_MODES),
+                        help=f'Share of requests failing with each of: {", ".join(FAILURE_MODES)}.')
+    parser.add_argument('--backoff', type=float, default=0.01, help='Base backoff after a rate limit error, in seconds.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic files and injected failures.')
+    parser.add_argument('--async', dest='use_async', action='store_true', help='Use the async engine.')
+    parser.add_argument('--adaptive', action='store_true', help='Use adaptive concurrency.')
+    parser.add_argument('--stream', action='store_true', help='Stream responses.')
+    parser.add_argument('--json', type=str, default=None, help='Also write the results to this JSON file.')
+
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    results = [run_benchmark(num_cues, args) for num_cues in args.cues]
+    print_report(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
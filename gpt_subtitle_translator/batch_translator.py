@@ -0,0 +1,40 @@
+import asyncio
+from typing import NamedTuple, Optional, TextIO, Union
+
+from gpt_subtitle_translator.fanout import LanguageFanout
+from gpt_subtitle_translator.logger import logger
+from gpt_subtitle_translator.subtitle_translator import SubtitleTranslator
+
+
+class BatchJob(NamedTuple):
+    name: str
+    translator: SubtitleTranslator
+    srt_data: str
+    output: Optional[TextIO] = None
+
+
+async def translate_batch(jobs: list[BatchJob], languages_per_request: int = 1) -> list[Union[str, Exception]]:
+    """
+    Translate many files, or one file into many languages, on a single event loop.
+
+    Jobs whose translators share a model and request scheduler share its concurrency, so chunks from all
+    jobs are dispatched as capacity frees up. Jobs of the same file are parsed and chunked once, and with
+    `languages_per_request` above 1, their chunks are translated into several languages per request.
+    Returns the translation or the error of each job, in order.
+    Jobs with an `output` are written to it incrementally, and return None instead of the translation.
+    """
+    fanouts = {}
+    for job in jobs:
+        key = (job.srt_data, id(job.translator.model))
+        if key not in fanouts:
+            fanouts[key] = LanguageFanout(job.srt_data, languages_per_request)
+        fanouts[key].join(job.translator)
+
+    async def run(job: BatchJob) -> Optional[str]:
+        def log_progress(progress: float):
+            logger.info(f"{job.name}: {progress:.0%} done.")
+
+        fanout = fanouts[(job.srt_data, id(job.translator.model))]
+        return await job.translator.translate_subtitles_async(job.srt_data, log_progress, job.output, fanout)
+
+    return await asyncio.gather(*(run(job) for job in jobs), return_exceptions=True)
@@ -0,0 +1,39 @@
+from typing import Optional
+
+from gpt_subtitle_translator.constants import CHUNK_OUTPUT_SAFETY, RATIO_SMOOTHING
+from gpt_subtitle_translator.json_store import JsonStore
+
+
+class ChunkSizer(JsonStore):
+    """
+    Learns the output/input token ratio of each model and target language, from the chunks it translated,
+    and sizes chunks so their responses fill a safe share of the model's output limit.
+
+    The ratio is a moving average over completed chunks. When a path is given, the ratios are loaded from
+    and saved to a JSON file, so later runs start with a known ratio instead of a guessed chunk size.
+    """
+
+    def ratio(self, model_name: str, lang: str) -> Optional[float]:
+        with self.lock:
+            entry = self.entries.get(model_name, {}).get(lang)
+        return entry["ratio"] if entry else None
+
+    def observe(self, model_name: str, lang: str, input_tokens: int, output_tokens: int):
+        if input_tokens <= 0 or output_tokens <= 0:
+            return
+        ratio = output_tokens / input_tokens
+        with self.lock:
+            entry = self.entries.setdefault(model_name, {}).setdefault(lang, {"ratio": ratio, "samples": 0})
+            entry["samples"] += 1
+            # Plain average over the first samples, then a moving average, to follow changes of the prompt or model
+            weight = max(1 / entry["samples"], RATIO_SMOOTHING)
+            entry["ratio"] += weight * (ratio - entry["ratio"])
+
+    def chunk_size(self, model_name: str, lang: str, max_output_tokens: int) -> Optional[int]:
+        """
+        Returns the number of input tokens per chunk, or None if the ratio of the model and language is not known yet.
+        """
+        ratio = self.ratio(model_name, lang)
+        if ratio is None:
+            return None
+        return int(max_output_tokens * CHUNK_OUTPUT_SAFETY / ratio)
@@ -2,4 +2,28 @@ DEFAULT_MODEL = "gemini-2.0-flash-001"
 TOKENS_PER_CHUNK = 4000  # Safe value, might be able to increase depending on the language and content
 MAX_RETRIES = 3  # Despite instructions, model sometimes skips/merges subtitles. Retrying helps.
 DEFAULT_TEMPERATURE = 0.3
-COMPRESSION_RATIO_THRESHOLD = 2.5
\ No newline at end of file
+COMPRESSION_RATIO_THRESHOLD = 2.5
+REPAIR_CONTEXT_SIZE = 1  # Neighbouring subtitles sent along with missing ones when repairing a chunk
+MAX_REPAIR_RATIO = 0.5  # Above this share of missing subtitles, the whole chunk is retried instead
+CACHE_PATH = "~/.cache/gpt-subtitle-translator/translations.sqlite"
+CACHE_MAX_SIZE_MB = 200
+MAX_CONCURRENCY = 64  # Upper bound for adaptive concurrency, the rate limits of the provider usually kick in earlier
+STREAM_CHECK_CHARS = 1000  # How often a streamed response is checked for repetition loops and runaway length
+STREAM_WINDOW_CHARS = 4000  # Tail of the streamed response the compression ratio is measured on
+STREAM_COMPRESSION_RATIO_THRESHOLD = 4.0  # Higher than COMPRESSION_RATIO_THRESHOLD, short windows of a loop compress far better
+MAX_OUTPUT_RATIO = 3.0  # Output/input token ratio above which a streamed response is considered runaway
+BATCH_PRICE_RATIO = 0.5  # Batch APIs of OpenAI and Anthropic are billed at half the price
+BATCH_POLL_INTERVAL = 30  # Seconds between batch status checks
+STOP_GRACE_PERIOD = 2.0  # Seconds a request sent without streaming may still answer in, once its job stopped
+CHUNK_SIZES_PATH = "~/.cache/gpt-subtitle-translator/chunk_sizes.json"
+CHUNK_OUTPUT_SAFETY = 0.6  # Share of the output limit adaptive chunks are sized to fill, responses vary in length
+RATIO_SMOOTHING = 0.2  # Weight of the latest chunk in the moving average of the output/input token ratio
+HEDGE_LATENCY_FACTOR = 1.5  # A request is hedged once it runs this many times longer than the p95 latency
+HEDGE_MIN_SAMPLES = 10  # Requests the latency p95 is measured on before any request gets hedged
+HEDGE_BUDGET = 0.1  # Extra input tokens hedged requests may add, as a share of the regular requests
+TIKTOKEN_CACHE_DIR = "~/.cache/gpt-subtitle-translator/tiktoken"
+TOKEN_RATIOS_PATH = "~/.cache/gpt-subtitle-translator/token_ratios.json"  # Tokens per character of Gemini, by file
+MAX_TOKEN_RATIOS = 1000  # Files whose tokens per character ratio is kept
+SERVICE_PORT = 8765
+SERVICE_WORKERS = 4  # Jobs translated at once by the service, their requests share its scheduler
+SERVICE_JOB_HISTORY = 1000  # Finished jobs whose status and result the service keeps
@@ -0,0 +1,169 @@
+import asyncio
+import os
+import re
+import threading
+from typing import Callable, Optional, Union
+
+from gpt_subtitle_translator.constants import CHUNK_OUTPUT_SAFETY
+from gpt_subtitle_translator.logger import logger
+from gpt_subtitle_translator.subtitle_processor import SubtitleProcessor, Chunk
+from gpt_subtitle_translator.telemetry import RequestTrace
+
+LANGUAGE_HEADER = re.compile(r"^###\s*(.+?)\s*$", re.MULTILINE)
+
+
+class LanguageFanout:
+    """
+    Shares the work of translating one SRT file into several languages, one translator per language.
+
+    The file is parsed once, and chunked once for all the languages left with the same subtitles after their
+    translation memory lookups. With `languages_per_request` above 1, each chunk is translated into up to that many
+    languages in a single request, as far as the model's output limit fits their translations. The translation of
+    each language in a grouped response is validated like a response of its own, those missing subtitles are
+    repaired, and those missing or otherwise invalid fall back to their own requests, with the usual retries.
+    """
+
+    def __init__(self, srt_data: str, languages_per_request: int = 1):
+        self.srt_data = srt_data
+        self.languages_per_request = languages_per_request
+        self.lock = threading.Lock()
+        self.parsed_srt = None
+        self.chunks = {}
+        self.chunk_keys = {}
+        self.translators = []
+        self.requests = {}
+        self.prompt_template = self.load_prompt()
+
+    @staticmethod
+    def load_prompt() -> str:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        with open(os.path.join(script_dir, 'prompt_multi.txt'), encoding="utf-8") as f:
+            return f.read()
+
+    @property
+    def grouped(self) -> bool:
+        return self.languages_per_request > 1
+
+    def join(self, translator):
+        """
+        Add the translator of a language. Grouped requests are shared in the order translators joined.
+        """
+        self.translators.append(translator)
+
+    def parse(self, processor: SubtitleProcessor) -> dict:
+        with self.lock:
+            if self.parsed_srt is None:
+                self.parsed_srt = processor.parse_srt(self.srt_data)
+            return self.parsed_srt
+
+    def chunk(self, translator, key: tuple, make_chunks: Callable[[], list[Chunk]]) -> list[Chunk]:
+        """
+        The chunks of the subtitles identified by `key`, made by the first language asking for them.
+        """
+        with self.lock:
+            if key not in self.chunks:
+                self.chunks[key] = make_chunks()
+            self.chunk_keys[id(translator)] = key
+            return self.chunks[key]
+
+    def group_of(self, translator, chunk: Chunk) -> list:
+        """
+        The languages translated along with the language of `translator` for a chunk: those sharing its chunks and
+        model, in groups of `languages_per_request` or as many as the model's output limit fits.
+        """
+        key = self.chunk_keys.get(id(translator))
+        candidates = [
+            t for t in self.translators if self.chunk_keys.get(id(t)) == key and t.model is translator.model
+        ]
+        fits = int(translator.model.max_output_tokens() * CHUNK_OUTPUT_SAFETY / max(chunk.num_tokens, 1))
+        size = min(self.languages_per_request, fits)
+        if size < 2 or translator not in candidates:
+            return [translator]
+        position = candidates.index(translator) // size * size
+        return candidates[position:position + size]
+
+    async def translate(self, translator, chunk: Chunk) -> Optional[dict]:
+        """
+        Translate a chunk into the language of `translator` with a request shared by its group.
+        Returns None if the language has to be translated on its own, and raises the validation error of its
+        translation if it's invalid.
+        """
+        if not self.grouped:
+            return None
+        group = self.group_of(translator, chunk)
+        key = (chunk.text, group[0].lang)
+        task = self.requests.get(key)
+        if task is None:
+            members = [t for t in group if t is translator or not t.has_translation(chunk)]
+            if len(members) < 2:
+                return None
+            task = self.requests[key] = asyncio.ensure_future(self.request(members, chunk))
+        try:
+            # Shielded, so a language cancelled by its own failure doesn't cancel the request of the others
+            responses = await asyncio.shield(task)
+        except Exception as e:
+            logger.info(f"Grouped request of chunk {chunk.idx + 1} failed, translating {translator.lang} alone: {e}")
+            return None
+        response = responses.get(translator.lang)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def request(self, translators: list, chunk: Chunk) -> dict[str, Union[dict, Exception]]:
+        """
+        Request the translations of a chunk into the languages of `translators`.
+        Returns the translation of each language, or the error it failed validation with. Languages missing from
+        the response are left out. A response cut at the output limit fails every language.
+        """
+        first = translators[0]
+        model = first.model
+        langs = [t.lang for t in translators]
+        instructions, suffix = self.prompt_template.split("{subtitles}", 1)
+        instructions = instructions.replace("{target_languages}", ", ".join(langs))
+        prompt = chunk.text.strip() + suffix.replace("{target_languages}", ", ".join(langs))
+        prompt_tokens = model.num_tokens_from_string(instructions + suffix)
+        trace = RequestTrace(chunk.idx, 0, chunk.num_tokens + prompt_tokens, first.submitted_at.pop(chunk.idx, None))
+        logger.info(f"Processing chunk {chunk.idx + 1} into {len(langs)} languages, with {chunk.num_tokens} tokens.")
+
+        def call():
+            trace.start()
+            return model.agenerate_completion(prompt, first.temperature, instructions)
+
+        try:
+            raw_response, num_tokens = await first.scheduler.run_async(
+                call, chunk.num_tokens + prompt_tokens, chunk.num_tokens * len(langs)
+            )
+        except Exception as e:
+            first.telemetry.record_request(model.model_name, "+".join(langs), trace, e)
+            raise
+        trace.finish(num_tokens, first.get_compression_ratio(raw_response))
+        first.telemetry.record_request(model.model_name, "+".join(langs), trace)
+        # Charged to the job of the first language, the request can't be split between the others
+        first.record_usage(model, chunk, num_tokens)
+
+        # Translations come back tagged whatever the wire format of the translators
+        processor = SubtitleProcessor(model)
+        sections = self.parse_sections(raw_response)
+        responses = {}
+        for translator in translators:
+            section = sections.get(translator.lang.casefold())
+            if section is None:
+                continue
+            response = processor.parse_response(section, {})
+            try:
+                translator.validate_response(response, chunk, section, num_tokens)
+            except Exception as e:
+                responses[translator.lang] = e
+                continue
+            responses[translator.lang] = response
+        valid = [response for response in responses.values() if not isinstance(response, Exception)]
+        logger.info(f"Got chunk {chunk.idx + 1} in {len(valid)} of {len(langs)} languages.")
+        return responses
+
+    @staticmethod
+    def parse_sections(response: str) -> dict[str, str]:
+        """
+        Split a grouped response into the text of each language, by case-folded language name.
+        """
+        parts = LANGUAGE_HEADER.split(response)
+        return {name.casefold(): text.strip() for name, text in zip(parts[1::2], parts[2::2])}
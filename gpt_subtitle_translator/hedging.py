@@ -0,0 +1,68 @@
+import threading
+from typing import Optional
+
+from gpt_subtitle_translator.constants import HEDGE_LATENCY_FACTOR, HEDGE_MIN_SAMPLES, HEDGE_BUDGET
+from gpt_subtitle_translator.models.base_model import BaseModel
+from gpt_subtitle_translator.telemetry import Telemetry
+
+
+class HedgePolicy:
+    """
+    Decides when a slow request gets a hedged duplicate, sent to the same model or to `model` if given,
+    the first valid response of the two being kept.
+
+    A request is hedged once it runs `latency_factor` times longer than the p95 latency of the model,
+    measured by the telemetry over at least `min_samples` requests. Hedged requests may add at most
+    `budget` times the input tokens of the regular requests, so a slow provider doesn't double the cost.
+    Hedged requests go through the request scheduler like the others, so they mostly run at the end of a job,
+    when the last chunks leave free slots.
+    """
+
+    def __init__(
+        self,
+        model: Optional[BaseModel] = None,
+        latency_factor: float = HEDGE_LATENCY_FACTOR,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+        budget: float = HEDGE_BUDGET
+    ):
+        self.model = model
+        self.latency_factor = latency_factor
+        self.min_samples = min_samples
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.requested_tokens = 0
+        self.hedged_tokens = 0
+        self.hedge_count = 0
+        self.win_count = 0
+
+    def observe(self, num_tokens: int):
+        with self.lock:
+            self.requested_tokens += num_tokens
+
+    def can_hedge(self, num_tokens: int) -> bool:
+        with self.lock:
+            return self.hedged_tokens + num_tokens <= self.budget * self.requested_tokens
+
+    def delay(self, telemetry: Telemetry, model_name: str, num_tokens: int) -> Optional[float]:
+        """
+        Returns how long to wait for a request before hedging it, or None if it can't be hedged.
+        """
+        if not self.can_hedge(num_tokens):
+            return None
+        p95 = telemetry.percentile("latency", model_name, 0.95, self.min_samples)
+        return p95 * self.latency_factor if p95 is not None else None
+
+    def try_hedge(self, num_tokens: int) -> bool:
+        """
+        Reserve the budget of a hedged request, if there's enough left.
+        """
+        with self.lock:
+            if self.hedged_tokens + num_tokens > self.budget * self.requested_tokens:
+                return False
+            self.hedged_tokens += num_tokens
+            self.hedge_count += 1
+            return True
+
+    def record_win(self):
+        with self.lock:
+            self.win_count += 1
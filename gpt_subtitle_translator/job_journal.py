@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class JobJournal:
+    """
+    Append-only journal of the subtitles translated by a job, stored as JSON lines.
+
+    The subtitles of each chunk are recorded as soon as it's translated, each keyed by a hash of its id and text.
+    When resuming, subtitles found in the journal are reused whatever chunks they were translated in, so a run
+    chunking the file differently, such as with a newly learned chunk size, still resumes. Only the remaining
+    subtitles are sent to the model.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if resume and os.path.exists(path):
+            self.entries = self.load(path)
+        self.file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    @staticmethod
+    def load(path: str) -> dict:
+        entries = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:  # last line may be cut short if the process was killed while writing
+                    continue
+                entries.update(record.get("subtitles", {}))
+        return entries
+
+    @staticmethod
+    def make_key(id_: int, text: str) -> str:
+        return hashlib.sha256(f"{id_}\n{text}".encode("utf-8")).hexdigest()
+
+    def lookup(self, ids, texts) -> dict:
+        """
+        The recorded translations of the given subtitles, by id. Subtitles not recorded are left out.
+        """
+        with self.lock:
+            found = ((id_, self.entries.get(self.make_key(id_, text))) for id_, text in zip(ids, texts))
+            return {id_: translation for id_, translation in found if translation is not None}
+
+    def record(self, ids, texts, translations: dict):
+        """
+        Record the translations of the given subtitles, by id.
+        """
+        subtitles = {
+            self.make_key(id_, text): translations[id_] for id_, text in zip(ids, texts) if id_ in translations
+        }
+        with self.lock:
+            self.entries.update(subtitles)
+            self.file.write(json.dumps({"subtitles": subtitles}, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def close(self, remove: bool = False):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+            if remove and os.path.exists(self.path):
+                os.remove(self.path)
@@ -0,0 +1,43 @@
+import json
+import os
+import threading
+from typing import Optional
+
+from gpt_subtitle_translator.logger import logger
+
+
+class JsonStore:
+    """
+    Entries kept in memory, loaded from and saved to a JSON file when a path is given.
+
+    Saves write to a temporary file which then replaces the file, so a run killed while saving, or concurrent runs,
+    never leave a partly written file. A file which can't be read anyway is treated as empty.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = self.load(path) if path else {}
+
+    @staticmethod
+    def load(path: str) -> dict:
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable file {path}: {e}")
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
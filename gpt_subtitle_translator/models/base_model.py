@@ -1,17 +1,76 @@
+import asyncio
+import threading
 from abc import ABC, abstractmethod
+from typing import Callable, Optional, Union
 
 
 class BaseModel(ABC):
     def __init__(self, model_name: str):
         self.model_name = model_name
+        # Guards the usage totals, which are updated by the requests of all worker threads
+        self.usage_lock = threading.Lock()
 
     @abstractmethod
-    def generate_completion(self, prompt: str, temperature: float) -> (str, int):
+    def generate_completion(
+        self, prompt: str, temperature: float, instructions: str = "", timeout: Optional[float] = None
+    ) -> (str, int):
+        """
+        `instructions` is a prefix of the prompt shared by all requests of a job. Models supporting prompt caching
+        send it so the provider can cache it, the others prepend it to the prompt.
+        `timeout` is the number of seconds the request may take before failing, instead of the client's timeout.
+        """
         pass
 
+    async def agenerate_completion(self, prompt: str, temperature: float, instructions: str = "") -> (str, int):
+        """
+        Async version of `generate_completion`. Models with an async client should override this,
+        the default runs the blocking call in a worker thread.
+        """
+        return await asyncio.to_thread(self.generate_completion, prompt, temperature, instructions)
+
+    def generate_completion_stream(
+        self, prompt: str, temperature: float, on_text: Callable[[str], None], instructions: str = ""
+    ) -> (str, int):
+        """
+        Generate a completion, calling `on_text` with each piece of text as it streams in.
+        `on_text` may raise to abort the generation. Models without streaming support call it once, with the full text.
+        """
+        text, num_tokens = self.generate_completion(prompt, temperature, instructions)
+        on_text(text)
+        return text, num_tokens
+
+    async def agenerate_completion_stream(
+        self, prompt: str, temperature: float, on_text: Callable[[str], None], instructions: str = ""
+    ) -> (str, int):
+        text, num_tokens = await self.agenerate_completion(prompt, temperature, instructions)
+        on_text(text)
+        return text, num_tokens
+
+    def submit_batch(self, requests: dict[str, tuple[str, float]], instructions: str = "") -> str:
+        """
+        Submit prompts and temperatures, keyed by a custom id, as one job to the provider's batch API.
+        `instructions` is prepended to every prompt.
+        Returns the id of the batch.
+        """
+        raise NotImplementedError(f"Model {self.model_name} does not support batch requests.")
+
+    def get_batch_results(self, batch_id: str) -> Optional[dict[str, Union[tuple[str, int], Exception]]]:
+        """
+        Returns None while the batch is in progress. Once it ended, returns the completion or error of each request,
+        by custom id. Requests which didn't complete may be missing.
+        """
+        raise NotImplementedError(f"Model {self.model_name} does not support batch requests.")
+
     def num_tokens_from_string(self, string: str) -> int:
         pass
 
+    def num_tokens_from_strings(self, strings: list[str]) -> list[int]:
+        """
+        Count the tokens of many strings at once. Models with a local tokenizer should override this to encode
+        them in one batch.
+        """
+        return [self.num_tokens_from_string(string) for string in strings]
+
     def init_vocab(self, text: str):
         pass
 
@@ -19,4 +78,10 @@ class BaseModel(ABC):
         pass
 
     def get_total_cost(self) -> float:
-        pass
\ No newline at end of file
+        pass
+
+    def get_cost(self, input_tokens: int, output_tokens: int) -> float:
+        """
+        Cost of a request at the list prices of the model, without cache or batch discounts.
+        """
+        return 0.0
@@ -1,16 +1,23 @@
 import os
-from typing import Union
+from functools import cached_property
+from typing import Callable, Optional, Union
 
 import anthropic
 import tiktoken
-from anthropic import AnthropicBedrock, BadRequestError
+from anthropic import AnthropicBedrock, AsyncAnthropicBedrock, BadRequestError
 from dotenv import load_dotenv
 
+from gpt_subtitle_translator.constants import BATCH_PRICE_RATIO
 from gpt_subtitle_translator.models.base_model import BaseModel
+from gpt_subtitle_translator.models.tokenizer import get_encoding
+from gpt_subtitle_translator.request_scheduler import RateLimitError, TransientError
 from gpt_subtitle_translator.subtitle_translator import RefuseToTranslateError
 
 load_dotenv()
 
+CACHE_WRITE_PRICE_RATIO = 1.25
+CACHE_READ_PRICE_RATIO = 0.1
+
 model_params = {
     "claude-3-haiku-20240307": {
         "price_input": 0.00025,
@@ -30,46 +37,186 @@ class Claude(BaseModel):
         params = params or {}
         if model_name.startswith("anthropic."):
             self.client = AnthropicBedrock(**params)
+            self.async_client = AsyncAnthropicBedrock(**params)
             model_name = next(key for key in model_params if key in model_name)
         else:
             assert (os.getenv("ANTHROPIC_API_KEY") is not None),\
                 "Anthropic API key not found. Please set it in the .env file."
             self.client = anthropic.Anthropic(**params)
+            self.async_client = anthropic.AsyncAnthropic(**params)
         self.total_input_tokens = 0
         self.total_output_tokens = 0
+        self.total_cache_write_tokens = 0
+        self.total_cache_read_tokens = 0
+        self.total_batch_input_tokens = 0
+        self.total_batch_output_tokens = 0
         self.params = model_params[model_name]
 
 
-    def generate_completion(self, prompt: str, temperature: float) -> (str, int):
+    def generate_completion(
+        self, prompt: str, temperature: float, instructions: str = "", timeout: Optional[float] = None
+    ) -> (str, int):
         try:
             message = self.client.messages.create(
-                model=self.model_name,
-                max_tokens=self.params["max_output_tokens"],
-                temperature=temperature,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
+                **self._request_params(prompt, temperature, instructions),
+                **({"timeout": timeout} if timeout is not None else {})  # None would disable the client's timeout
+            )
+        except anthropic.APIError as e:
+            raise self._handle_error(e)
+        return self._handle_message(message)
+
+    async def agenerate_completion(self, prompt: str, temperature: float, instructions: str = "") -> (str, int):
+        try:
+            message = await self.async_client.messages.create(
+                **self._request_params(prompt, temperature, instructions)
             )
-            self.total_input_tokens += message.usage.input_tokens
-            self.total_output_tokens += message.usage.output_tokens
-            return message.content[0].text, message.usage.output_tokens
-        except BadRequestError as e:
-            if 'blocked by content filtering policy' in str(e):
-                raise RefuseToTranslateError("Output blocked by content filtering policy")
-            raise e
+        except anthropic.APIError as e:
+            raise self._handle_error(e)
+        return self._handle_message(message)
+
+    def generate_completion_stream(
+        self, prompt: str, temperature: float, on_text: Callable[[str], None], instructions: str = ""
+    ) -> (str, int):
+        parts = []
+        message = None
+        try:
+            params = self._request_params(prompt, temperature, instructions)
+            with self.client.messages.stream(**params) as stream:
+                for text in stream.text_stream:
+                    parts.append(text)
+                    on_text(text)
+                message = stream.get_final_message()
+        except anthropic.APIError as e:
+            raise self._handle_error(e)
+        finally:
+            output_tokens = self._handle_stream_usage(instructions + prompt, "".join(parts), message)
+        return "".join(parts), output_tokens
+
+    async def agenerate_completion_stream(
+        self, prompt: str, temperature: float, on_text: Callable[[str], None], instructions: str = ""
+    ) -> (str, int):
+        parts = []
+        message = None
+        try:
+            params = self._request_params(prompt, temperature, instructions)
+            async with self.async_client.messages.stream(**params) as stream:
+                async for text in stream.text_stream:
+                    parts.append(text)
+                    on_text(text)
+                message = await stream.get_final_message()
+        except anthropic.APIError as e:
+            raise self._handle_error(e)
+        finally:
+            output_tokens = self._handle_stream_usage(instructions + prompt, "".join(parts), message)
+        return "".join(parts), output_tokens
+
+    def submit_batch(self, requests: dict[str, tuple[str, float]], instructions: str = "") -> str:
+        batch = self.client.messages.batches.create(requests=[
+            {"custom_id": custom_id, "params": self._request_params(prompt, temperature, instructions)}
+            for custom_id, (prompt, temperature) in requests.items()
+        ])
+        return batch.id
+
+    def get_batch_results(self, batch_id: str) -> Optional[dict[str, Union[tuple[str, int], Exception]]]:
+        batch = self.client.messages.batches.retrieve(batch_id)
+        if batch.processing_status != "ended":
+            return None
+
+        results = {}
+        for entry in self.client.messages.batches.results(batch_id):
+            if entry.result.type != "succeeded":
+                results[entry.custom_id] = Exception(f"Batch request {entry.result.type}: {entry.result}")
+                continue
+            message = entry.result.message
+            with self.usage_lock:
+                self.total_batch_input_tokens += (
+                    message.usage.input_tokens +
+                    (message.usage.cache_creation_input_tokens or 0) +
+                    (message.usage.cache_read_input_tokens or 0)
+                )
+                self.total_batch_output_tokens += message.usage.output_tokens
+            results[entry.custom_id] = (message.content[0].text, message.usage.output_tokens)
+        return results
+
+    def _handle_stream_usage(self, prompt: str, text: str, message) -> int:
+        """
+        Record the usage of a streamed response. When the stream was aborted before the final message,
+        it's estimated with the tokenizer.
+        """
+        if message is not None:
+            return self._handle_usage(message.usage)
+        if not text:
+            return 0
+        output_tokens = self.num_tokens_from_string(text)
+        input_tokens = self.num_tokens_from_string(prompt)
+        with self.usage_lock:
+            self.total_input_tokens += input_tokens
+            self.total_output_tokens += output_tokens
+        return output_tokens
+
+    def _request_params(self, prompt: str, temperature: float, instructions: str) -> dict:
+        content = [{"type": "text", "text": prompt}]
+        if instructions:
+            # Mark the instructions shared by all chunks as a cacheable prefix
+            content.insert(0, {"type": "text", "text": instructions, "cache_control": {"type": "ephemeral"}})
+        return dict(
+            model=self.model_name,
+            max_tokens=self.params["max_output_tokens"],
+            temperature=temperature,
+            messages=[
+                {"role": "user", "content": content}
+            ]
+        )
+
+    def _handle_message(self, message) -> (str, int):
+        return message.content[0].text, self._handle_usage(message.usage)
+
+    def _handle_usage(self, usage) -> int:
+        with self.usage_lock:
+            self.total_input_tokens += usage.input_tokens
+            self.total_cache_write_tokens += usage.cache_creation_input_tokens or 0
+            self.total_cache_read_tokens += usage.cache_read_input_tokens or 0
+            self.total_output_tokens += usage.output_tokens
+        return usage.output_tokens
+
+    @staticmethod
+    def _handle_error(e: anthropic.APIError) -> Exception:
+        if isinstance(e, BadRequestError) and 'blocked by content filtering policy' in str(e):
+            return RefuseToTranslateError("Output blocked by content filtering policy")
+        if isinstance(e, anthropic.RateLimitError):
+            return RateLimitError(str(e))
+        if isinstance(e, anthropic.APIConnectionError) or isinstance(e, anthropic.APIStatusError) and e.status_code >= 500:
+            return TransientError(str(e))
+        return e
 
     def get_total_cost(self) -> float:
         input_cost = (self.total_input_tokens / 1000) * self.params["price_input"]
+        cache_cost = (
+            CACHE_WRITE_PRICE_RATIO * self.total_cache_write_tokens +
+            CACHE_READ_PRICE_RATIO * self.total_cache_read_tokens
+        ) / 1000 * self.params["price_input"]
         output_cost = (self.total_output_tokens / 1000) * self.params["price_output"]
-        return input_cost + output_cost
+        batch_cost = BATCH_PRICE_RATIO * (
+            (self.total_batch_input_tokens / 1000) * self.params["price_input"] +
+            (self.total_batch_output_tokens / 1000) * self.params["price_output"]
+        )
+        return input_cost + cache_cost + output_cost + batch_cost
 
-    def num_tokens_from_string(self, string: str) -> int:
+    def get_cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens / 1000) * self.params["price_input"] + (output_tokens / 1000) * self.params["price_output"]
+
+    @cached_property
+    def encoding(self) -> tiktoken.Encoding:
         """
         This is not correct. No tokenizer is available for Claude models.
         """
-        encoding = tiktoken.encoding_for_model("gpt-4")
-        num_tokens = len(encoding.encode(string))
-        return num_tokens
+        return get_encoding("gpt-4")
+
+    def num_tokens_from_string(self, string: str) -> int:
+        return len(self.encoding.encode(string))
+
+    def num_tokens_from_strings(self, strings: list[str]) -> list[int]:
+        return [len(tokens) for tokens in self.encoding.encode_batch(strings)]
 
     def max_output_tokens(self) -> int:
         return self.params["max_output_tokens"]
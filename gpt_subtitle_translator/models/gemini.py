@@ -1,95 +1,252 @@
 import json
 import os
-from typing import Union
+import threading
+import time
+from typing import Callable, Optional, Union
 
 from google import genai
+from google.genai import errors
 
 from dotenv import load_dotenv
 from google.genai.types import HarmBlockThreshold, FinishReason, GenerateContentConfigDict, GenerateContentConfig, \
-    HttpOptions, SafetySetting, ThinkingConfig
+    HttpOptions, SafetySetting, ThinkingConfig, CreateCachedContentConfig
 
+from gpt_subtitle_translator.constants import TOKEN_RATIOS_PATH
+from gpt_subtitle_translator.logger import logger
 from gpt_subtitle_translator.models.base_model import BaseModel
+from gpt_subtitle_translator.models.token_ratios import TokenRatioCache
+from gpt_subtitle_translator.request_scheduler import RateLimitError, TransientError
 from gpt_subtitle_translator.subtitle_translator import RefuseToTranslateError
 
 load_dotenv()
 
+CACHED_CONTENT_TTL = 600
+CACHED_CONTENT_REFRESH = 60  # Cached content is recreated this many seconds before it expires
+CHARS_PER_TOKEN_ESTIMATE = 4  # Before the vocabulary is initialized
+REQUEST_TIMEOUT = 300
+CACHED_INPUT_PRICE_RATIO = 0.25
+
 model_params = {
     "gemini-1.5-flash-latest": {
         "price_input": 0.000075,
         "price_output": 0.0003,
         "max_output_tokens": 8192,
+        "min_cached_tokens": 32_768,
         "thinking_enabled": False,
     },
     "gemini-exp-1206": {
         "price_input": 0.00035,
         "price_output": 0.00053,
         "max_output_tokens": 8192,
+        "min_cached_tokens": 32_768,
     "thinking_enabled": False,
     },
     "gemini-1.5-pro-latest": {
         "price_input": 0.00125,
         "price_output": 0.005,
         "max_output_tokens": 8192,
+        "min_cached_tokens": 32_768,
     "thinking_enabled": False,
     },
     "gemini-2.0-flash-001" : {
         "price_input": 0.0001,
         "price_output": 0.0004,
         "max_output_tokens": 8192,
+        "min_cached_tokens": 4096,
         "thinking_enabled": False,
     },
     "gemini-2.5-flash-preview-04-17" : {
         "price_input": 0.00016,
         "price_output": 0.0006,
         "max_output_tokens": 65_536,
+        "min_cached_tokens": 1024,
         "thinking_enabled": True,
     },
 }
 
 class Gemini(BaseModel):
-    def __init__(self, model_name: str = "gemini-2.0-flash-001", params: Union[None, dict] = None):
+    def __init__(
+        self,
+        model_name: str = "gemini-2.0-flash-001",
+        params: Union[None, dict] = None,
+        token_ratios: Optional[TokenRatioCache] = None
+    ):
         super().__init__(model_name)
         assert model_name in model_params, f"Model {model_name} info not found."
         self.client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
         self.total_input_tokens = 0
         self.total_output_tokens = 0
+        self.total_cached_input_tokens = 0
         self.params = model_params[model_name]
+        self.timeout = (params or {}).get("timeout", REQUEST_TIMEOUT)
         self.average_tokens_per_char = None
+        self.token_ratios = token_ratios or TokenRatioCache(os.path.expanduser(TOKEN_RATIOS_PATH))
+        self.cached_contents = {}
+        self.lock = threading.Lock()
+
+
+    def generate_completion(
+        self, prompt: str, temperature: float, instructions: str = "", timeout: Optional[float] = None
+    ) -> (str, int):
+        try:
+            message = self.client.models.generate_content(
+                **self._request_params(prompt, temperature, instructions, timeout)
+            )
+        except errors.APIError as e:
+            raise self._handle_error(e, instructions)
+        return self._handle_message(message)
+
+    async def agenerate_completion(self, prompt: str, temperature: float, instructions: str = "") -> (str, int):
+        try:
+            message = await self.client.aio.models.generate_content(
+                **self._request_params(prompt, temperature, instructions)
+            )
+        except errors.APIError as e:
+            raise self._handle_error(e, instructions)
+        return self._handle_message(message)
+
+    def generate_completion_stream(
+        self, prompt: str, temperature: float, on_text: Callable[[str], None], instructions: str = ""
+    ) -> (str, int):
+        parts = []
+        last_message = None
+        try:
+            stream = self.client.models.generate_content_stream(
+                **self._request_params(prompt, temperature, instructions)
+            )
+            for message in stream:
+                last_message = message
+                self._check_stream_message(message, parts, on_text)
+        except errors.APIError as e:
+            raise self._handle_error(e, instructions)
+        finally:
+            output_tokens = self._handle_stream_usage(instructions + prompt, "".join(parts), last_message)
+        return "".join(parts) or self._empty_message_text(last_message), output_tokens
 
+    async def agenerate_completion_stream(
+        self, prompt: str, temperature: float, on_text: Callable[[str], None], instructions: str = ""
+    ) -> (str, int):
+        parts = []
+        last_message = None
+        try:
+            stream = await self.client.aio.models.generate_content_stream(
+                **self._request_params(prompt, temperature, instructions)
+            )
+            async for message in stream:
+                last_message = message
+                self._check_stream_message(message, parts, on_text)
+        except errors.APIError as e:
+            raise self._handle_error(e, instructions)
+        finally:
+            output_tokens = self._handle_stream_usage(instructions + prompt, "".join(parts), last_message)
+        return "".join(parts) or self._empty_message_text(last_message), output_tokens
 
-    def generate_completion(self, prompt: str, temperature: float) -> (str, int):
-        message = self.client.models.generate_content(
-            contents=[prompt],
+    @staticmethod
+    def _check_stream_message(message, parts: list[str], on_text: Callable[[str], None]):
+        if message.candidates and message.candidates[0].finish_reason == FinishReason.SAFETY:
+            raise RefuseToTranslateError("Output blocked by content filtering policy")
+        if message.text:
+            parts.append(message.text)
+            on_text(message.text)
+
+    @staticmethod
+    def _empty_message_text(message) -> str:
+        finish_reason = message.candidates[0].finish_reason if message and message.candidates else None
+        return f"finish_reason: {finish_reason}"
+
+    def _handle_stream_usage(self, prompt: str, text: str, message) -> int:
+        """
+        Record the usage of a streamed response. The usage is reported with the last message,
+        so when the stream was aborted early, it's estimated from the average tokens per character.
+        """
+        usage = message.usage_metadata if message is not None else None
+        if usage is not None and usage.candidates_token_count is not None:
+            return self._handle_usage(usage)
+        if not text:
+            return 0
+        output_tokens = self.num_tokens_from_string(text)
+        input_tokens = self.num_tokens_from_string(prompt)
+        with self.usage_lock:
+            self.total_input_tokens += input_tokens
+            self.total_output_tokens += output_tokens
+        return output_tokens
+
+    def _request_params(
+        self, prompt: str, temperature: float, instructions: str, timeout: Optional[float] = None
+    ) -> dict:
+        cached_content = self._get_cached_content(instructions) if instructions else None
+        return dict(
+            contents=[prompt] if cached_content else [instructions + prompt],
             model=self.model_name,
-            config=GenerateContentConfig(
-                temperature=temperature,
-                max_output_tokens=self.params["max_output_tokens"],
-                http_options=HttpOptions(
-                    timeout=1000 * 60 * 5
-                ),
-                thinking_config=self.params['thinking_enabled'] and ThinkingConfig(
-                    thinking_budget=0
-                ) or None,
-                safety_settings=[
-                    SafetySetting(
-                        category="HARM_CATEGORY_HARASSMENT",
-                        threshold="OFF"
-                    ),
-                    SafetySetting(
-                        category="HARM_CATEGORY_HATE_SPEECH",
-                        threshold="OFF"
-                    ),
-                    SafetySetting(
-                        category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                        threshold="OFF"
-                    ),
-                    SafetySetting(
-                        category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                        threshold="OFF"
-                    )
-            ])
+            config=self._config(temperature, cached_content, timeout)
         )
 
+    def _get_cached_content(self, instructions: str) -> Optional[str]:
+        """
+        Cache the instructions shared by all chunks as cached content, once per distinct instructions, and again
+        shortly before it expires. Instructions below the provider's minimum size for caching are sent in full with
+        each request instead, as when caching fails.
+        """
+        with self.lock:
+            name, expires_at = self.cached_contents.get(instructions, (None, 0.0))
+            if instructions in self.cached_contents and (name is None or time.monotonic() < expires_at):
+                return name
+            name = None
+            if self._estimate_tokens(instructions) >= self.params["min_cached_tokens"]:
+                try:
+                    name = self.client.caches.create(
+                        model=self.model_name,
+                        config=CreateCachedContentConfig(contents=[instructions], ttl=f"{CACHED_CONTENT_TTL}s")
+                    ).name
+                except errors.APIError as e:
+                    logger.info(f"Prompt caching not available, sending full prompts: {e}")
+            self.cached_contents[instructions] = (
+                name, time.monotonic() + CACHED_CONTENT_TTL - CACHED_CONTENT_REFRESH
+            )
+            return name
+
+    def _drop_cached_content(self, instructions: str):
+        with self.lock:
+            self.cached_contents.pop(instructions, None)
+
+    def _estimate_tokens(self, text: str) -> int:
+        if self.average_tokens_per_char is None:
+            return len(text) // CHARS_PER_TOKEN_ESTIMATE
+        return self.num_tokens_from_string(text)
+
+    def _config(
+        self, temperature: float, cached_content: Optional[str] = None, timeout: Optional[float] = None
+    ) -> GenerateContentConfig:
+        return GenerateContentConfig(
+            cached_content=cached_content,
+            temperature=temperature,
+            max_output_tokens=self.params["max_output_tokens"],
+            http_options=HttpOptions(
+                timeout=int(1000 * (self.timeout if timeout is None else min(self.timeout, timeout)))
+            ),
+            thinking_config=self.params['thinking_enabled'] and ThinkingConfig(
+                thinking_budget=0
+            ) or None,
+            safety_settings=[
+                SafetySetting(
+                    category="HARM_CATEGORY_HARASSMENT",
+                    threshold="OFF"
+                ),
+                SafetySetting(
+                    category="HARM_CATEGORY_HATE_SPEECH",
+                    threshold="OFF"
+                ),
+                SafetySetting(
+                    category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
+                    threshold="OFF"
+                ),
+                SafetySetting(
+                    category="HARM_CATEGORY_DANGEROUS_CONTENT",
+                    threshold="OFF"
+                )
+        ])
+
+    def _handle_message(self, message) -> (str, int):
         if message.text:
             message_text = message.text
         else:
@@ -98,21 +255,47 @@ class Gemini(BaseModel):
             else:
                 message_text = f"finish_reason: {message.candidates[0].finish_reason}"
 
-        usage = message.usage_metadata
-        output_token_count = usage.candidates_token_count
-        input_token_count = usage.prompt_token_count
-        self.total_input_tokens += input_token_count
-        self.total_output_tokens += output_token_count
-        return message_text, output_token_count
+        return message_text, self._handle_usage(message.usage_metadata)
+
+    def _handle_usage(self, usage) -> int:
+        with self.usage_lock:
+            self.total_input_tokens += usage.prompt_token_count
+            self.total_cached_input_tokens += usage.cached_content_token_count or 0
+            self.total_output_tokens += usage.candidates_token_count
+        return usage.candidates_token_count
+
+    def _handle_error(self, e: errors.APIError, instructions: str = "") -> Exception:
+        if e.code == 429:
+            return RateLimitError(str(e))
+        if isinstance(e, errors.ServerError):
+            return TransientError(str(e))
+        if instructions and e.code in (403, 404) and "cachedcontent" in str(e).lower().replace(" ", ""):
+            # The cached content expired or was deleted, the retry recreates it
+            self._drop_cached_content(instructions)
+            return TransientError(str(e))
+        return e
 
     def init_vocab(self, text: str):
-        token_count = self._get_token_count(text) # get token count requires an http request, so we only do it once
-        self.average_tokens_per_char = token_count / len(text)
+        """
+        Counting tokens requires an http request, so it's done once per text, and the ratio is cached
+        for the other languages and later runs on the same file.
+        """
+        key = self.token_ratios.make_key(self.model_name, text)
+        ratio = self.token_ratios.get(key)
+        if ratio is None:
+            ratio = self._get_token_count(text) / len(text)
+            self.token_ratios.put(key, ratio)
+        self.average_tokens_per_char = ratio
 
     def get_total_cost(self) -> float:
-        input_cost = (self.total_input_tokens / 1000) * self.params["price_input"]
+        uncached_input_tokens = self.total_input_tokens - self.total_cached_input_tokens
+        input_cost = (uncached_input_tokens / 1000) * self.params["price_input"]
+        cached_input_cost = CACHED_INPUT_PRICE_RATIO * (self.total_cached_input_tokens / 1000) * self.params["price_input"]
         output_cost = (self.total_output_tokens / 1000) * self.params["price_output"]
-        return input_cost + output_cost
+        return input_cost + cached_input_cost + output_cost
+
+    def get_cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens / 1000) * self.params["price_input"] + (output_tokens / 1000) * self.params["price_output"]
 
     def num_tokens_from_string(self, string: str) -> int:
         num_chars = len(string)
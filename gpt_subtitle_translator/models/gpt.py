@@ -1,17 +1,19 @@
+import json
 import os
+from functools import cached_property
+from typing import Callable, Optional, Union
+
 import openai
 import tiktoken
 from dotenv import load_dotenv
 
+from gpt_subtitle_translator.constants import BATCH_PRICE_RATIO
 from gpt_subtitle_translator.models.base_model import BaseModel
+from gpt_subtitle_translator.models.tokenizer import get_encoding
+from gpt_subtitle_translator.request_scheduler import RateLimitError, TransientError
 
 load_dotenv()
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
-assert (
-    openai.api_key is not None
-), "OpenAI API key not found. Please set it in the .env file."
-
 # as of 01/30/2024
 model_params = {
     "gpt-4-turbo-preview": {
@@ -31,22 +33,167 @@ model_params = {
     },
     "gpt-4o-mini": {
         "price_input": 0.00015,
+        "price_cached_input": 0.000075,
         "price_output": 0.0006,
         "max_output_tokens": 8192,
     },
 }
 
 class GPT(BaseModel):
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, params: Union[None, dict] = None):
         assert model_name in model_params, f"Model {model_name} info not found."
         super().__init__(model_name)
+        params = params or {}
         self.params = model_params[model_name]
         self.total_input_tokens = 0
         self.total_output_tokens = 0
+        self.total_cached_input_tokens = 0
+        self.total_batch_input_tokens = 0
+        self.total_batch_output_tokens = 0
+        api_key = os.getenv("OPENAI_API_KEY")
+        assert api_key is not None, "OpenAI API key not found. Please set it in the .env file."
+        self.client = openai.OpenAI(api_key=api_key, **params)
+        self.async_client = openai.AsyncOpenAI(api_key=api_key, **params)
+
+    def generate_completion(
+        self, prompt: str, temperature: float, instructions: str = "", timeout: Optional[float] = None
+    ) -> (str, int):
+        try:
+            response = self.client.chat.completions.create(
+                **self._request_params(prompt, temperature, instructions),
+                **({"timeout": timeout} if timeout is not None else {})  # None would disable the client's timeout
+            )
+        except openai.APIError as e:
+            raise self._handle_error(e)
+        return self._handle_response(response)
+
+    async def agenerate_completion(self, prompt: str, temperature: float, instructions: str = "") -> (str, int):
+        try:
+            response = await self.async_client.chat.completions.create(
+                **self._request_params(prompt, temperature, instructions)
+            )
+        except openai.APIError as e:
+            raise self._handle_error(e)
+        return self._handle_response(response)
+
+    def generate_completion_stream(
+        self, prompt: str, temperature: float, on_text: Callable[[str], None], instructions: str = ""
+    ) -> (str, int):
+        parts = []
+        usage = None
+        try:
+            stream = self.client.chat.completions.create(
+                **self._request_params(prompt, temperature, instructions),
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            with stream:
+                for event in stream:
+                    usage = event.usage or usage
+                    if event.choices and event.choices[0].delta.content:
+                        parts.append(event.choices[0].delta.content)
+                        on_text(parts[-1])
+        except openai.APIError as e:
+            raise self._handle_error(e)
+        finally:
+            output_tokens = self._handle_stream_usage(instructions + prompt, "".join(parts), usage)
+        return "".join(parts), output_tokens
+
+    async def agenerate_completion_stream(
+        self, prompt: str, temperature: float, on_text: Callable[[str], None], instructions: str = ""
+    ) -> (str, int):
+        parts = []
+        usage = None
+        try:
+            stream = await self.async_client.chat.completions.create(
+                **self._request_params(prompt, temperature, instructions),
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            async with stream:
+                async for event in stream:
+                    usage = event.usage or usage
+                    if event.choices and event.choices[0].delta.content:
+                        parts.append(event.choices[0].delta.content)
+                        on_text(parts[-1])
+        except openai.APIError as e:
+            raise self._handle_error(e)
+        finally:
+            output_tokens = self._handle_stream_usage(instructions + prompt, "".join(parts), usage)
+        return "".join(parts), output_tokens
+
+    def submit_batch(self, requests: dict[str, tuple[str, float]], instructions: str = "") -> str:
+        lines = [
+            json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._request_params(prompt, temperature, instructions),
+            }, ensure_ascii=False)
+            for custom_id, (prompt, temperature) in requests.items()
+        ]
+        batch_file = self.client.files.create(
+            file=("batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h"
+        )
+        return batch.id
+
+    def get_batch_results(self, batch_id: str) -> Optional[dict[str, Union[tuple[str, int], Exception]]]:
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status in ("validating", "in_progress", "finalizing", "cancelling"):
+            return None
 
-    def generate_completion(self, prompt: str, temperature: float) -> (str, int):
-        messages = [{"role": "system", "content": prompt}]
-        response = openai.chat.completions.create(
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if record.get("error") or response.get("status_code") != 200:
+                    results[record["custom_id"]] = Exception(f"Batch request failed: {record.get('error') or response}")
+                    continue
+                body = response["body"]
+                with self.usage_lock:
+                    self.total_batch_input_tokens += body["usage"]["prompt_tokens"]
+                    self.total_batch_output_tokens += body["usage"]["completion_tokens"]
+                results[record["custom_id"]] = (
+                    body["choices"][0]["message"]["content"], body["usage"]["completion_tokens"]
+                )
+        return results
+
+    def _handle_stream_usage(self, prompt: str, text: str, usage) -> int:
+        """
+        Record the usage of a streamed response. When the stream was aborted before the usage was reported,
+        it's estimated with the tokenizer.
+        """
+        if usage is not None:
+            return self._handle_usage(usage)
+        if not text:
+            return 0
+        output_tokens = self.num_tokens_from_string(text)
+        input_tokens = self.num_tokens_from_string(prompt)
+        with self.usage_lock:
+            self.total_input_tokens += input_tokens
+            self.total_output_tokens += output_tokens
+        return output_tokens
+
+    def _handle_usage(self, usage) -> int:
+        details = getattr(usage, "prompt_tokens_details", None)
+        with self.usage_lock:
+            self.total_input_tokens += usage.prompt_tokens
+            self.total_cached_input_tokens += (details and details.cached_tokens) or 0
+            self.total_output_tokens += usage.completion_tokens
+        return usage.completion_tokens
+
+    def _request_params(self, prompt: str, temperature: float, instructions: str) -> dict:
+        # OpenAI caches long prompt prefixes automatically, as long as they're identical between requests
+        messages = [{"role": "system", "content": instructions + prompt}]
+        return dict(
             model=self.model_name,
             messages=messages,
             max_tokens=self.params["max_output_tokens"],
@@ -54,19 +201,43 @@ class GPT(BaseModel):
             n=1,
             stop=None,
         )
-        self.total_input_tokens += response.usage.prompt_tokens
-        self.total_output_tokens += response.usage.completion_tokens
-        return response.choices[0].message.content, response.usage.completion_tokens
+
+    def _handle_response(self, response) -> (str, int):
+        return response.choices[0].message.content, self._handle_usage(response.usage)
+
+    @staticmethod
+    def _handle_error(e: openai.APIError) -> Exception:
+        if isinstance(e, openai.RateLimitError):
+            return RateLimitError(str(e))
+        if isinstance(e, openai.APIConnectionError) or isinstance(e, openai.APIStatusError) and e.status_code >= 500:
+            return TransientError(str(e))
+        return e
 
     def get_total_cost(self) -> float:
-        input_cost =  (self.total_input_tokens / 1000) * self.params["price_input"]
+        uncached_input_tokens = self.total_input_tokens - self.total_cached_input_tokens
+        input_cost = (uncached_input_tokens / 1000) * self.params["price_input"]
+        cached_input_cost = (self.total_cached_input_tokens / 1000) * self.params.get(
+            "price_cached_input", self.params["price_input"]
+        )
         output_cost = (self.total_output_tokens / 1000) * self.params["price_output"]
-        return input_cost + output_cost
+        batch_cost = BATCH_PRICE_RATIO * (
+            (self.total_batch_input_tokens / 1000) * self.params["price_input"] +
+            (self.total_batch_output_tokens / 1000) * self.params["price_output"]
+        )
+        return input_cost + cached_input_cost + output_cost + batch_cost
+
+    def get_cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens / 1000) * self.params["price_input"] + (output_tokens / 1000) * self.params["price_output"]
+
+    @cached_property
+    def encoding(self) -> tiktoken.Encoding:
+        return get_encoding(self.model_name)
 
     def num_tokens_from_string(self, string: str) -> int:
-        encoding = tiktoken.encoding_for_model(self.model_name)
-        num_tokens = len(encoding.encode(string))
-        return num_tokens
+        return len(self.encoding.encode(string))
+
+    def num_tokens_from_strings(self, strings: list[str]) -> list[int]:
+        return [len(tokens) for tokens in self.encoding.encode_batch(strings)]
 
     def max_output_tokens(self) -> int:
         return self.params["max_output_tokens"]
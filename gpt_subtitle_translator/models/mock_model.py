@@ -0,0 +1,188 @@
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import Counter
+from typing import Callable, Optional
+
+from gpt_subtitle_translator.models.base_model import BaseModel
+from gpt_subtitle_translator.request_scheduler import RateLimitError, TransientError
+from gpt_subtitle_translator.subtitle_processor import SubtitleProcessor
+
+FAILURE_MODES = ("skip", "merge", "loop", "refusal", "rate_limit")
+LATENCY_DISTRIBUTIONS = ("constant", "uniform", "exponential", "lognormal")
+CHARS_PER_TOKEN = 4
+STREAM_PIECE_CHARS = 64
+
+
+class MockModel(BaseModel):
+    """
+    Offline model for benchmarks and tests, which "translates" subtitles by echoing them back,
+    in the wire format of the prompt, tagged or compact.
+
+    Each request waits for a latency drawn from `latency_distribution`, with a mean of `latency` seconds,
+    plus the time to generate the output at `tokens_per_second`. Failures are injected at the rates given in
+    `failure_rates`, by mode:
+    - skip: a subtitle is missing from the response.
+    - merge: two neighbouring subtitles are merged into one.
+    - loop: the response repeats a subtitle until it hits the output limit.
+    - refusal: the response is a refusal, without any subtitles.
+    - rate_limit: the request is rejected with a rate limit error.
+
+    Random draws are seeded by the prompt and the number of times it was sent, so a run is reproducible
+    regardless of the order in which requests are scheduled.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "mock",
+        latency: float = 0.0,
+        latency_distribution: str = "constant",
+        tokens_per_second: Optional[float] = None,
+        failure_rates: Optional[dict[str, float]] = None,
+        seed: int = 0,
+        max_tokens: int = 4096,
+        price_input: float = 0.001,
+        price_output: float = 0.002
+    ):
+        assert latency_distribution in LATENCY_DISTRIBUTIONS, f"Unknown latency distribution {latency_distribution}."
+        failure_rates = failure_rates or {}
+        assert set(failure_rates) <= set(FAILURE_MODES), f"Unknown failure modes {set(failure_rates) - set(FAILURE_MODES)}."
+        assert sum(failure_rates.values()) <= 1, "Failure rates must add up to at most 1."
+        super().__init__(model_name)
+        self.latency = latency
+        self.latency_distribution = latency_distribution
+        self.tokens_per_second = tokens_per_second
+        self.failure_rates = failure_rates
+        self.seed = seed
+        self.max_tokens = max_tokens
+        self.price_input = price_input
+        self.price_output = price_output
+        self.total_input_tokens = 0
+        self.total_output_tokens = 0
+        self.request_count = 0
+        self.failure_counts = Counter()
+        self.sent = Counter()
+        self.lock = threading.Lock()
+
+    def generate_completion(
+        self, prompt: str, temperature: float, instructions: str = "", timeout: Optional[float] = None
+    ) -> (str, int):
+        text, num_tokens, delay = self._complete(prompt, instructions)
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise TransientError(f"Mock request timed out after {timeout:.1f}s.")
+        time.sleep(delay)
+        return text, num_tokens
+
+    async def agenerate_completion(self, prompt: str, temperature: float, instructions: str = "") -> (str, int):
+        text, num_tokens, delay = self._complete(prompt, instructions)
+        await asyncio.sleep(delay)
+        return text, num_tokens
+
+    def generate_completion_stream(
+        self, prompt: str, temperature: float, on_text: Callable[[str], None], instructions: str = ""
+    ) -> (str, int):
+        text, num_tokens, delay = self._complete(prompt, instructions)
+        pieces = self._split_pieces(text)
+        for piece in pieces:
+            time.sleep(delay / len(pieces))
+            on_text(piece)
+        return text, num_tokens
+
+    async def agenerate_completion_stream(
+        self, prompt: str, temperature: float, on_text: Callable[[str], None], instructions: str = ""
+    ) -> (str, int):
+        text, num_tokens, delay = self._complete(prompt, instructions)
+        pieces = self._split_pieces(text)
+        for piece in pieces:
+            await asyncio.sleep(delay / len(pieces))
+            on_text(piece)
+        return text, num_tokens
+
+    def _complete(self, prompt: str, instructions: str) -> (str, int, float):
+        """
+        Returns the response text, its number of tokens, and how long to wait before returning it.
+        Raises the injected rate limit errors right away.
+        """
+        with self.lock:
+            self.sent[prompt] += 1
+            self.request_count += 1
+            rng = random.Random(f"{self.seed}:{self.sent[prompt]}:{prompt}")
+            failure = self._draw_failure(rng)
+            if failure:
+                self.failure_counts[failure] += 1
+            if failure == "rate_limit":
+                raise RateLimitError("Mock rate limit.")
+
+        items = SubtitleProcessor.TAG_PATTERN.findall(prompt)
+        compact = not items
+        if compact:
+            items = SubtitleProcessor.parse_compact(prompt)
+        if failure == "skip" and items:
+            del items[rng.randrange(len(items))]
+        elif failure == "merge" and len(items) > 1:
+            position = rng.randrange(len(items) - 1)
+            (id_, text), (_, next_text) = items[position], items[position + 1]
+            items[position:position + 2] = [(id_, f"{text} {next_text}")]
+
+        if failure == "refusal":
+            text = "I'm sorry, but I can't help with translating this content."
+        elif failure == "loop" and items:
+            line = self._render(items[:1], compact) + "\n"
+            text = line * math.ceil(self.max_tokens * CHARS_PER_TOKEN / len(line))
+        else:
+            text = self._render(items, compact)
+
+        num_tokens = min(self.num_tokens_from_string(text), self.max_tokens)
+        with self.lock:
+            self.total_input_tokens += self.num_tokens_from_string(instructions + prompt)
+            self.total_output_tokens += num_tokens
+
+        delay = self._draw_latency(rng)
+        if self.tokens_per_second:
+            delay += num_tokens / self.tokens_per_second
+        return text, num_tokens, delay
+
+    @staticmethod
+    def _render(items: list, compact: bool) -> str:
+        if compact:
+            return SubtitleProcessor.render_compact(*zip(*items)) if items else ""
+        return SubtitleProcessor.render(*zip(*items)) if items else ""
+
+    def _draw_failure(self, rng: random.Random) -> Optional[str]:
+        draw = rng.random()
+        for mode in FAILURE_MODES:
+            draw -= self.failure_rates.get(mode, 0)
+            if draw < 0:
+                return mode
+        return None
+
+    def _draw_latency(self, rng: random.Random) -> float:
+        if self.latency <= 0 or self.latency_distribution == "constant":
+            return max(self.latency, 0)
+        if self.latency_distribution == "uniform":
+            return rng.uniform(0, 2 * self.latency)
+        if self.latency_distribution == "exponential":
+            return rng.expovariate(1 / self.latency)
+        # Long tailed, with a median of half the mean
+        sigma = math.sqrt(2 * math.log(2))
+        return rng.lognormvariate(math.log(self.latency) - sigma ** 2 / 2, sigma)
+
+    @staticmethod
+    def _split_pieces(text: str) -> list[str]:
+        return [text[i:i + STREAM_PIECE_CHARS] for i in range(0, len(text), STREAM_PIECE_CHARS)] or [""]
+
+    def num_tokens_from_string(self, string: str) -> int:
+        return math.ceil(len(string) / CHARS_PER_TOKEN)
+
+    def max_output_tokens(self) -> int:
+        return self.max_tokens
+
+    def get_total_cost(self) -> float:
+        return (self.total_input_tokens / 1000) * self.price_input + \
+            (self.total_output_tokens / 1000) * self.price_output
+
+    def get_cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens / 1000) * self.price_input + (output_tokens / 1000) * self.price_output
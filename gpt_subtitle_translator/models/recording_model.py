@@ -0,0 +1,306 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Callable, Optional
+
+from gpt_subtitle_translator.models.base_model import BaseModel
+from gpt_subtitle_translator.request_scheduler import RateLimitError, TransientError
+from gpt_subtitle_translator.subtitle_translator import RefuseToTranslateError
+
+REPLAYED_ERRORS = {error.__name__: error for error in (RateLimitError, TransientError, RefuseToTranslateError)}
+REPLAY_PIECE_CHARS = 64
+CHARS_PER_TOKEN_ESTIMATE = 4  # For texts whose token count wasn't recorded, when replaying without a model
+
+
+class CassetteMissError(LookupError):
+    """Exception raised when replaying a request which is not in the cassette."""
+
+
+class RecordingModel(BaseModel):
+    """
+    Wraps a model to record its requests to a cassette file, or replay them from it without calling the provider.
+
+    The cassette stores, as JSON lines, the prompt and parameters of each request, along with its response text,
+    usage and latency, or the error it failed with. When replaying, requests are matched by their prompt and
+    parameters, and identical requests get the recorded responses in the order they were recorded,
+    the last one being repeated once they run out.
+    Responses are served after their recorded latency multiplied by `latency_scale`, 0 serves them right away.
+
+    The token counts of the texts the wrapped model counted, and its output limit, are recorded as well.
+    Replaying needs no model then, nor credentials or token counting requests: a translation replays exactly
+    with the same chunks from the recorded counts. Cassettes without counts are replayed with the wrapped model
+    counting tokens.
+    """
+
+    MODES = ("record", "replay")
+
+    def __init__(
+        self, model: Optional[BaseModel], path: str, mode: str = "record", latency_scale: float = 1.0,
+        model_name: Optional[str] = None
+    ):
+        assert mode in self.MODES, f"Unknown cassette mode {mode}."
+        assert model is not None or mode == "replay", "Recording needs a model."
+        super().__init__(model.model_name if model is not None else model_name)
+        self.model = model
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.lock = threading.Lock()
+        self.total_input_tokens = 0
+        self.total_output_tokens = 0
+        self.vocab_key = ""
+        self.token_counts = {}
+        self.max_tokens = None
+        if mode == "record":
+            self.file = open(path, "a", encoding="utf-8")
+            self.write({"max_output_tokens": model.max_output_tokens()})
+        else:
+            self.entries = self.load(path)
+            assert self.token_counts or model is not None, f"Cassette {path} has no token counts, it needs a model."
+
+    def load(self, path: str) -> dict:
+        """
+        Load the requests of a cassette, by key, along with the token counts and output limit recorded in it.
+        """
+        entries = defaultdict(deque)
+        if not os.path.exists(path):
+            return entries
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "tokens" in record:
+                    self.token_counts.update(record["tokens"])
+                elif "max_output_tokens" in record:
+                    self.max_tokens = record["max_output_tokens"]
+                else:
+                    entries[record["key"]].append(record)
+        return entries
+
+    @staticmethod
+    def make_key(prompt: str, temperature: float, instructions: str) -> str:
+        return hashlib.sha256(json.dumps([instructions, prompt, temperature]).encode("utf-8")).hexdigest()
+
+    def generate_completion(
+        self, prompt: str, temperature: float, instructions: str = "", timeout: Optional[float] = None
+    ) -> (str, int):
+        if self.mode == "replay":
+            record = self.next_record(prompt, temperature, instructions)
+            time.sleep(record["latency"] * self.latency_scale)
+            return self.replay(record)
+
+        start = time.perf_counter()
+        try:
+            text, num_tokens = self.model.generate_completion(prompt, temperature, instructions, timeout)
+        except Exception as e:
+            self.record(prompt, temperature, instructions, start, error=e)
+            raise
+        self.record(prompt, temperature, instructions, start, text, num_tokens)
+        return text, num_tokens
+
+    async def agenerate_completion(self, prompt: str, temperature: float, instructions: str = "") -> (str, int):
+        if self.mode == "replay":
+            record = self.next_record(prompt, temperature, instructions)
+            await asyncio.sleep(record["latency"] * self.latency_scale)
+            return self.replay(record)
+
+        start = time.perf_counter()
+        try:
+            text, num_tokens = await self.model.agenerate_completion(prompt, temperature, instructions)
+        except Exception as e:
+            self.record(prompt, temperature, instructions, start, error=e)
+            raise
+        self.record(prompt, temperature, instructions, start, text, num_tokens)
+        return text, num_tokens
+
+    def generate_completion_stream(
+        self, prompt: str, temperature: float, on_text: Callable[[str], None], instructions: str = ""
+    ) -> (str, int):
+        if self.mode == "record":
+            return self.generate_completion_stream_recorded(prompt, temperature, on_text, instructions)
+
+        record = self.next_record(prompt, temperature, instructions)
+        pieces = self.split_pieces(record.get("text") or "")
+        for piece in pieces:
+            time.sleep(record["latency"] * self.latency_scale / len(pieces))
+            on_text(piece)
+        return self.replay(record)
+
+    async def agenerate_completion_stream(
+        self, prompt: str, temperature: float, on_text: Callable[[str], None], instructions: str = ""
+    ) -> (str, int):
+        if self.mode == "record":
+            return await self.agenerate_completion_stream_recorded(prompt, temperature, on_text, instructions)
+
+        record = self.next_record(prompt, temperature, instructions)
+        pieces = self.split_pieces(record.get("text") or "")
+        for piece in pieces:
+            await asyncio.sleep(record["latency"] * self.latency_scale / len(pieces))
+            on_text(piece)
+        return self.replay(record)
+
+    def generate_completion_stream_recorded(
+        self, prompt: str, temperature: float, on_text: Callable[[str], None], instructions: str
+    ) -> (str, int):
+        """
+        Responses aborted by `on_text` are not recorded, only the ones the model completed, or failed with.
+        """
+        start = time.perf_counter()
+        aborted = []
+
+        def watch(text):
+            try:
+                on_text(text)
+            except Exception as e:
+                aborted.append(e)
+                raise
+
+        try:
+            text, num_tokens = self.model.generate_completion_stream(prompt, temperature, watch, instructions)
+        except Exception as e:
+            if not aborted:
+                self.record(prompt, temperature, instructions, start, error=e)
+            raise
+        self.record(prompt, temperature, instructions, start, text, num_tokens)
+        return text, num_tokens
+
+    async def agenerate_completion_stream_recorded(
+        self, prompt: str, temperature: float, on_text: Callable[[str], None], instructions: str
+    ) -> (str, int):
+        start = time.perf_counter()
+        aborted = []
+
+        def watch(text):
+            try:
+                on_text(text)
+            except Exception as e:
+                aborted.append(e)
+                raise
+
+        try:
+            text, num_tokens = await self.model.agenerate_completion_stream(prompt, temperature, watch, instructions)
+        except Exception as e:
+            if not aborted:
+                self.record(prompt, temperature, instructions, start, error=e)
+            raise
+        self.record(prompt, temperature, instructions, start, text, num_tokens)
+        return text, num_tokens
+
+    def record(self, prompt, temperature, instructions, start, text=None, num_tokens=0, error=None):
+        input_tokens = self.model.num_tokens_from_string(instructions + prompt) or 0
+        record = {
+            "key": self.make_key(prompt, temperature, instructions),
+            "model": self.model_name,
+            "prompt": prompt,
+            "temperature": temperature,
+            "instructions_key": hashlib.sha256(instructions.encode("utf-8")).hexdigest(),
+            "text": text,
+            "input_tokens": input_tokens,
+            "output_tokens": num_tokens,
+            "latency": time.perf_counter() - start,
+            "error": [type(error).__name__, str(error)] if error is not None else None,
+        }
+        with self.lock:
+            self.total_input_tokens += input_tokens
+            self.total_output_tokens += num_tokens
+        self.write(record)
+
+    def write(self, record: dict):
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.file.flush()
+
+    def next_record(self, prompt: str, temperature: float, instructions: str) -> dict:
+        key = self.make_key(prompt, temperature, instructions)
+        with self.lock:
+            records = self.entries.get(key)
+            if not records:
+                raise CassetteMissError(f"Request not found in cassette {self.path}. Prompt: {prompt[:200]}")
+            record = records.popleft() if len(records) > 1 else records[0]
+            self.total_input_tokens += record["input_tokens"]
+            self.total_output_tokens += record["output_tokens"]
+        return record
+
+    @staticmethod
+    def replay(record: dict) -> (str, int):
+        if record["error"]:
+            name, message = record["error"]
+            raise REPLAYED_ERRORS.get(name, Exception)(message)
+        return record["text"], record["output_tokens"]
+
+    @staticmethod
+    def split_pieces(text: str) -> list[str]:
+        return [text[i:i + REPLAY_PIECE_CHARS] for i in range(0, len(text), REPLAY_PIECE_CHARS)] or [""]
+
+    def close(self):
+        with self.lock:
+            if self.mode == "record" and not self.file.closed:
+                self.file.close()
+
+    @property
+    def replays_tokens(self) -> bool:
+        return self.mode == "replay" and (bool(self.token_counts) or self.model is None)
+
+    def token_key(self, text: str) -> str:
+        """
+        Key of a text's token count. Models counting tokens from a ratio measured on the whole file count
+        the same text differently in different files, so the key includes the file's text.
+        """
+        return hashlib.sha256(f"{self.vocab_key}\n{text}".encode("utf-8")).hexdigest()[:32]
+
+    def replay_tokens(self, text: str) -> int:
+        count = self.token_counts.get(self.token_key(text))
+        if count is not None:
+            return count
+        if self.model is not None:
+            return self.model.num_tokens_from_string(text)
+        return len(text) // CHARS_PER_TOKEN_ESTIMATE
+
+    def record_tokens(self, strings: list[str], counts: list[int]):
+        tokens = {self.token_key(string): count for string, count in zip(strings, counts)}
+        with self.lock:
+            tokens = {key: count for key, count in tokens.items() if self.token_counts.get(key) != count}
+            self.token_counts.update(tokens)
+        if tokens:
+            self.write({"tokens": tokens})
+
+    def num_tokens_from_string(self, string: str) -> int:
+        if self.replays_tokens:
+            return self.replay_tokens(string)
+        count = self.model.num_tokens_from_string(string)
+        if self.mode == "record":
+            self.record_tokens([string], [count])
+        return count
+
+    def num_tokens_from_strings(self, strings: list[str]) -> list[int]:
+        if self.replays_tokens:
+            return [self.replay_tokens(string) for string in strings]
+        counts = self.model.num_tokens_from_strings(strings)
+        if self.mode == "record":
+            self.record_tokens(strings, counts)
+        return counts
+
+    def init_vocab(self, text: str):
+        self.vocab_key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        if not self.replays_tokens:
+            self.model.init_vocab(text)
+
+    def max_output_tokens(self) -> int:
+        if self.mode == "replay" and self.max_tokens is not None:
+            return self.max_tokens
+        return self.model.max_output_tokens()
+
+    def get_total_cost(self) -> float:
+        """
+        Cost of the requests sent to the provider, nothing when replaying.
+        """
+        return self.model.get_total_cost() if self.mode == "record" else 0.0
+
+    def get_cost(self, input_tokens: int, output_tokens: int) -> float:
+        return self.model.get_cost(input_tokens, output_tokens) if self.mode == "record" else 0.0
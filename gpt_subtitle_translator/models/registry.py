@@ -0,0 +1,54 @@
+import importlib
+from importlib.metadata import entry_points
+from typing import Optional
+
+from gpt_subtitle_translator.models.base_model import BaseModel
+
+ENTRY_POINT_GROUP = "gpt_subtitle_translator.models"
+
+# Model name prefix, and the model class as "module:class", imported only when a model of the provider is created
+PROVIDERS = {
+    "mock": "gpt_subtitle_translator.models.mock_model:MockModel",
+    "gpt": "gpt_subtitle_translator.models.gpt:GPT",
+    "gemini": "gpt_subtitle_translator.models.gemini:Gemini",
+    "claude": "gpt_subtitle_translator.models.claude:Claude",
+    "anthropic.": "gpt_subtitle_translator.models.claude:Claude",
+}
+DEFAULT_PROVIDER = "claude"
+
+
+def register(prefix: str, target: str):
+    """
+    Register the model class of the model names starting with `prefix`, as "module:class".
+    """
+    PROVIDERS[prefix] = target
+
+
+def load_entry_points():
+    """
+    Register the providers of installed packages, declared as entry points of the `gpt_subtitle_translator.models`
+    group, named after their model name prefix.
+    """
+    for entry_point in entry_points(group=ENTRY_POINT_GROUP):
+        PROVIDERS.setdefault(entry_point.name, entry_point.value)
+
+
+def get_model_class(model_name: str) -> type:
+    """
+    Import the model class of the provider of a model, and only that provider's SDK.
+    The longest matching prefix wins, models matching none are Claude models.
+    """
+    if not any(model_name.startswith(prefix) for prefix in PROVIDERS):
+        load_entry_points()
+    matches = [prefix for prefix in PROVIDERS if model_name.startswith(prefix)]
+    target = PROVIDERS[max(matches, key=len)] if matches else PROVIDERS[DEFAULT_PROVIDER]
+    module_name, class_name = target.split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def get_model(model_name: str, params: Optional[dict] = None) -> BaseModel:
+    """
+    Create a model by name. `params` are passed to the provider's client, such as a `timeout` in seconds.
+    """
+    model_class = get_model_class(model_name)
+    return model_class(model_name, params) if params else model_class(model_name)
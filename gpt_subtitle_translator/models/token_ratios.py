@@ -0,0 +1,33 @@
+import hashlib
+from typing import Optional
+
+from gpt_subtitle_translator.constants import MAX_TOKEN_RATIOS
+from gpt_subtitle_translator.json_store import JsonStore
+
+
+class TokenRatioCache(JsonStore):
+    """
+    Tokens per character of the texts counted by models whose tokenizer is only available through an API call,
+    by model and hash of the text. When a path is given, the ratios are loaded from and saved to a JSON file,
+    so later runs on the same file skip the call. Only the latest `max_entries` ratios are kept.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = MAX_TOKEN_RATIOS):
+        super().__init__(path)
+        self.max_entries = max_entries
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\n{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[float]:
+        with self.lock:
+            return self.entries.get(key)
+
+    def put(self, key: str, ratio: float):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = ratio
+            for old_key in list(self.entries)[:-self.max_entries]:
+                del self.entries[old_key]
+        self.save()
@@ -0,0 +1,17 @@
+import functools
+import os
+
+import tiktoken
+
+from gpt_subtitle_translator.constants import TIKTOKEN_CACHE_DIR
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model_name: str) -> tiktoken.Encoding:
+    """
+    Load the tiktoken encoding of a model, once per process for all the models sharing it.
+    The BPE files are kept in the cache directory of the app, instead of the temporary directory tiktoken
+    downloads them to by default, so later runs load them from disk.
+    """
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", os.path.expanduser(TIKTOKEN_CACHE_DIR))
+    return tiktoken.encoding_for_model(model_name)
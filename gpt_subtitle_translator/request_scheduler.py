@@ -0,0 +1,216 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+from gpt_subtitle_translator.logger import logger
+
+WINDOW_SECONDS = 60
+
+
+class RateLimitError(Exception):
+    """Exception raised by models when the provider rejects a request with a rate limit error (HTTP 429)."""
+
+class TransientError(Exception):
+    """Exception raised by models on errors worth retrying, such as server errors (HTTP 5xx) or dropped connections."""
+
+class RequestCancelledError(Exception):
+    """Exception raised when a request is cancelled while waiting or running, after its job failed or timed out."""
+
+
+class RequestScheduler:
+    """
+    Schedules model requests under a concurrency limit, and optional requests and tokens per minute limits.
+
+    When adaptive, the concurrency limit starts low and grows by one slot per `limit` successful requests,
+    until the provider answers with a rate limit error, which halves it (additive increase, multiplicative decrease).
+    Rate limit and transient errors are retried after an exponential backoff with full jitter,
+    instead of failing the chunk.
+
+    Token usage is reserved up front from an estimate (input tokens, prompt included, plus the expected output tokens),
+    and corrected with the real usage once the request completes.
+
+    Requests waiting for a slot sleep until a request completes, or until the rate limits allow them.
+    Requests given a `cancel` event stop waiting for a slot or a backoff as soon as it's set and `wake` is called,
+    instead of being sent once the job they belong to is over.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        initial_concurrency: Optional[int] = None,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        adaptive: bool = True,
+        max_retries: int = 5,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0
+    ):
+        self.max_concurrency = max_concurrency
+        self.limit = float(initial_concurrency or (1 if adaptive else max_concurrency))
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.adaptive = adaptive
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.window = deque()
+        self.condition = threading.Condition()
+        self.async_waiters = set()
+        self.rate_limit_count = 0
+        self.retry_count = 0
+
+    @property
+    def concurrency(self) -> int:
+        return max(1, int(self.limit))
+
+    def try_acquire(self, num_tokens: int) -> (Optional[float], Optional[list]):
+        """
+        Take a slot for a request of `num_tokens` estimated tokens, if the limits allow it.
+        Returns the time to wait before trying again, None to wait until a request is released,
+        or the slot to pass to `release`.
+        """
+        with self.condition:
+            now = time.monotonic()
+            while self.window and self.window[0][0] <= now - WINDOW_SECONDS:
+                self.window.popleft()
+
+            if now < self.blocked_until:
+                return self.blocked_until - now, None
+            if self.in_flight >= self.concurrency:
+                return None, None
+            if self.requests_per_minute and len(self.window) >= self.requests_per_minute:
+                return self.window[0][0] + WINDOW_SECONDS - now, None
+            if self.tokens_per_minute and self.window:
+                used_tokens = sum(tokens for _, tokens in self.window)
+                if used_tokens + num_tokens > self.tokens_per_minute:
+                    return self.window[0][0] + WINDOW_SECONDS - now, None
+
+            slot = [now, num_tokens]
+            self.window.append(slot)
+            self.in_flight += 1
+            return 0, slot
+
+    def acquire(self, num_tokens: int, cancel: Optional[threading.Event] = None) -> list:
+        with self.condition:
+            while True:
+                if cancel is not None and cancel.is_set():
+                    raise RequestCancelledError("Request cancelled before being sent.")
+                wait, slot = self.try_acquire(num_tokens)
+                if slot is not None:
+                    return slot
+                self.condition.wait(wait)
+
+    @staticmethod
+    def sleep(delay: float, cancel: Optional[threading.Event] = None):
+        if cancel is None:
+            time.sleep(delay)
+        elif cancel.wait(delay):
+            raise RequestCancelledError("Request cancelled before being sent.")
+
+    async def acquire_async(self, num_tokens: int) -> list:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.condition:
+                wait, slot = self.try_acquire(num_tokens)
+                if slot is not None:
+                    return slot
+                waiter = (loop, loop.create_future())
+                self.async_waiters.add(waiter)
+            try:
+                await asyncio.wait([waiter[1]], timeout=wait)
+            finally:
+                with self.condition:
+                    self.async_waiters.discard(waiter)
+
+    def wake(self):
+        """
+        Wake up the requests waiting for a slot, to take one or to notice they were cancelled.
+        """
+        with self.condition:
+            self.condition.notify_all()
+            for loop, future in self.async_waiters:
+                loop.call_soon_threadsafe(self.resolve, future)
+
+    @staticmethod
+    def resolve(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+    def release(self, slot: list, num_tokens: Optional[int] = None, rate_limited: bool = False):
+        with self.condition:
+            self.in_flight -= 1
+            if num_tokens is not None:
+                slot[1] = num_tokens
+            if self.adaptive:
+                if rate_limited:
+                    self.limit = max(1.0, self.limit / 2)
+                else:
+                    self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self.wake()
+
+    def backoff(self, retry: int, rate_limited: bool) -> float:
+        delay = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** retry))
+        with self.condition:
+            self.retry_count += 1
+            if rate_limited:
+                self.rate_limit_count += 1
+                self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        return delay
+
+    def run(
+        self, call: Callable[[], tuple[str, int]], input_tokens: int, cancel: Optional[threading.Event] = None,
+        output_tokens: Optional[int] = None
+    ) -> (str, int):
+        """
+        Run a `generate_completion` call under the scheduler's limits, retrying rate limit and transient errors.
+        `input_tokens` counts the whole prompt, `output_tokens` the expected output, as many as the input by default.
+        """
+        retry = 0
+        while True:
+            slot = self.acquire(input_tokens + (input_tokens if output_tokens is None else output_tokens), cancel)
+            try:
+                result = call()
+            except (RateLimitError, TransientError) as e:
+                rate_limited = isinstance(e, RateLimitError)
+                self.release(slot, rate_limited=rate_limited)
+                if retry >= self.max_retries:
+                    raise e
+                delay = self.backoff(retry, rate_limited)
+                logger.info(f"Request failed with {type(e).__name__}, retrying in {delay:.1f}s: {e}")
+                self.sleep(delay, cancel)
+                retry += 1
+                continue
+            except BaseException:
+                self.release(slot)
+                raise
+            self.release(slot, input_tokens + result[1])
+            return result
+
+    async def run_async(
+        self, call: Callable[[], Awaitable[tuple[str, int]]], input_tokens: int, output_tokens: Optional[int] = None
+    ) -> (str, int):
+        retry = 0
+        while True:
+            slot = await self.acquire_async(input_tokens + (input_tokens if output_tokens is None else output_tokens))
+            try:
+                result = await call()
+            except (RateLimitError, TransientError) as e:
+                rate_limited = isinstance(e, RateLimitError)
+                self.release(slot, rate_limited=rate_limited)
+                if retry >= self.max_retries:
+                    raise e
+                delay = self.backoff(retry, rate_limited)
+                logger.info(f"Request failed with {type(e).__name__}, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                retry += 1
+                continue
+            except BaseException:
+                self.release(slot)
+                raise
+            self.release(slot, input_tokens + result[1])
+            return result
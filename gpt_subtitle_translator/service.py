@@ -0,0 +1,321 @@
+import json
+import os
+import queue
+import socketserver
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from gpt_subtitle_translator.constants import DEFAULT_MODEL, TOKENS_PER_CHUNK, DEFAULT_TEMPERATURE, SERVICE_WORKERS, \
+    SERVICE_JOB_HISTORY
+from gpt_subtitle_translator.logger import logger
+from gpt_subtitle_translator.models.base_model import BaseModel
+from gpt_subtitle_translator.models.registry import get_model
+from gpt_subtitle_translator.request_scheduler import RequestScheduler
+from gpt_subtitle_translator.subtitle_translator import SubtitleTranslator
+from gpt_subtitle_translator.telemetry import Telemetry
+from gpt_subtitle_translator.translation_cache import TranslationCache
+from gpt_subtitle_translator.translation_memory import TranslationMemory
+from gpt_subtitle_translator.usage import UsageLedger
+
+
+class ServiceJob:
+    """
+    A translation submitted to the service, and its status: queued, running, done, failed, or cancelled when the
+    service stopped before running it.
+    """
+
+    def __init__(self, srt_data: str, lang: str, model_name: str, name: str, options: dict):
+        self.id = uuid.uuid4().hex
+        self.srt_data = srt_data
+        self.lang = lang
+        self.model_name = model_name
+        self.name = name
+        self.options = options
+        self.status = "queued"
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.usage = None
+        self.done = threading.Event()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "language": self.lang,
+            "model": self.model_name,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "usage": self.usage.to_dict() if self.usage is not None else None,
+        }
+
+
+class TranslationService:
+    """
+    Translates SRT files submitted as jobs, on workers kept running between jobs.
+
+    Models are created once per model name and reused by all jobs, so their clients keep their pooled
+    connections, and the SDKs are imported once. Requests of all jobs go through a single request scheduler,
+    which bounds the concurrency and request rates of the service as a whole. The cache, translation memory,
+    telemetry and usage ledger are shared between jobs as well, the ledger's budget capping the spending of all jobs.
+    """
+
+    def __init__(
+        self,
+        default_model: str = DEFAULT_MODEL,
+        workers: int = SERVICE_WORKERS,
+        scheduler: Optional[RequestScheduler] = None,
+        cache: Optional[TranslationCache] = None,
+        memory: Optional[TranslationMemory] = None,
+        telemetry: Optional[Telemetry] = None,
+        ledger: Optional[UsageLedger] = None,
+        model_factory: Callable[[str], BaseModel] = get_model,
+        translator_options: Optional[dict] = None,
+        job_history: int = SERVICE_JOB_HISTORY
+    ):
+        self.default_model = default_model
+        self.workers = workers
+        self.scheduler = scheduler or RequestScheduler(1, adaptive=False)
+        self.cache = cache
+        self.memory = memory or TranslationMemory()
+        self.telemetry = telemetry or Telemetry()
+        self.ledger = ledger or UsageLedger()
+        self.model_factory = model_factory
+        self.translator_options = translator_options or {}
+        self.job_history = job_history
+        self.lock = threading.Lock()
+        self.models = {}
+        self.jobs = OrderedDict()
+        self.queue = queue.Queue()
+        self.threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.work, name=f"service-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """
+        Stop the workers once the jobs they are running are done. Queued jobs are cancelled, without being run.
+        """
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                self.cancel(job)
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def cancel(self, job: ServiceJob):
+        job.status = "cancelled"
+        job.error = "The service stopped before running the job."
+        job.srt_data = None
+        job.finished_at = time.time()
+        job.done.set()
+        logger.info(f"Job {job.id} {job.name} [{job.lang}] cancelled.")
+
+    def get_model(self, model_name: str) -> BaseModel:
+        with self.lock:
+            if model_name not in self.models:
+                self.models[model_name] = self.model_factory(model_name)
+            return self.models[model_name]
+
+    def submit(
+        self, srt_data: str, lang: str = "English", model_name: Optional[str] = None, name: Optional[str] = None,
+        **options
+    ) -> ServiceJob:
+        """
+        Queue a translation. `options` override the translator options of the service for this job.
+        """
+        job = ServiceJob(srt_data, lang, model_name or self.default_model, name or "", options)
+        with self.lock:
+            self.jobs[job.id] = job
+        self.queue.put(job)
+        logger.info(f"Queued job {job.id} {job.name} [{job.lang}], {self.queue.qsize()} jobs waiting.")
+        return job
+
+    def get(self, job_id: str) -> Optional[ServiceJob]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self) -> list[ServiceJob]:
+        with self.lock:
+            return list(self.jobs.values())
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[ServiceJob]:
+        """
+        Wait until a job is done or failed, and return it. Returns the job unfinished after `timeout` seconds.
+        """
+        job = self.get(job_id)
+        if job is not None:
+            job.done.wait(timeout)
+        return job
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            self.run(job)
+
+    def run(self, job: ServiceJob):
+        def update_progress(progress: float):
+            job.progress = progress
+
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            translator = self.make_translator(job)
+            job.usage = translator.usage
+            job.result = translator.translate_subtitles(job.srt_data, update_progress)
+            job.progress = 1.0
+            job.status = "done"
+            logger.info(f"Job {job.id} {job.name} [{job.lang}] done.")
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            logger.error(f"Job {job.id} {job.name} [{job.lang}] failed: {e}")
+        finally:
+            job.srt_data = None
+            job.finished_at = time.time()
+            job.done.set()
+            self.prune()
+
+    def make_translator(self, job: ServiceJob) -> SubtitleTranslator:
+        options = {
+            "tokens_per_chunk": TOKENS_PER_CHUNK,
+            "temperature": DEFAULT_TEMPERATURE,
+            **self.translator_options,
+            **job.options,
+        }
+        return SubtitleTranslator(
+            model=self.get_model(job.model_name),
+            lang=job.lang,
+            num_threads=self.scheduler.max_concurrency,
+            cache=self.cache,
+            memory=self.memory,
+            scheduler=self.scheduler,
+            telemetry=self.telemetry,
+            ledger=self.ledger,
+            job_id=job.id,
+            **options
+        )
+
+    def prune(self):
+        """
+        Forget the oldest finished jobs, past the `job_history` most recent ones.
+        """
+        with self.lock:
+            finished = [job_id for job_id, job in self.jobs.items() if job.done.is_set()]
+            for job_id in finished[:max(0, len(finished) - self.job_history)]:
+                job = self.jobs.pop(job_id)
+                if job.usage is not None:
+                    self.ledger.close_job(job.usage)
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of the service:
+    - POST /jobs, with the SRT file as "srt", and optionally "language", "model", "name", "chunk_size" and
+      "temperature", queues a job and returns it.
+    - GET /jobs lists the jobs, GET /jobs/<id> returns the status and progress of one.
+    - GET /jobs/<id>/result returns the translated SRT file once the job is done.
+    - GET /metrics returns the telemetry of all jobs, as Prometheus-style metrics.
+    """
+    # Request fields which override translator options
+    JOB_OPTIONS = {"chunk_size": "tokens_per_chunk", "temperature": "temperature"}
+
+    @property
+    def service(self) -> TranslationService:
+        return self.server.service
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if parts == ["jobs"]:
+            return self.send_json(200, {"jobs": [job.to_dict() for job in self.service.list()]})
+        if parts == ["metrics"]:
+            return self.send_text(200, self.service.telemetry.prometheus(), "text/plain; version=0.0.4")
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.service.get(parts[1])
+            if job is None:
+                return self.send_json(404, {"error": f"Unknown job {parts[1]}."})
+            if len(parts) == 2:
+                return self.send_json(200, job.to_dict())
+            if parts[2] == "result":
+                if job.status != "done":
+                    return self.send_json(409, {"error": f"Job is {job.status}.", **job.to_dict()})
+                return self.send_text(200, job.result, "application/x-subrip; charset=utf-8")
+        self.send_json(404, {"error": f"Unknown path {self.path}."})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            return self.send_json(404, {"error": f"Unknown path {self.path}."})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            srt_data = body["srt"]
+            options = {option: body[field] for field, option in self.JOB_OPTIONS.items() if field in body}
+        except (ValueError, KeyError, TypeError) as e:
+            return self.send_json(400, {"error": f"Invalid job, expected a JSON object with an \"srt\" field: {e}"})
+        job = self.service.submit(
+            srt_data, body.get("language", "English"), body.get("model"), body.get("name"), **options
+        )
+        self.send_json(202, job.to_dict())
+
+    def send_json(self, status: int, payload: dict):
+        self.send_text(status, json.dumps(payload), "application/json")
+
+    def send_text(self, status: int, text: str, content_type: str):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+        self.server_name, self.server_port = "localhost", 0
+
+
+def make_server(
+    service: TranslationService, host: str = "127.0.0.1", port: int = 0, socket_path: Optional[str] = None
+) -> socketserver.BaseServer:
+    """
+    Create the HTTP server of a service, listening on `socket_path` if given, on `host` and `port` otherwise.
+    """
+    if socket_path:
+        server = UnixHTTPServer(socket_path, ServiceRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), ServiceRequestHandler)
+    server.service = service
+    return server
@@ -7,18 +7,32 @@ import srt
 from gpt_subtitle_translator.models.base_model import BaseModel
 
 class Chunk(NamedTuple):
+    """
+    A block of subtitles translated in one request. The subtitles are stored as parallel arrays of ids and texts,
+    and `text` is their tagged rendering, as sent in the prompt with the default wire format.
+    """
     text: str
     num_tokens: int
     idx: int
+    ids: tuple = ()
+    texts: tuple = ()
 
 class InvalidSRTFile(Exception):
     pass
 
 class SubtitleProcessor:
     TAG_PATTERN = re.compile(r"^<(\d+)>(.*?)</\1>$", re.DOTALL | re.MULTILINE)
+    COMPACT_PATTERN = re.compile(r"^(\d+)\|(.*)$")
+    COMPACT_ID_ESTIMATE = 10  # Stands in for the local ids when counting tokens, most chunks have two-digit ids
 
-    def __init__(self, model: BaseModel):
+    def __init__(self, model: BaseModel, compact: bool = False):
+        """
+        With `compact`, subtitles are sent as `id|text` lines instead of `<id>text</id>` tags, with ids numbered
+        from 1 within each chunk. This cuts the markup of each subtitle to a couple of tokens, in the prompt
+        and the response.
+        """
         self.model = model
+        self.compact = compact
 
     @staticmethod
     def parse_srt(srt_content: str) -> dict:
@@ -31,91 +45,244 @@ class SubtitleProcessor:
             raise InvalidSRTFile("Invalid SRT file. Please check your input. " + str(e)[:1000])
         return subtitles
 
+    @staticmethod
+    def deduplicate(srt_data: dict, memory: dict) -> (dict, dict, dict):
+        """
+        Split subtitles into the ones that need translating, and the ones whose translation can be reused.
+
+        Returns the subtitles to translate, the translations found in `memory` by subtitle id,
+        and the ids of subtitles repeating an earlier subtitle in the file, mapped to the id of the first occurrence.
+        """
+        remaining = {}
+        translated = {}
+        duplicates = {}
+        first_ids = {}
+        for key, value in srt_data.items():
+            text = value["text"]
+            if text in memory:
+                translated[key] = memory[text]
+            elif text in first_ids:
+                duplicates[key] = first_ids[text]
+            else:
+                first_ids[text] = key
+                remaining[key] = value
+        return remaining, translated, duplicates
+
     def preprocess(self, srt_data):
-        return "\n".join(f"<{key}>{value['text']}</{key}>" for key, value in srt_data.items())
+        return self.render(list(srt_data), [value["text"] for value in srt_data.values()])
+
+    @staticmethod
+    def render(ids, texts) -> str:
+        return "\n".join(f"<{id_}>{text}</{id_}>" for id_, text in zip(ids, texts))
+
+    @staticmethod
+    def render_compact(ids, texts) -> str:
+        return "\n".join(f"{id_}|{text}" for id_, text in zip(ids, texts))
+
+    @classmethod
+    def parse_compact(cls, text) -> list[tuple[int, str]]:
+        """
+        Parse subtitles in the compact format. Each subtitle starts on an `id|` line, and runs until the next one,
+        for subtitles of several lines. Lines before the first subtitle, and from the END marker on, are ignored.
+        """
+        items = []
+        for line in text.splitlines():
+            match = cls.COMPACT_PATTERN.match(line)
+            if match:
+                items.append([int(match.group(1)), match.group(2)])
+            elif line.strip() == "END":
+                break
+            elif items:
+                items[-1][1] += "\n" + line
+        return [(id_, value.rstrip()) for id_, value in items]
+
+    def parse_wire(self, text) -> list[tuple[int, str]]:
+        if self.compact:
+            return self.parse_compact(text)
+        return [(int(id_), value) for id_, value in self.TAG_PATTERN.findall(text)]
+
+    @staticmethod
+    def local_ids(ids) -> (list[int], dict):
+        """
+        Number subtitles from 1 within a chunk. Returns the new ids, and a mapping of the new ids to the original ones.
+        """
+        new_ids = list(range(1, len(ids) + 1))
+        return new_ids, dict(zip(new_ids, ids))
+
+    def parse_tagged(self, text) -> (list[int], list[str]):
+        ids = []
+        texts = []
+        for id_, value in self.TAG_PATTERN.findall(text):
+            ids.append(int(id_))
+            texts.append(value)
+        return ids, texts
 
     def make_chunks(self, text: str, max_tokens_per_chunk: int) -> list[Chunk]:
-        items = self.split_on_tags(text)
+        return self.chunk_subtitles(*self.parse_tagged(text), max_tokens_per_chunk)
+
+    def counted_items(self, ids, texts) -> list[str]:
+        """
+        The subtitles as their tokens are counted when chunking. The vocabulary of the model is initialized on them.
+        """
+        if self.compact:
+            return [f"{self.COMPACT_ID_ESTIMATE}|{text}" for text in texts]
+        return [f"<{id_}>{text}</{id_}>" for id_, text in zip(ids, texts)]
+
+    def chunk_subtitles(
+        self, ids: list[int], texts: list[str], max_tokens_per_chunk: int, start_idx: int = 0
+    ) -> list[Chunk]:
+        items = [f"<{id_}>{text}</{id_}>" for id_, text in zip(ids, texts)]
+        counted = self.counted_items(ids, texts)
         chunks = []
-        current_piece = ""
+        start = 0
         current_token_count = 0
 
-        self.model.init_vocab(text)
+        self.model.init_vocab("\n".join(counted))
+        token_counts = self.model.num_tokens_from_strings(counted)
+
+        def make_chunk(end):
+            return Chunk(
+                text="\n".join(items[start:end]), num_tokens=current_token_count, idx=start_idx + len(chunks),
+                ids=tuple(ids[start:end]), texts=tuple(texts[start:end])
+            )
 
-        for text in items:
-            text_token_count = self.model.num_tokens_from_string(text)
-            candidate_length = current_token_count + text_token_count + 1
-            if candidate_length <= max_tokens_per_chunk:
-                current_piece += ("\n" + text)
+        for position, item_token_count in enumerate(token_counts):
+            candidate_length = current_token_count + item_token_count + 1
+            if candidate_length <= max_tokens_per_chunk or position == start:
                 current_token_count = candidate_length
             else:
-                chunks.append(
-                    Chunk(text=current_piece, num_tokens=current_token_count, idx=len(chunks))
-                )
-                current_piece = text
-                current_token_count = text_token_count
+                chunks.append(make_chunk(position))
+                start = position
+                current_token_count = item_token_count
 
-        chunks.append(Chunk(text=current_piece, num_tokens=current_token_count, idx=len(chunks)))
+        chunks.append(make_chunk(len(items)))
         return chunks
 
+    def make_chunk(self, ids, texts, idx: int) -> Chunk:
+        text = self.render(ids, texts)
+        sent = self.render_compact(self.local_ids(ids)[0], texts) if self.compact else text
+        return Chunk(
+            text=text, num_tokens=self.model.num_tokens_from_string(sent), idx=idx, ids=tuple(ids), texts=tuple(texts)
+        )
+
+    def split_chunk(self, chunk: Chunk) -> list[Chunk]:
+        """
+        Split a chunk in two halves, keeping its index.
+        """
+        middle = len(chunk.ids) // 2
+        return [
+            self.make_chunk(chunk.ids[:middle], chunk.texts[:middle], chunk.idx),
+            self.make_chunk(chunk.ids[middle:], chunk.texts[middle:], chunk.idx),
+        ]
+
     def split_on_tags(self, text):
         return [match.group(0) for match in self.TAG_PATTERN.finditer(text)]
 
-    def randomize_ids(self, subtitles):
+    @staticmethod
+    def random_ids(ids, rng: random.Random = random) -> (list[int], dict):
         """
         Randomize subtitle IDs to avoid skipping/merging subtitles.
 
         Valid subtitles have consecutive numeric IDs, which seems to make GPT more likely to skip/merge neighboring subtitles.
         By assigning new IDs randomly, while preserving the order, we can help GPT avoid this behavior.
+        Returns the new ids, and a mapping of the new ids to the original ones.
+        """
+        new_ids = rng.sample(range(1, len(ids) * 10), len(ids))
+        return new_ids, dict(zip(new_ids, ids))
+
+    def randomize_ids(self, subtitles):
+        ids, texts = self.parse_tagged(subtitles)
+        new_ids, mapping = self.random_ids(ids)
+        return self.render(new_ids, texts), mapping
+
+    def revert_id_randomization(self, response, id_mapping):
+        translated = self.parse_response(response, id_mapping)
+        return self.render(translated, translated.values())
+
+    def render_chunk(self, chunk: Chunk, randomize_ids: bool, shuffle: bool, seed: int = 0) -> (str, dict):
+        """
+        Render the subtitles of a chunk for a request, with randomized ids and order if asked to.
+        The randomization is seeded by the chunk's ids and `seed`, so the same request renders the same way
+        in every run, and can be replayed.
+        Returns the text, and the mapping of the ids in it to the original ones.
+        """
+        rng = random.Random(f"{seed}:{','.join(map(str, chunk.ids))}")
+        if randomize_ids:
+            ids, mapping = self.random_ids(chunk.ids, rng)
+        elif self.compact:
+            ids, mapping = self.local_ids(chunk.ids)
+        else:
+            ids, mapping = chunk.ids, {}
+        if not self.compact and not randomize_ids and not shuffle:
+            return chunk.text, mapping
+        order = list(range(len(ids)))
+        if shuffle:
+            rng.shuffle(order)
+        render = self.render_compact if self.compact else self.render
+        return render([ids[i] for i in order], [chunk.texts[i] for i in order]), mapping
+
+    def parse_response(self, response, id_mapping) -> dict[int, str]:
         """
-        items = self.TAG_PATTERN.findall(subtitles)
-        tag_count = len(items)
-        new_ids = random.sample(range(1, tag_count * 10), tag_count)
-        mapping = {}
-        updated = []
-        for index, (original_id, text) in enumerate(items):
-            new_id = new_ids[index]
-            mapping[original_id] = new_id
-            updated.append(f"<{new_id}>{text}</{new_id}>")
-
-        return "\n".join(updated), {v: k for k, v in mapping.items()}
-
-    def shuffle_order(self, subtitles):
-        items = self.TAG_PATTERN.findall(subtitles)
-        random.shuffle(items)
-        return "\n".join([f"<{id_}>{text}</{id_}>" for id_, text in items])
-
-    def extract_subtitles(self, response, id_mapping):
-        def replace_with_original(match):
-            sub_id = int(match.group(1))
-            original_id = id_mapping.get(sub_id, sub_id)
-            return f"<{original_id}>{match.group(2)}</{original_id}>" if original_id else None
-
-        tagged_texts = re.finditer(self.TAG_PATTERN, response)
-        reverted = [replace_with_original(match) for match in tagged_texts]
-        reverted = [x for x in reverted if x is not None]
-        reverted.sort(key=lambda x: int(self.TAG_PATTERN.match(x).group(1)))
-        return "\n".join(reverted)
-
-    def post_process_text(self, text, original_subtitles):
-        text = self.insert_timestamps(original_subtitles, text)
+        Parse the translated subtitles of a response, by original id, in order.
+        Compact ids only exist within the chunk, so the ones missing from the mapping are dropped.
+        """
+        translated = {}
+        for id_, text in self.parse_wire(response):
+            original_id = id_mapping.get(id_) if self.compact else id_mapping.get(id_, id_)
+            if original_id:
+                translated[original_id] = text
+        return dict(sorted(translated.items()))
+
+    def get_translations(self, text) -> dict:
+        return {int(id_): value for id_, value in self.TAG_PATTERN.findall(text)}
+
+    def render_srt(self, original_subtitles, translated, duplicates=None) -> str:
+        """
+        Render the translations to an SRT file, with the timestamps of the original subtitles.
+        Subtitles in `duplicates` get the translation of the subtitle they repeat.
+        """
+        entries = dict(translated)
+        for key, first_id in (duplicates or {}).items():
+            if first_id in entries:
+                entries[key] = entries[first_id]
+        text = "\n\n".join(
+            f'{key}\n{original_subtitles[key]["timestamp"]}\n{entries[key]}' for key in sorted(entries)
+        )
         text = re.sub(r'\n{3,}', "\n\n", text)
         text = text.strip()
         return self.clean_text(text)
 
+    def post_process_text(self, text, original_subtitles, translated=None, duplicates=None):
+        entries = self.get_translations(text)
+        entries.update(translated or {})
+        return self.render_srt(original_subtitles, entries, duplicates)
+
     @staticmethod
     def clean_text(text: str) -> str:
         output_string = re.sub(r'[<>]\s*$', "", text, flags=re.MULTILINE)  # breaks subtitle parsing on Plex
         return output_string
 
     @staticmethod
-    def insert_timestamps(parsed_subtitles, content):
-        def replacement(match):
-            subtitle_id = int(match.group(1))
-            return f'\n{subtitle_id}\n{parsed_subtitles[subtitle_id]["timestamp"]}\n{match.group(2)}'
-        return re.sub(r'^<(\d+)>(.*?)</\1>$', replacement, content, flags=re.DOTALL | re.MULTILINE)
-
-    def get_missing_subtitles(self, translated, original_text):
-        translated_ids = set(re.findall(r'^<(\d+)>', translated.strip(), flags=re.MULTILINE))
-        original_entries = {id_: text for id_, text in self.TAG_PATTERN.findall(original_text.strip())}
-        return {key: value for key, value in original_entries.items() if key not in translated_ids}
+    def make_repair_subtitles(chunk: Chunk, missing_ids, context_size) -> (list[int], list[str]):
+        """
+        Select the subtitles for a follow-up request containing only the missing subtitles.
+
+        Each missing subtitle is sent along with `context_size` neighbours on either side, so the model
+        has some surrounding dialogue to translate from. Original order is preserved.
+        """
+        selected = set()
+        for position, id_ in enumerate(chunk.ids):
+            if id_ in missing_ids:
+                selected.update(range(max(0, position - context_size), position + context_size + 1))
+        positions = sorted(position for position in selected if position < len(chunk.ids))
+        return [chunk.ids[i] for i in positions], [chunk.texts[i] for i in positions]
+
+    @staticmethod
+    def merge_translations(translated: dict, repaired: dict, missing_ids) -> dict:
+        entries = dict(translated)
+        entries.update((key, value) for key, value in repaired.items() if key in missing_ids)
+        return dict(sorted(entries.items()))
+
+    @staticmethod
+    def get_missing_subtitles(translated: dict, chunk: Chunk) -> dict:
+        return {id_: text for id_, text in zip(chunk.ids, chunk.texts) if id_ not in translated}
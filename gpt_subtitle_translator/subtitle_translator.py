@@ -1,15 +1,98 @@
+import asyncio
+import copy
 import os
 import threading
+import time
 import traceback
+import uuid
 import zlib
 from concurrent.futures import ThreadPoolExecutor
 import concurrent
-from typing import Callable, Optional
+from typing import Callable, NamedTuple, Optional, TextIO
 
-from gpt_subtitle_translator.constants import COMPRESSION_RATIO_THRESHOLD
+from gpt_subtitle_translator.chunk_sizer import ChunkSizer
+from gpt_subtitle_translator.fanout import LanguageFanout
+from gpt_subtitle_translator.hedging import HedgePolicy
+from gpt_subtitle_translator.constants import COMPRESSION_RATIO_THRESHOLD, REPAIR_CONTEXT_SIZE, MAX_REPAIR_RATIO, \
+    STREAM_CHECK_CHARS, STREAM_WINDOW_CHARS, STREAM_COMPRESSION_RATIO_THRESHOLD, MAX_OUTPUT_RATIO, \
+    BATCH_POLL_INTERVAL, STOP_GRACE_PERIOD
+from gpt_subtitle_translator.job_journal import JobJournal
 from gpt_subtitle_translator.models.base_model import BaseModel
 from gpt_subtitle_translator.logger import logger
+from gpt_subtitle_translator.request_scheduler import RequestScheduler, RequestCancelledError
 from gpt_subtitle_translator.subtitle_processor import SubtitleProcessor, Chunk
+from gpt_subtitle_translator.subtitle_writer import SubtitleWriter
+from gpt_subtitle_translator.telemetry import Telemetry, RequestTrace
+from gpt_subtitle_translator.translation_cache import TranslationCache
+from gpt_subtitle_translator.translation_memory import TranslationMemory
+from gpt_subtitle_translator.usage import UsageLedger, Budget, BudgetExceededError
+
+
+class PreparedSubtitles(NamedTuple):
+    parsed_srt: dict
+    remaining: dict
+    translated: dict
+    duplicates: dict
+    chunks: list[Chunk]
+
+
+class StopFlag(threading.Event):
+    """
+    Set when a job stops, after a chunk failed or its deadline passed. Requests sent without streaming can't be
+    aborted once sent, so they're given the time left until the deadline as their timeout, and are abandoned
+    shortly after the job stops.
+    """
+
+    def __init__(self, deadline_at: Optional[float] = None):
+        super().__init__()
+        self.deadline_at = deadline_at
+        self.waiters_lock = threading.Lock()
+        self.waiters = set()
+
+    def set(self):
+        with self.waiters_lock:
+            super().set()
+            for waiter in self.waiters:
+                waiter.set()
+
+    def time_left(self) -> Optional[float]:
+        return max(0.0, self.deadline_at - time.monotonic()) if self.deadline_at is not None else None
+
+    def run(self, call: Callable[[], tuple[str, int]]) -> (str, int):
+        """
+        Run a blocking request on a daemon thread, until it answers or `STOP_GRACE_PERIOD` seconds after the flag
+        is set. The request is then abandoned, it keeps running until it answers or the interpreter exits,
+        but no longer holds up the job's error or the exit.
+        """
+        result = []
+        finished = threading.Event()
+        wake = threading.Event()
+
+        def run():
+            try:
+                result.append((call(), None))
+            except BaseException as e:
+                result.append((None, e))
+            finally:
+                finished.set()
+                wake.set()
+
+        with self.waiters_lock:
+            self.waiters.add(wake)
+            if self.is_set():
+                wake.set()
+        try:
+            threading.Thread(target=run, daemon=True).start()
+            wake.wait()
+            if not finished.wait(STOP_GRACE_PERIOD):
+                raise RequestCancelledError("Request abandoned, the translation was stopped.")
+        finally:
+            with self.waiters_lock:
+                self.waiters.discard(wake)
+        response, error = result[0]
+        if error is not None:
+            raise error
+        return response
 
 
 class SubtitleTranslator:
@@ -21,7 +104,23 @@ class SubtitleTranslator:
         tokens_per_chunk: int = 500,
         max_retries: int = 1,
         retry_on_refusal: bool = False,
-        temperature: float = 0.5
+        temperature: float = 0.5,
+        partial_repair: bool = True,
+        cache: Optional[TranslationCache] = None,
+        memory: Optional[TranslationMemory] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        stream: bool = False,
+        journal: Optional[JobJournal] = None,
+        telemetry: Optional[Telemetry] = None,
+        sizer: Optional[ChunkSizer] = None,
+        hedging: Optional[HedgePolicy] = None,
+        largest_first: bool = False,
+        compact_ids: bool = False,
+        deadline: Optional[float] = None,
+        fallback_models: Optional[list[BaseModel]] = None,
+        ledger: Optional[UsageLedger] = None,
+        budget: Optional[Budget] = None,
+        job_id: Optional[str] = None
     ):
         self.model = model
         self.lang = lang
@@ -30,106 +129,934 @@ class SubtitleTranslator:
         self.tokens_per_chunk = tokens_per_chunk
         self.max_retries = max_retries
         self.retry_on_refusal = retry_on_refusal
-        self.processor = SubtitleProcessor(model)
-        self.prompt_template = self.load_prompt()
+        self.partial_repair = partial_repair
+        self.cache = cache
+        self.memory = memory or TranslationMemory()
+        self.scheduler = scheduler or RequestScheduler(num_threads, adaptive=False)
+        self.stream = stream
+        self.journal = journal
+        self.telemetry = telemetry or Telemetry()
+        self.sizer = sizer
+        self.hedging = hedging
+        self.largest_first = largest_first
+        self.deadline = deadline
+        self.processor = SubtitleProcessor(model, compact_ids)
+        self.prompt_template = self.load_prompt(compact_ids)
+        self.instructions, self.prompt_suffix = self.split_prompt(self.prompt_template, lang)
+        self.usage = ledger.open_job(job_id or uuid.uuid4().hex, lang, budget) if ledger is not None else None
+        self.prompt_tokens = {}
+        self.submitted_at = {}
+        self.fallbacks = [self.with_model(fallback_model) for fallback_model in fallback_models or []]
+
+    def with_model(self, model: BaseModel) -> "SubtitleTranslator":
+        """
+        A copy of the translator sending its requests to another model, sharing its scheduler, cache and telemetry.
+        """
+        translator = copy.copy(self)
+        translator.model = model
+        translator.processor = SubtitleProcessor(model, self.processor.compact)
+        translator.hedging = None
+        translator.fallbacks = []
+        return translator
 
     @staticmethod
-    def load_prompt():
+    def load_prompt(compact_ids: bool = False):
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        prompt_file = os.path.join(script_dir, '.', 'prompt.txt')
+        prompt_file = os.path.join(script_dir, '.', 'prompt_compact.txt' if compact_ids else 'prompt.txt')
         with open(prompt_file, encoding="utf-8") as f:
             prompt = f.read()
         return prompt
 
-    def translate_subtitles(self, srt_data: str, progress_callback: Optional[Callable[[float], None]] = None) -> str:
-        parsed_srt = self.processor.parse_srt(srt_data)
-        preprocessed_text = self.processor.preprocess(parsed_srt)
-        chunks = self.processor.make_chunks(preprocessed_text, self.tokens_per_chunk)
+    @staticmethod
+    def split_prompt(prompt_template: str, lang: str) -> (str, str):
+        """
+        Split the prompt around the subtitles. The instructions before them are the same for every chunk,
+        so they're sent as a prefix the provider can cache.
+        """
+        instructions, suffix = prompt_template.split("{subtitles}", 1)
+        return instructions.replace("{target_language}", lang), suffix.replace("{target_language}", lang)
+
+    def prepare(self, srt_data: str, fanout: Optional[LanguageFanout] = None) -> "PreparedSubtitles":
+        """
+        Parse and chunk the subtitles left to translate. With a fanout, the parsing and chunking are shared with the
+        other languages of the file.
+        """
+        parsed_srt = fanout.parse(self.processor) if fanout is not None else self.processor.parse_srt(srt_data)
+        remaining, translated, duplicates = self.processor.deduplicate(parsed_srt, self.memory.lookup(self.lang))
+        if translated or duplicates:
+            logger.info(f"Reusing translations for {len(translated) + len(duplicates)} repeated subtitles.")
+        restored = self.restore(remaining)
+        if restored:
+            translated = {**translated, **restored}
+            remaining = {key: value for key, value in remaining.items() if key not in restored}
+
+        def make_chunks() -> list[Chunk]:
+            return self.processor.chunk_subtitles(
+                list(remaining), [value["text"] for value in remaining.values()], chunk_size
+            ) if remaining else []
+
+        if remaining:
+            self.init_vocab(list(remaining), [value["text"] for value in remaining.values()])
+
+        chunk_size = self.get_chunk_size()
+        if fanout is not None:
+            key = (self.model.model_name, tuple(remaining), chunk_size, self.processor.compact)
+            chunks = fanout.chunk(self, key, make_chunks)
+        else:
+            chunks = make_chunks()
         logger.info(f"Split into {len(chunks)} chunks.")
-        translations = [""] * len(chunks)
+        return PreparedSubtitles(parsed_srt, remaining, translated, duplicates, chunks)
+
+    def init_vocab(self, ids: list[int], texts: list[str]):
+        """
+        Initialize the vocabulary of the fallback and hedge models on the same text as the model's, since they count
+        the tokens of the chunks they're sent too.
+        """
+        models = [fallback.model for fallback in self.fallbacks]
+        if self.hedging is not None and self.hedging.model is not None:
+            models.append(self.hedging.model)
+        models = [model for model in models if model is not self.model]
+        if models:
+            text = "\n".join(self.processor.counted_items(ids, texts))
+            for model in models:
+                model.init_vocab(text)
+
+    def get_chunk_size(self) -> int:
+        """
+        The chunk size learned by the sizer for the model and language, or the configured one if there's none yet.
+        """
+        if self.sizer is None:
+            return self.tokens_per_chunk
+        size = self.sizer.chunk_size(self.model.model_name, self.lang, self.model.max_output_tokens())
+        return size or self.tokens_per_chunk
+
+    def should_probe(self, chunks: list[Chunk], pending: list[Chunk]) -> bool:
+        """
+        Without a learned chunk size, the first chunk is translated on its own, and the rest are resized from
+        its output/input ratio before being sent.
+        """
+        return (
+            self.sizer is not None and len(pending) > 1 and len(pending) == len(chunks) and
+            self.sizer.ratio(self.model.model_name, self.lang) is None
+        )
+
+    def resize_chunks(
+        self, prepared: "PreparedSubtitles", translations: list[dict], writer: Optional[SubtitleWriter] = None
+    ) -> ("PreparedSubtitles", list[dict], list[Chunk]):
+        """
+        Re-chunk the subtitles after the first chunk with the learned chunk size.
+        Returns the updated subtitles and translations, and the chunks left to translate.
+        """
+        first, remaining = prepared.chunks[0], prepared.chunks[1:]
+        size = self.get_chunk_size()
+        chunks = self.processor.chunk_subtitles(
+            [id_ for chunk in remaining for id_ in chunk.ids], [text for chunk in remaining for text in chunk.texts],
+            size, start_idx=1
+        )
+        logger.info(f"Resized remaining chunks to {size} tokens, split into {len(chunks)} chunks.")
+        prepared = prepared._replace(chunks=[first] + chunks)
+        if writer is not None:
+            writer.prepared = prepared
+        return prepared, translations[:1] + [{}] * len(chunks), chunks
+
+    def schedule(self, chunks: list[Chunk]) -> list[Chunk]:
+        """
+        Order in which chunks are sent. Largest first, the bigger a chunk the longer it takes and the likelier it
+        needs retries, so the small ones fill in the gaps at the end instead of trailing after the big ones.
+        """
+        if not self.largest_first:
+            return chunks
+        return sorted(chunks, key=lambda chunk: chunk.num_tokens, reverse=True)
+
+    def assemble(
+        self, prepared: "PreparedSubtitles", translations: list[dict], writer: Optional[SubtitleWriter] = None
+    ) -> Optional[str]:
+        """
+        Save the new translations to the translation memory, release the chunks the job had left from the budget of
+        all jobs, and render the output file.
+        When it was written incrementally, only the subtitles after the last chunk are left to write.
+        """
+        if writer is not None:
+            writer.close()
+        if self.usage is not None:
+            self.usage.finish()
+        entries = {}
+        for translation in translations:
+            entries.update(translation)
+        self.memory.update(self.lang, {
+            prepared.remaining[key]["text"]: value for key, value in entries.items() if key in prepared.remaining
+        })
+        if writer is not None:
+            return None
+        entries.update(prepared.translated)
+        return self.processor.render_srt(prepared.parsed_srt, entries, prepared.duplicates)
+
+    def restore(self, remaining: dict) -> dict:
+        """
+        The translations of subtitles completed by an earlier run of the job, by id, whatever chunks they were
+        translated in. They're reused like the translations of the translation memory.
+        """
+        if self.journal is None or not remaining:
+            return {}
+        restored = self.journal.lookup(list(remaining), [value["text"] for value in remaining.values()])
+        if restored:
+            logger.info(f"Resuming job, {len(restored)} of {len(remaining)} subtitles already translated.")
+            self.memory.update(self.lang, {remaining[key]["text"]: value for key, value in restored.items()})
+        return restored
+
+    def complete_chunk(
+        self, chunk: Chunk, response: dict, translations: list[dict], writer: Optional[SubtitleWriter] = None
+    ):
+        translations[chunk.idx] = response
+        if writer is not None:
+            writer.add(chunk.idx, response)
+        if self.journal is not None and response:
+            self.journal.record(chunk.ids, chunk.texts, response)
+
+    def translate_subtitles(
+        self,
+        srt_data: str,
+        progress_callback: Optional[Callable[[float], None]] = None,
+        output: Optional[TextIO] = None
+    ) -> Optional[str]:
+        """
+        Translate an SRT file, and return the translated file. When `output` is given, the translation is
+        written to it incrementally instead, in order, as soon as each chunk and all the ones before it are done.
+
+        When a chunk fails, or the deadline passes, requests waiting to be sent are cancelled, streamed responses
+        are aborted, and the error is raised without waiting for the requests still running. Requests sent without
+        streaming time out at the deadline, and are abandoned shortly after the job stops.
+        """
+        prepared = self.prepare(srt_data)
+        chunks = prepared.chunks
+        translations = [{}] * len(chunks)
+        writer = SubtitleWriter(output, self.processor, prepared) if output is not None else None
+        pending = chunks
+        self.start_usage(pending)
         futures = []
         err = None
-        stop_flag = threading.Event()
+        deadline_at = time.monotonic() + self.deadline if self.deadline is not None else None
+        stop_flag = StopFlag(deadline_at)
+
+        def stop():
+            stop_flag.set()
+            self.scheduler.wake()  # so requests waiting for a slot notice they were cancelled
 
-        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
-            for i, chunk in enumerate(chunks):
-                future = executor.submit(self.translate_chunk, chunk, stop_flag, 0)
+        timer = threading.Timer(self.deadline, stop) if self.deadline is not None else None
+        if timer is not None:
+            timer.daemon = True
+            timer.start()
+
+        if self.should_probe(chunks, pending):
+            try:
+                self.submit(chunks[0])
+                index, response, _ = self.translate_chunk_with_cache(chunks[0], stop_flag)
+                self.complete_chunk(chunks[index], response, translations, writer)
+                prepared, translations, pending = self.resize_chunks(prepared, translations, writer)
+                chunks = prepared.chunks
+            except Exception as e:
+                err = e
+                stack_trace = traceback.format_exc()
+                pending = []
+
+        executor = ThreadPoolExecutor(max_workers=self.scheduler.max_concurrency)
+        try:
+            for chunk in self.schedule(pending):
+                self.submit(chunk)
+                future = executor.submit(self.translate_chunk_with_cache, chunk, stop_flag)
                 futures.append(future)
 
-            for future in concurrent.futures.as_completed(futures):
+            timeout = max(0.0, deadline_at - time.monotonic()) if deadline_at is not None else None
+            for future in concurrent.futures.as_completed(futures, timeout=timeout):
                 try:
                     index, response, _ = future.result()
-                    translations[index] = response
+                    self.complete_chunk(chunks[index], response, translations, writer)
                     if progress_callback:
                         progress_callback(len([t for t in translations if t]) / len(chunks))
                 except Exception as e:
                     err = e
                     stack_trace = traceback.format_exc()
-                    stop_flag.set()
-                    for fut in futures:
-                        fut.cancel()
                     break
+        except concurrent.futures.TimeoutError:
+            pass
+        finally:
+            stop()
+            if timer is not None:
+                timer.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
 
-        joined_text = "\n\n".join(translations)
-        result_text = self.processor.post_process_text(joined_text, parsed_srt)
+        if err is None and self.past_deadline(deadline_at):
+            err = self.deadline_error()
+            stack_trace = "".join(traceback.format_exception(err))
+
+        result_text = self.assemble(prepared, translations, writer)
 
         if err:
             raise TranslationError(err, stack_trace, result_text)
 
         return result_text
 
-    def translate_chunk(self, chunk: Chunk, stop_flag, attempt: int, temperature=None, randomize_ids=False):
+    async def translate_subtitles_async(
+        self,
+        srt_data: str,
+        progress_callback: Optional[Callable[[float], None]] = None,
+        output: Optional[TextIO] = None,
+        fanout: Optional[LanguageFanout] = None
+    ) -> Optional[str]:
+        """
+        Same as `translate_subtitles`, but runs all requests on the current event loop, using the models'
+        async clients. Concurrency is bounded by the request scheduler.
+        When a chunk fails, or the deadline passes, the requests still running are cancelled.
+        With a fanout, the file is translated along with the other languages of the fanout.
+        """
+        prepared = self.prepare(srt_data, fanout)
+        chunks = prepared.chunks
+        translations = [{}] * len(chunks)
+        writer = SubtitleWriter(output, self.processor, prepared) if output is not None else None
+        pending = chunks
+        self.start_usage(pending)
+        err = None
+        semaphore = asyncio.Semaphore(self.scheduler.max_concurrency)
+        deadline_at = time.monotonic() + self.deadline if self.deadline is not None else None
+
+        def remaining() -> Optional[float]:
+            return max(0.0, deadline_at - time.monotonic()) if deadline_at is not None else None
+
+        # Resized chunks would no longer be shared with the other languages of a grouped fanout
+        if self.should_probe(chunks, pending) and not (fanout is not None and fanout.grouped):
+            try:
+                self.submit(chunks[0])
+                index, response, _ = await asyncio.wait_for(
+                    self.translate_chunk_with_cache_async(chunks[0]), remaining()
+                )
+                self.complete_chunk(chunks[index], response, translations, writer)
+                prepared, translations, pending = self.resize_chunks(prepared, translations, writer)
+                chunks = prepared.chunks
+            except Exception as e:
+                err = self.deadline_error() if isinstance(e, TimeoutError) else e
+                stack_trace = traceback.format_exc()
+                pending = []
+
+        async def run(chunk: Chunk):
+            self.submit(chunk)
+            async with semaphore:
+                return await self.translate_chunk_with_cache_async(chunk, fanout)
+
+        tasks = [asyncio.create_task(run(chunk)) for chunk in self.schedule(pending)]
+        for task in asyncio.as_completed(tasks, timeout=remaining()):
+            try:
+                index, response, _ = await task
+                self.complete_chunk(chunks[index], response, translations, writer)
+                if progress_callback:
+                    progress_callback(len([t for t in translations if t]) / len(chunks))
+            except Exception as e:
+                err = self.deadline_error() if isinstance(e, TimeoutError) else e
+                stack_trace = traceback.format_exc()
+                for task in tasks:
+                    task.cancel()
+                break
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        result_text = self.assemble(prepared, translations, writer)
+
+        if err:
+            raise TranslationError(err, stack_trace, result_text)
+
+        return result_text
+
+    def translate_subtitles_batch(
+        self,
+        srt_data: str,
+        progress_callback: Optional[Callable[[float], None]] = None,
+        poll_interval: float = BATCH_POLL_INTERVAL,
+        output: Optional[TextIO] = None
+    ) -> Optional[str]:
+        """
+        Translate all chunks as a single job on the provider's batch API, which is slower but cheaper.
+        Responses are validated as usual once the batch ends, and failed chunks are sent again in a follow-up batch,
+        up to `max_retries` times.
+        """
+        prepared = self.prepare(srt_data)
+        chunks = prepared.chunks
+        translations = [{}] * len(chunks)
+        writer = SubtitleWriter(output, self.processor, prepared) if output is not None else None
+        pending = []
+        for chunk in chunks:
+            cached = self.get_cached_chunk(chunk) if self.cache is not None else None
+            if cached is None:
+                pending.append(chunk)
+            else:
+                self.complete_chunk(chunk, cached, translations, writer)
+                self.record_chunk(chunk, 0, "cache")
+        self.start_usage(pending)
+
+        temperatures = {}
+        err = None
+        deadline_at = time.monotonic() + self.deadline if self.deadline is not None else None
+        for attempt in range(self.max_retries + 1):
+            if not pending:
+                break
+            requests = {}
+            try:
+                for chunk in pending if attempt == 0 else []:
+                    self.dispatch_chunk(chunk)
+            except BudgetExceededError as e:
+                err = e
+                stack_trace = traceback.format_exc()
+                break
+            for chunk in pending:
+                subtitles, _ = self.prepare_subtitles(chunk, attempt, False)
+                requests[str(chunk.idx)] = (
+                    self.build_prompt(subtitles), temperatures.get(chunk.idx) or self.temperature
+                )
+            logger.info(f"Submitting batch of {len(requests)} chunks [attempt {attempt + 1}].")
+            try:
+                results = self.wait_for_batch(
+                    self.model.submit_batch(requests, self.instructions), poll_interval, deadline_at
+                )
+            except JobDeadlineError as e:
+                err = e
+                stack_trace = traceback.format_exc()
+                break
+
+            failed = []
+            for chunk in pending:
+                try:
+                    result = results.get(str(chunk.idx)) or Exception(f"Chunk {chunk.idx + 1} missing from batch results.")
+                    if isinstance(result, Exception):
+                        raise result
+                    raw_response, num_tokens = result
+                    self.record_usage(self.model, chunk, num_tokens)
+                    response = self.process_response(chunk, raw_response, num_tokens, {})
+                except Exception as e:
+                    err = e
+                    stack_trace = traceback.format_exc()
+                    logger.info(f"Chunk {chunk.idx + 1} failed in batch, after error: {e}")
+                    temperatures[chunk.idx] = 1 if isinstance(e, ResponseRepetitiveError) else None
+                    failed.append(chunk)
+                    continue
+                self.complete_chunk(chunk, response, translations, writer)
+                self.record_chunk(chunk, attempt + 1)
+                self.observe_ratio(chunk, num_tokens)
+                if self.usage is not None:
+                    self.usage.complete(chunk.num_tokens)
+                if self.cache is not None:
+                    self.put_cached_chunk(chunk, response)
+                if progress_callback:
+                    progress_callback(len([t for t in translations if t]) / len(chunks))
+            pending = failed
+
+        for chunk in pending:
+            self.record_chunk(chunk, self.max_retries + 1, error=err)
+
+        result_text = self.assemble(prepared, translations, writer)
+
+        if pending:
+            raise TranslationError(err, stack_trace, result_text)
+
+        return result_text
+
+    @staticmethod
+    def past_deadline(deadline_at: Optional[float]) -> bool:
+        return deadline_at is not None and time.monotonic() >= deadline_at
+
+    def deadline_error(self) -> "JobDeadlineError":
+        return JobDeadlineError(f"Translation did not complete within its deadline of {self.deadline:g}s.")
+
+    def wait_for_batch(self, batch_id: str, poll_interval: float, deadline_at: Optional[float] = None) -> dict:
+        while True:
+            results = self.model.get_batch_results(batch_id)
+            if results is not None:
+                return results
+            if deadline_at is not None and time.monotonic() + poll_interval > deadline_at:
+                raise self.deadline_error()
+            time.sleep(poll_interval)
+
+    def get_cache_key(self, chunk: Chunk) -> str:
+        return self.cache.make_key(chunk.text, self.lang, self.model.model_name, self.temperature, self.prompt_template)
+
+    def get_cached_chunk(self, chunk: Chunk) -> Optional[dict]:
+        cached = self.cache.get(self.get_cache_key(chunk))
+        if cached is None:
+            return None
+        logger.info(f"Got chunk {chunk.idx + 1} from cache.")
+        return self.processor.get_translations(cached)
+
+    def put_cached_chunk(self, chunk: Chunk, response: dict):
+        self.cache.put(self.get_cache_key(chunk), self.processor.render(response, response.values()))
+
+    def translate_chunk_with_cache(self, chunk: Chunk, stop_flag):
+        cached = self.get_cached_chunk(chunk) if self.cache is not None else None
+        if cached is not None:
+            self.record_chunk(chunk, 0, "cache")
+            if self.usage is not None:
+                self.usage.skip(chunk.num_tokens)
+            return chunk.idx, cached, 0
+
         if stop_flag.is_set():
-            return chunk.idx, "", ""
+            return chunk.idx, {}, 0
+        self.dispatch_chunk(chunk)
+        translator = self
+        while True:
+            try:
+                idx, response, attempts = translator.translate_chunk(chunk, stop_flag, 0)
+                break
+            except RequestCancelledError:
+                return chunk.idx, {}, 0
+            except Exception as e:
+                fallback = self.escalate(translator, chunk, e)
+                if fallback is None:
+                    translator.record_chunk(chunk, self.max_retries + 1, error=e)
+                    raise
+                translator.record_chunk(chunk, self.max_retries + 1, "escalated")
+                translator = fallback
+        if response:
+            translator.record_chunk(chunk, attempts)
+            if self.usage is not None:
+                self.usage.complete(chunk.num_tokens)
+            if self.cache is not None:
+                self.put_cached_chunk(chunk, response)
+        return idx, response, attempts
 
-        chunk_number = chunk.idx + 1
-        if randomize_ids:
-            subtitles, mapping = self.processor.randomize_ids(chunk.text)
-        else:
-            subtitles = chunk.text
-            mapping = {}
+    async def translate_chunk_with_cache_async(self, chunk: Chunk, fanout: Optional[LanguageFanout] = None):
+        cached = self.get_cached_chunk(chunk) if self.cache is not None else None
+        if cached is not None:
+            self.record_chunk(chunk, 0, "cache")
+            if self.usage is not None:
+                self.usage.skip(chunk.num_tokens)
+            return chunk.idx, cached, 0
 
-        if attempt >= 2:
-            logger.info(f"Shuffling order of chunk {chunk_number} after error.")
-            subtitles = self.processor.shuffle_order(subtitles)
+        self.dispatch_chunk(chunk)
+        response, attempts = await self.translate_grouped_async(chunk, fanout) if fanout is not None else ({}, 0)
+        if response:
+            self.record_chunk(chunk, attempts)
+            if self.usage is not None:
+                self.usage.complete(chunk.num_tokens)
+            if self.cache is not None:
+                self.put_cached_chunk(chunk, response)
+            return chunk.idx, response, attempts
+
+        translator = self
+        while True:
+            try:
+                idx, response, attempts = await translator.translate_chunk_async(chunk, 0)
+                break
+            except Exception as e:
+                fallback = self.escalate(translator, chunk, e)
+                if fallback is None:
+                    translator.record_chunk(chunk, self.max_retries + 1, error=e)
+                    raise
+                translator.record_chunk(chunk, self.max_retries + 1, "escalated")
+                translator = fallback
+        translator.record_chunk(chunk, attempts)
+        if self.usage is not None:
+            self.usage.complete(chunk.num_tokens)
+        if self.cache is not None:
+            self.put_cached_chunk(chunk, response)
+        return idx, response, attempts
 
+    async def translate_grouped_async(self, chunk: Chunk, fanout: LanguageFanout) -> (dict, int):
+        """
+        Translate a chunk with the grouped request of the fanout, repairing the subtitles missing from its
+        translation as for a response of its own. Nothing if the chunk has to be translated on its own.
+        """
         try:
-            raw_response, num_tokens = self.get_translation(
-                chunk_number, subtitles, chunk.num_tokens, temperature
-            )
-            response = raw_response.strip()
-            response = self.processor.extract_subtitles(response, mapping)
-            self.validate_response(
-                response, chunk.text, chunk_number, raw_response, num_tokens
-            )
+            response = await fanout.translate(self, chunk)
+        except MissingSubtitlesError as e:
+            if not self.should_repair(e, chunk, 0):
+                return {}, 0
+            try:
+                return await self.repair_chunk_async(chunk, e, 1)
+            except Exception as repair_error:
+                logger.info(f"Repair of chunk {chunk.idx + 1} failed, translating it alone: {repair_error}")
+                return {}, 0
+        except (RefuseToTranslateError, ResponseRepetitiveError, ResponseTooLongError) as e:
+            logger.info(f"Chunk {chunk.idx + 1} grouped response invalid in {self.lang}, translating it alone: {e}")
+            return {}, 0
+        return (response, 1) if response else ({}, 0)
+
+    def escalate(
+        self, translator: "SubtitleTranslator", chunk: Chunk, error: Exception
+    ) -> Optional["SubtitleTranslator"]:
+        """
+        The translator of the next model of the fallback cascade, for a chunk whose retries all failed on the model
+        of `translator` with an error another model may not make. None if there's no model left to try.
+        """
+        cascade = [self] + self.fallbacks
+        position = cascade.index(translator)
+        if position + 1 >= len(cascade) or not isinstance(
+            error, (MissingSubtitlesError, RefuseToTranslateError, ResponseRepetitiveError, ResponseTooLongError)
+        ):
+            return None
+        fallback = cascade[position + 1]
+        logger.info(f"Escalating chunk {chunk.idx + 1} to {fallback.model.model_name}, after error: {error}")
+        return fallback
+
+    def has_translation(self, chunk: Chunk) -> bool:
+        """
+        Whether a chunk was translated by an earlier run of the job or is cached, and needs no request.
+        """
+        if self.journal is not None and len(self.journal.lookup(chunk.ids, chunk.texts)) == len(chunk.ids):
+            return True
+        return self.cache is not None and self.cache.get(self.get_cache_key(chunk)) is not None
+
+    def submit(self, chunk: Chunk):
+        """
+        Note when a chunk was submitted, for the queue wait of its first request.
+        """
+        self.submitted_at[chunk.idx] = time.perf_counter()
+
+    def make_trace(self, model: BaseModel, chunk: Chunk, attempt: int) -> RequestTrace:
+        input_tokens = chunk.num_tokens + self.get_prompt_tokens(model)
+        return RequestTrace(chunk.idx, attempt, input_tokens, self.submitted_at.pop(chunk.idx, None))
+
+    def record_chunk(self, chunk: Chunk, attempts: int, source: str = "model", error: Optional[Exception] = None):
+        self.telemetry.record_chunk(self.model.model_name, self.lang, chunk.idx, attempts, source, error)
+
+    def translate_chunk(self, chunk: Chunk, stop_flag, attempt: int, temperature=None, randomize_ids=False):
+        if stop_flag.is_set():
+            return chunk.idx, {}, 0
+
+        subtitles, mapping = self.prepare_subtitles(chunk, attempt, randomize_ids)
+
+        try:
+            response, num_tokens = self.request_chunk(chunk, subtitles, mapping, attempt, temperature, stop_flag)
         except Exception as e:
-            if (
-                attempt < self.max_retries and
-                (isinstance(e, (MissingSubtitlesError, ResponseRepetitiveError)) or
-                 isinstance(e, RefuseToTranslateError) and self.retry_on_refusal)
-            ):
-                logger.info(
-                    f"Retrying chunk {chunk_number}, after error: {e} [attempt {attempt + 1}]"
-                )
+            if self.should_repair(e, chunk, attempt):
+                response, attempts = self.repair_chunk(chunk, e, stop_flag, attempt + 1)
+                return chunk.idx, response, attempts
+            if self.should_split(e, chunk, attempt):
+                response, attempts = self.split_chunk(chunk, stop_flag, attempt + 1)
+                return chunk.idx, response, attempts
+            if self.should_retry(e, chunk, attempt):
                 temperature = 1 if isinstance(e, ResponseRepetitiveError) else None
                 return self.translate_chunk(chunk, stop_flag, attempt + 1, temperature)
             else:
                 raise e
 
+        self.observe_ratio(chunk, num_tokens)
+        return chunk.idx, response, attempt + 1
+
+    async def translate_chunk_async(self, chunk: Chunk, attempt: int, temperature=None, randomize_ids=False):
+        subtitles, mapping = self.prepare_subtitles(chunk, attempt, randomize_ids)
+
+        try:
+            response, num_tokens = await self.request_chunk_async(chunk, subtitles, mapping, attempt, temperature)
+        except Exception as e:
+            if self.should_repair(e, chunk, attempt):
+                response, attempts = await self.repair_chunk_async(chunk, e, attempt + 1)
+                return chunk.idx, response, attempts
+            if self.should_split(e, chunk, attempt):
+                response, attempts = await self.split_chunk_async(chunk, attempt + 1)
+                return chunk.idx, response, attempts
+            if self.should_retry(e, chunk, attempt):
+                temperature = 1 if isinstance(e, ResponseRepetitiveError) else None
+                return await self.translate_chunk_async(chunk, attempt + 1, temperature)
+            else:
+                raise e
+
+        self.observe_ratio(chunk, num_tokens)
         return chunk.idx, response, attempt + 1
 
-    def get_translation(self, chunk_number, text: str, num_tokens: int, temperature=None) -> (str, int):
-        prompt = self.prompt_template.replace("{subtitles}", text.strip()) \
-            .replace("{target_language}", self.lang)
+    def request_chunk(
+        self, chunk: Chunk, subtitles: str, mapping: dict, attempt: int, temperature=None,
+        stop_flag: Optional[threading.Event] = None
+    ) -> (dict, int):
+        """
+        Request the translation of a chunk, and validate it. With hedging, a duplicate request is sent when the
+        first one runs well past the usual latency, and the first valid response of the two is kept.
+        """
+        delay = self.get_hedge_delay(chunk)
+        if delay is None:
+            return self.request_translation(self.model, chunk, subtitles, mapping, attempt, temperature, stop_flag)
+
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            primary = executor.submit(
+                self.request_translation, self.model, chunk, subtitles, mapping, attempt, temperature, stop_flag
+            )
+            done, _ = concurrent.futures.wait([primary], timeout=delay)
+            if done or not self.hedging.try_hedge(chunk.num_tokens):
+                return primary.result()
+            logger.info(f"Hedging chunk {chunk.idx + 1}, no response after {delay:.1f}s.")
+            hedge = executor.submit(
+                self.request_translation, self.hedging.model or self.model, chunk, subtitles, mapping, attempt,
+                temperature, stop_flag
+            )
+            error = None
+            pending = {primary, hedge}
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is hedge:
+                            self.hedging.record_win()
+                        return future.result()
+                    if future is primary or error is None:
+                        error = future.exception()
+            raise error
+        finally:
+            # The losing request can't be interrupted, it finishes in the background and its response is dropped
+            executor.shutdown(wait=False)
+
+    async def request_chunk_async(
+        self, chunk: Chunk, subtitles: str, mapping: dict, attempt: int, temperature=None
+    ) -> (dict, int):
+        delay = self.get_hedge_delay(chunk)
+        if delay is None:
+            return await self.request_translation_async(self.model, chunk, subtitles, mapping, attempt, temperature)
+
+        primary = asyncio.create_task(
+            self.request_translation_async(self.model, chunk, subtitles, mapping, attempt, temperature)
+        )
+        hedge = None
+        try:
+            done, _ = await asyncio.wait([primary], timeout=delay)
+            if done or not self.hedging.try_hedge(chunk.num_tokens):
+                return await primary
+            logger.info(f"Hedging chunk {chunk.idx + 1}, no response after {delay:.1f}s.")
+            hedge = asyncio.create_task(self.request_translation_async(
+                self.hedging.model or self.model, chunk, subtitles, mapping, attempt, temperature
+            ))
+            error = None
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedging.record_win()
+                        return task.result()
+                    if task is primary or error is None:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is not None:
+                    task.cancel()
+
+    def get_hedge_delay(self, chunk: Chunk) -> Optional[float]:
+        if self.hedging is None:
+            return None
+        self.hedging.observe(chunk.num_tokens)
+        return self.hedging.delay(self.telemetry, self.model.model_name, chunk.num_tokens)
+
+    def request_translation(
+        self, model: BaseModel, chunk: Chunk, subtitles: str, mapping: dict, attempt: int, temperature=None,
+        stop_flag: Optional[threading.Event] = None
+    ) -> (dict, int):
+        trace = self.make_trace(model, chunk, attempt)
+        try:
+            raw_response, num_tokens = self.get_translation(
+                chunk.idx + 1, subtitles, chunk.num_tokens, temperature, trace, model, stop_flag
+            )
+            trace.finish(num_tokens, self.get_compression_ratio(raw_response))
+            self.record_usage(model, chunk, num_tokens)
+            response = self.process_response(chunk, raw_response, num_tokens, mapping)
+        except Exception as e:
+            self.record_request(model, trace, e)
+            raise
+        self.record_request(model, trace)
+        return response, num_tokens
+
+    async def request_translation_async(
+        self, model: BaseModel, chunk: Chunk, subtitles: str, mapping: dict, attempt: int, temperature=None
+    ) -> (dict, int):
+        trace = self.make_trace(model, chunk, attempt)
+        try:
+            raw_response, num_tokens = await self.get_translation_async(
+                chunk.idx + 1, subtitles, chunk.num_tokens, temperature, trace, model
+            )
+            trace.finish(num_tokens, self.get_compression_ratio(raw_response))
+            self.record_usage(model, chunk, num_tokens)
+            response = self.process_response(chunk, raw_response, num_tokens, mapping)
+        except Exception as e:
+            self.record_request(model, trace, e)
+            raise
+        self.record_request(model, trace)
+        return response, num_tokens
+
+    def record_request(self, model: BaseModel, trace: RequestTrace, error: Optional[Exception] = None):
+        self.telemetry.record_request(model.model_name, self.lang, trace, error)
+
+    def start_usage(self, pending: list[Chunk]):
+        if self.usage is not None:
+            self.usage.start(sum(chunk.num_tokens for chunk in pending))
+
+    def dispatch_chunk(self, chunk: Chunk):
+        """
+        Check the budget before sending a chunk, with the estimated cost of its request. Its output is estimated from
+        the output/input ratio learned by the sizer, or as long as its input.
+        """
+        if self.usage is None:
+            return
+        ratio = self.sizer.ratio(self.model.model_name, self.lang) if self.sizer is not None else None
+        input_tokens = chunk.num_tokens + self.get_prompt_tokens(self.model)
+        output_tokens = int(chunk.num_tokens * (ratio or 1.0))
+        self.usage.dispatch(
+            chunk.num_tokens, self.model.get_cost(input_tokens, output_tokens), input_tokens + output_tokens
+        )
+
+    def record_usage(self, model: BaseModel, chunk: Chunk, output_tokens: int):
+        if self.usage is not None:
+            self.usage.record(model, chunk.num_tokens + self.get_prompt_tokens(model), output_tokens)
+
+    def get_prompt_tokens(self, model: BaseModel) -> int:
+        """
+        Tokens of the prompt around the subtitles, counted once per model.
+        """
+        if model.model_name not in self.prompt_tokens:
+            self.prompt_tokens[model.model_name] = model.num_tokens_from_string(self.instructions + self.prompt_suffix)
+        return self.prompt_tokens[model.model_name]
+
+    def observe_ratio(self, chunk: Chunk, num_tokens: int):
+        if self.sizer is not None:
+            self.sizer.observe(self.model.model_name, self.lang, chunk.num_tokens, num_tokens)
+
+    def prepare_subtitles(self, chunk: Chunk, attempt: int, randomize_ids: bool) -> (str, dict):
+        if attempt >= 2:
+            logger.info(f"Shuffling order of chunk {chunk.idx + 1} after error.")
+        return self.processor.render_chunk(chunk, randomize_ids, attempt >= 2, attempt)
+
+    def process_response(self, chunk: Chunk, raw_response: str, num_tokens: int, mapping: dict) -> dict:
+        response = self.processor.parse_response(raw_response.strip(), mapping)
+        self.validate_response(response, chunk, raw_response, num_tokens)
+        return response
+
+    def should_repair(self, error: Exception, chunk: Chunk, attempt: int) -> bool:
+        if attempt >= self.max_retries or not self.can_repair(error, chunk):
+            return False
+        logger.info(
+            f"Repairing {len(error.missing_subtitles)} missing subtitles of chunk {chunk.idx + 1} "
+            f"[attempt {attempt + 1}]"
+        )
+        return True
+
+    def should_split(self, error: Exception, chunk: Chunk, attempt: int) -> bool:
+        """
+        With adaptive chunk sizing, chunks whose response was too long, or missed too many subtitles to repair,
+        are split in two instead of being retried at the same size.
+        """
+        if (
+            self.sizer is None or attempt >= self.max_retries or len(chunk.ids) < 2 or
+            not isinstance(error, (ResponseTooLongError, MissingSubtitlesError))
+        ):
+            return False
+        logger.info(f"Splitting chunk {chunk.idx + 1} in two, after error: {error} [attempt {attempt + 1}]")
+        return True
+
+    def split_chunk(self, chunk: Chunk, stop_flag, attempt: int) -> (dict, int):
+        results = [self.translate_chunk(part, stop_flag, attempt) for part in self.processor.split_chunk(chunk)]
+        return self.merge_parts(results)
+
+    async def split_chunk_async(self, chunk: Chunk, attempt: int) -> (dict, int):
+        results = await asyncio.gather(
+            *(self.translate_chunk_async(part, attempt) for part in self.processor.split_chunk(chunk))
+        )
+        return self.merge_parts(results)
+
+    @staticmethod
+    def merge_parts(results) -> (dict, int):
+        response = {}
+        for _, part, _ in results:
+            if not part:  # stopped before translating it
+                return {}, 0
+            response.update(part)
+        return dict(sorted(response.items())), max(attempts for _, _, attempts in results)
+
+    def should_retry(self, error: Exception, chunk: Chunk, attempt: int) -> bool:
+        if attempt >= self.max_retries or not (
+            isinstance(error, (MissingSubtitlesError, ResponseRepetitiveError)) or
+            isinstance(error, RefuseToTranslateError) and self.retry_on_refusal
+        ):
+            return False
+        logger.info(
+            f"Retrying chunk {chunk.idx + 1}, after error: {error} [attempt {attempt + 1}]"
+        )
+        return True
+
+    def can_repair(self, error: Exception, chunk: Chunk) -> bool:
+        if not self.partial_repair or not isinstance(error, MissingSubtitlesError) or not error.missing_subtitles:
+            return False
+        return len(error.missing_subtitles) / len(chunk.ids) <= MAX_REPAIR_RATIO
+
+    def make_repair_chunk(self, chunk: Chunk, error: "MissingSubtitlesError") -> Chunk:
+        ids, texts = self.processor.make_repair_subtitles(chunk, error.missing_subtitles, REPAIR_CONTEXT_SIZE)
+        return self.processor.make_chunk(ids, texts, chunk.idx)
+
+    def repair_chunk(self, chunk: Chunk, error: "MissingSubtitlesError", stop_flag, attempt: int) -> (dict, int):
+        """
+        Translate only the subtitles missing from a response, and merge them into the valid part of it.
+        The cost of the follow-up request scales with the number of missing subtitles, not the chunk size.
+        """
+        _, repaired, attempts = self.translate_chunk(self.make_repair_chunk(chunk, error), stop_flag, attempt)
+        return self.merge_repair(error, repaired, attempts)
+
+    async def repair_chunk_async(self, chunk: Chunk, error: "MissingSubtitlesError", attempt: int) -> (dict, int):
+        _, repaired, attempts = await self.translate_chunk_async(self.make_repair_chunk(chunk, error), attempt)
+        return self.merge_repair(error, repaired, attempts)
+
+    def merge_repair(self, error: "MissingSubtitlesError", repaired: dict, attempts: int) -> (dict, int):
+        if not repaired:  # stopped before repairing it, the response is still incomplete
+            return {}, 0
+        return self.processor.merge_translations(error.response, repaired, error.missing_subtitles), attempts
+
+    def build_prompt(self, text: str) -> str:
+        return text.strip() + self.prompt_suffix
+
+    def get_translation(
+        self, chunk_number, text: str, num_tokens: int, temperature=None, trace: Optional[RequestTrace] = None,
+        model: Optional[BaseModel] = None, stop_flag: Optional[threading.Event] = None
+    ) -> (str, int):
+        prompt = self.build_prompt(text)
+        temperature = temperature or self.temperature
+        model = model or self.model
+        trace = trace or RequestTrace(chunk_number - 1, 0, num_tokens + self.get_prompt_tokens(model))
         logger.info(f"Processing chunk {chunk_number}, with {num_tokens} tokens.")
-        return self.model.generate_completion(prompt, temperature or self.temperature)
+
+        def call():
+            trace.start()
+            if self.stream:
+                return model.generate_completion_stream(
+                    prompt, temperature, OutputMonitor(model, chunk_number, num_tokens, trace, stop_flag),
+                    self.instructions
+                )
+            if not isinstance(stop_flag, StopFlag):
+                return model.generate_completion(prompt, temperature, self.instructions)
+            timeout = stop_flag.time_left()
+            if timeout is not None:
+                return stop_flag.run(lambda: model.generate_completion(prompt, temperature, self.instructions, timeout))
+            return stop_flag.run(lambda: model.generate_completion(prompt, temperature, self.instructions))
+
+        return self.scheduler.run(call, num_tokens + self.get_prompt_tokens(model), stop_flag, num_tokens)
+
+    async def get_translation_async(
+        self, chunk_number, text: str, num_tokens: int, temperature=None, trace: Optional[RequestTrace] = None,
+        model: Optional[BaseModel] = None
+    ) -> (str, int):
+        prompt = self.build_prompt(text)
+        temperature = temperature or self.temperature
+        model = model or self.model
+        trace = trace or RequestTrace(chunk_number - 1, 0, num_tokens + self.get_prompt_tokens(model))
+        logger.info(f"Processing chunk {chunk_number}, with {num_tokens} tokens.")
+
+        def call():
+            trace.start()
+            if self.stream:
+                return model.agenerate_completion_stream(
+                    prompt, temperature, OutputMonitor(model, chunk_number, num_tokens, trace), self.instructions
+                )
+            return model.agenerate_completion(prompt, temperature, self.instructions)
+
+        return await self.scheduler.run_async(call, num_tokens + self.get_prompt_tokens(model), num_tokens)
 
     @staticmethod
     def get_compression_ratio(text: str) -> float:
         text_bytes = text.encode("utf-8")
         return len(text_bytes) / len(zlib.compress(text_bytes))
 
-    def validate_response(self, response: str, original_text: str, chunk_number: int, raw_response: str, num_tokens: int):
+    def validate_response(self, response: dict, chunk: Chunk, raw_response: str, num_tokens: int):
+        chunk_number = chunk.idx + 1
         if num_tokens >= self.model.max_output_tokens():
             if self.get_compression_ratio(raw_response) >= COMPRESSION_RATIO_THRESHOLD:
                 raise ResponseRepetitiveError(
@@ -143,18 +1070,76 @@ class SubtitleTranslator:
                     f"Preview: {raw_response[:1000]}"
                 )
 
-        missing_subtitles = self.processor.get_missing_subtitles(response, original_text)
+        missing_subtitles = self.processor.get_missing_subtitles(response, chunk)
         if missing_subtitles:
-            if len(missing_subtitles) == len(self.processor.split_on_tags(original_text)) and len(raw_response) > 0:
+            if len(missing_subtitles) == len(chunk.ids) and len(raw_response) > 0:
                 raise RefuseToTranslateError(raw_response)
             else:
                 raise MissingSubtitlesError(
-                    f"Chunk {chunk_number} is missing {len(missing_subtitles)} subtitles. Try a smaller chunk size."
+                    f"Chunk {chunk_number} is missing {len(missing_subtitles)} subtitles. Try a smaller chunk size.",
+                    missing_subtitles,
+                    response
                 )
 
         logger.info(f"Got chunk {chunk_number}, length is {num_tokens} tokens.")
 
 
+class OutputMonitor:
+    """
+    Checks a response while it streams in, and aborts it as soon as it gets stuck in a repeating pattern,
+    or grows well past the size of the input, instead of waiting for the model to hit its output limit.
+    Also aborts it once `stop_flag` is set, so a failed job stops paying for output tokens.
+    """
+
+    def __init__(
+        self,
+        model: BaseModel,
+        chunk_number: int,
+        input_tokens: int,
+        trace: Optional[RequestTrace] = None,
+        stop_flag: Optional[threading.Event] = None
+    ):
+        self.model = model
+        self.chunk_number = chunk_number
+        self.trace = trace
+        self.stop_flag = stop_flag
+        self.max_tokens = max(MAX_OUTPUT_RATIO * input_tokens, STREAM_CHECK_CHARS)
+        self.pending = []
+        self.pending_chars = 0
+        self.tail = ""
+        self.output_tokens = 0
+
+    def __call__(self, text: str):
+        if self.stop_flag is not None and self.stop_flag.is_set():
+            raise RequestCancelledError(f"Chunk {self.chunk_number} response aborted, the translation was stopped.")
+        if self.trace is not None:
+            self.trace.first_token()
+        self.pending.append(text)
+        self.pending_chars += len(text)
+        if self.pending_chars < STREAM_CHECK_CHARS:
+            return
+
+        segment = "".join(self.pending)
+        self.pending = []
+        self.pending_chars = 0
+        self.output_tokens += self.model.num_tokens_from_string(segment)
+        self.tail = (self.tail + segment)[-STREAM_WINDOW_CHARS:]
+
+        if self.output_tokens > self.max_tokens:
+            raise ResponseRepetitiveError(
+                f"Chunk {self.chunk_number} response aborted after {self.output_tokens} tokens, "
+                f"more than {MAX_OUTPUT_RATIO} times the input. Preview: {self.tail[-1000:]}"
+            )
+        if (
+            len(self.tail) >= STREAM_WINDOW_CHARS and
+            SubtitleTranslator.get_compression_ratio(self.tail) >= STREAM_COMPRESSION_RATIO_THRESHOLD
+        ):
+            raise ResponseRepetitiveError(
+                f"Chunk {self.chunk_number} response aborted after {self.output_tokens} tokens, "
+                f"stuck in a repeating pattern. Preview: {self.tail[-1000:]}"
+            )
+
+
 class ResponseTooLongError(Exception):
     """Exception raised when the response exceeds the maximum token limit."""
 
@@ -162,11 +1147,22 @@ class ResponseRepetitiveError(Exception):
     """Exception raised when the response is stuck in a repeating pattern."""
 
 class MissingSubtitlesError(Exception):
-    """Exception raised when subtitles are missing in the response."""
+    """
+    Exception raised when subtitles are missing in the response.
+    Stores the missing subtitles by id, and the valid part of the response.
+    """
+
+    def __init__(self, message, missing_subtitles=None, response=None):
+        super().__init__(message)
+        self.missing_subtitles = missing_subtitles or {}
+        self.response = response or {}
 
 class RefuseToTranslateError(Exception):
     """Exception raised when the model refuses to translate the text."""
 
+class JobDeadlineError(Exception):
+    """Exception raised when a translation does not complete within its deadline."""
+
 
 class TranslationError(Exception):
     """
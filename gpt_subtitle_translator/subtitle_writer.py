@@ -0,0 +1,66 @@
+import threading
+from typing import TextIO
+
+from gpt_subtitle_translator.subtitle_processor import SubtitleProcessor
+
+
+class SubtitleWriter:
+    """
+    Writes a translation to an SRT file while it's in progress. A chunk is written as soon as it and all
+    the chunks before it are translated, along with the reused translations in between, so the output
+    grows in order and only the translations still waiting on an earlier chunk are kept in memory.
+    """
+
+    def __init__(self, output: TextIO, processor: SubtitleProcessor, prepared):
+        self.output = output
+        self.processor = processor
+        self.prepared = prepared
+        self.ids = sorted(prepared.parsed_srt)
+        self.position = 0
+        self.next_chunk = 0
+        self.completed = {}
+        self.referenced = set(prepared.duplicates.values())
+        self.repeated = {}
+        self.started = False
+        self.lock = threading.Lock()
+
+    def add(self, idx: int, translation: dict):
+        with self.lock:
+            self.completed[idx] = translation
+            while self.next_chunk in self.completed:
+                translation = self.completed.pop(self.next_chunk)
+                self.next_chunk += 1
+                chunks = self.prepared.chunks
+                end_id = chunks[self.next_chunk].ids[0] if self.next_chunk < len(chunks) else None
+                self.write_until(end_id, translation)
+
+    def close(self):
+        """
+        Write the reused translations after the last chunk. Does nothing if some chunks were not translated.
+        """
+        with self.lock:
+            if self.next_chunk == len(self.prepared.chunks):
+                self.write_until(None, {})
+
+    def write_until(self, end_id, translation: dict):
+        entries = {}
+        while self.position < len(self.ids) and (end_id is None or self.ids[self.position] < end_id):
+            key = self.ids[self.position]
+            self.position += 1
+            if key in translation:
+                entries[key] = translation[key]
+            elif key in self.prepared.translated:
+                entries[key] = self.prepared.translated[key]
+            elif self.prepared.duplicates.get(key) in self.repeated:
+                entries[key] = self.repeated[self.prepared.duplicates[key]]
+            if key in self.referenced and key in entries:
+                self.repeated[key] = entries[key]
+
+        text = self.processor.render_srt(self.prepared.parsed_srt, entries)
+        if not text:
+            return
+        if self.started:
+            self.output.write("\n\n")
+        self.output.write(text)
+        self.started = True
+        self.output.flush()
@@ -0,0 +1,255 @@
+import json
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from typing import Optional
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+SAMPLE_WINDOW = 1000  # Recent samples kept per metric, for the percentiles of the summary
+METRIC_PREFIX = "subtitle_translator"
+HISTOGRAMS = {
+    "queue_wait": "Time requests waited for the scheduler, including backoff.",
+    "latency": "Time from sending a request to its full response.",
+    "time_to_first_token": "Time from sending a streamed request to its first token.",
+}
+
+
+class RequestTrace:
+    """
+    Timings and outcome of one request for a chunk. `start` is called each time the request is sent,
+    so rate limited requests retried by the scheduler count their backoff as queue wait.
+    The first request of a chunk is queued from the time the chunk was submitted, `queued_at`, so its queue wait
+    includes the wait for a worker and for a concurrency slot. `input_tokens` counts the whole prompt.
+    """
+    __slots__ = (
+        "chunk", "attempt", "input_tokens", "output_tokens", "calls", "queued_at", "started_at",
+        "first_token_at", "finished_at", "compression_ratio"
+    )
+
+    def __init__(self, chunk: int, attempt: int, input_tokens: int, queued_at: Optional[float] = None):
+        self.chunk = chunk
+        self.attempt = attempt
+        self.input_tokens = input_tokens
+        self.output_tokens = 0
+        self.calls = 0
+        self.queued_at = queued_at if queued_at is not None else time.perf_counter()
+        self.started_at = None
+        self.first_token_at = None
+        self.finished_at = None
+        self.compression_ratio = None
+
+    def start(self):
+        self.calls += 1
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+
+    def first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def finish(self, output_tokens: int, compression_ratio: float):
+        self.finished_at = time.perf_counter()
+        self.output_tokens = output_tokens
+        self.compression_ratio = compression_ratio
+
+    @property
+    def queue_wait(self) -> Optional[float]:
+        return self.started_at - self.queued_at if self.started_at is not None else None
+
+    @property
+    def latency(self) -> Optional[float]:
+        if self.started_at is None:
+            return None
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        return self.first_token_at - self.started_at if self.first_token_at is not None else None
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+        self.samples.append(value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Telemetry:
+    """
+    Collects per-request and per-chunk metrics of translation jobs.
+
+    Each event is appended to `path` as a JSON line if given. Aggregates are kept as Prometheus-style
+    counters and histograms, labelled by model and language, exported with `prometheus`, and summarized
+    with `summary`.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8") if path else None
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.tokens = Counter()
+        self.chunks = Counter()
+        self.attempts = Counter()
+        self.histograms = defaultdict(Histogram)
+
+    def record_request(self, model: str, lang: str, trace: RequestTrace, error: Optional[Exception] = None):
+        error_class = type(error).__name__ if error is not None else None
+        event = {
+            "event": "request",
+            "time": time.time(),
+            "model": model,
+            "lang": lang,
+            "chunk": trace.chunk + 1,
+            "attempt": trace.attempt + 1,
+            "calls": trace.calls,
+            "queue_wait": trace.queue_wait,
+            "latency": trace.latency,
+            "time_to_first_token": trace.time_to_first_token,
+            "input_tokens": trace.input_tokens,
+            "output_tokens": trace.output_tokens,
+            "compression_ratio": trace.compression_ratio,
+            "error": error_class,
+        }
+        with self.lock:
+            self.requests[(model, lang, error_class or "")] += 1
+            self.tokens[(model, "input")] += trace.input_tokens
+            self.tokens[(model, "output")] += trace.output_tokens
+            for name in HISTOGRAMS:
+                if event[name] is not None:
+                    self.histograms[(name, model)].observe(event[name])
+            self.write(event)
+
+    def record_chunk(
+        self, model: str, lang: str, chunk: int, attempts: int, source: str = "model", error: Optional[Exception] = None
+    ):
+        """
+        Record the outcome of a chunk, translated by the model, served from the cache, escalated to the next model
+        of a fallback cascade, or failed.
+        """
+        source = "failed" if error is not None else source
+        with self.lock:
+            self.chunks[(model, lang, source)] += 1
+            self.attempts[(model, lang)] += attempts
+            self.write({
+                "event": "chunk",
+                "time": time.time(),
+                "model": model,
+                "lang": lang,
+                "chunk": chunk + 1,
+                "attempts": attempts,
+                "source": source,
+                "error": type(error).__name__ if error is not None else None,
+            })
+
+    def write(self, event: dict):
+        if self.file is not None:
+            self.file.write(json.dumps(event) + "\n")
+            self.file.flush()
+
+    def percentile(self, name: str, model: str, q: float, min_samples: int = 1) -> Optional[float]:
+        """
+        Percentile of a histogram over the recent requests of a model, or None with fewer than `min_samples`.
+        """
+        with self.lock:
+            histogram = self.histograms.get((name, model))
+            if histogram is None or len(histogram.samples) < min_samples:
+                return None
+            return histogram.percentile(q)
+
+    def prometheus(self) -> str:
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+
+        def sample(name, labels, value):
+            label_text = ",".join(f'{key}="{label}"' for key, label in labels.items())
+            lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}")
+
+        with self.lock:
+            header("requests_total", "counter", "Model requests, by error class.")
+            for (model, lang, error), count in sorted(self.requests.items()):
+                sample("requests_total", {"model": model, "lang": lang, "error": error}, count)
+            header("tokens_total", "counter", "Tokens sent and received.")
+            for (model, kind), count in sorted(self.tokens.items()):
+                sample("tokens_total", {"model": model, "type": kind}, count)
+            header(
+                "chunks_total", "counter", "Chunks translated by the model, served from the cache, escalated, or failed."
+            )
+            for (model, lang, source), count in sorted(self.chunks.items()):
+                sample("chunks_total", {"model": model, "lang": lang, "source": source}, count)
+            header("chunk_attempts_total", "counter", "Attempts it took to translate chunks, including repairs.")
+            for (model, lang), count in sorted(self.attempts.items()):
+                sample("chunk_attempts_total", {"model": model, "lang": lang}, count)
+
+            for name, help_text in HISTOGRAMS.items():
+                header(f"{name}_seconds", "histogram", help_text)
+                for (metric_name, model), histogram in sorted(self.histograms.items()):
+                    if metric_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        sample(f"{name}_seconds_bucket", {"model": model, "le": bound}, cumulative)
+                    sample(f"{name}_seconds_bucket", {"model": model, "le": "+Inf"}, histogram.count)
+                    sample(f"{name}_seconds_sum", {"model": model}, histogram.sum)
+                    sample(f"{name}_seconds_count", {"model": model}, histogram.count)
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        with self.lock:
+            requests = sum(self.requests.values())
+            errors = Counter()
+            for (_, _, error), count in self.requests.items():
+                if error:
+                    errors[error] += count
+            chunks = Counter()
+            for (_, _, source), count in self.chunks.items():
+                chunks[source] += count
+            attempts = sum(self.attempts.values())
+
+            def percentiles(name):
+                merged = Histogram()
+                for (metric_name, _), histogram in self.histograms.items():
+                    if metric_name == name:
+                        merged.samples.extend(histogram.samples)
+                if not merged.samples:
+                    return "n/a"
+                return f"p50 {merged.percentile(0.5):.2f}s, p95 {merged.percentile(0.95):.2f}s"
+
+            failed = ", ".join(f"{error} {count}" for error, count in errors.most_common())
+            translated = chunks["model"] + chunks["failed"]
+            return "\n".join([
+                f"Requests: {requests}" + (f" ({failed})" if failed else ""),
+                f"Chunks: {chunks['model']} translated, {chunks['cache']} from cache, {chunks['failed']} failed, "
+                + (f"{chunks['escalated']} escalated to a fallback model, " if chunks["escalated"] else "") +
+                f"{attempts / translated if translated else 0:.2f} attempts per chunk",
+                f"Latency: {percentiles('latency')}. Queue wait: {percentiles('queue_wait')}. "
+                f"Time to first token: {percentiles('time_to_first_token')}",
+                f"Tokens: {sum(v for (_, kind), v in self.tokens.items() if kind == 'input')} input, "
+                f"{sum(v for (_, kind), v in self.tokens.items() if kind == 'output')} output",
+            ])
+
+    def close(self):
+        with self.lock:
+            if self.file is not None and not self.file.closed:
+                self.file.close()
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+class TranslationCache:
+    """
+    On-disk cache of translated chunks, backed by SQLite.
+
+    Entries are keyed by everything that affects the translation: the chunk text, target language, model,
+    temperature and prompt. When the total size of the stored translations goes over `max_size_bytes`,
+    the least recently used entries are evicted.
+    """
+    MODES = ("on", "read", "write", "off")
+
+    def __init__(self, path: str, max_size_bytes: int, mode: str = "on"):
+        assert mode in self.MODES, f"Unknown cache mode {mode}."
+        self.mode = mode
+        self.max_size_bytes = max_size_bytes
+        self.lock = threading.Lock()
+        self.connection = None
+        if mode != "off":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.connection = sqlite3.connect(path, check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS translations "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self.connection.commit()
+
+    @property
+    def readable(self) -> bool:
+        return self.mode in ("on", "read")
+
+    @property
+    def writable(self) -> bool:
+        return self.mode in ("on", "write")
+
+    @staticmethod
+    def make_key(text: str, lang: str, model_name: str, temperature: float, prompt: str) -> str:
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        payload = json.dumps([text, lang, model_name, temperature, prompt_hash], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.readable:
+            return None
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM translations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE translations SET accessed = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+        return row[0]
+
+    def put(self, key: str, value: str):
+        if not self.writable:
+            return
+        size = len(value.encode("utf-8"))
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO translations (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time())
+            )
+            self.evict()
+            self.connection.commit()
+
+    def evict(self):
+        total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM translations").fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+        rows = self.connection.execute("SELECT key, size FROM translations ORDER BY accessed ASC").fetchall()
+        evicted = []
+        for key, size in rows:
+            if total_size <= self.max_size_bytes:
+                break
+            evicted.append((key,))
+            total_size -= size
+        self.connection.executemany("DELETE FROM translations WHERE key = ?", evicted)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,19 @@
+from gpt_subtitle_translator.json_store import JsonStore
+
+
+class TranslationMemory(JsonStore):
+    """
+    Exact-match memory of translated subtitles, per target language.
+
+    Subtitles whose text was already translated, earlier in the same file or in earlier files of a series,
+    are not sent to the model again. When a path is given, the memory is loaded from and saved to a JSON file,
+    so it can be shared between runs.
+    """
+
+    def lookup(self, lang: str) -> dict:
+        with self.lock:
+            return dict(self.entries.get(lang, {}))
+
+    def update(self, lang: str, translations: dict):
+        with self.lock:
+            self.entries.setdefault(lang, {}).update(translations)
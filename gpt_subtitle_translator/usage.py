@@ -0,0 +1,211 @@
+import threading
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+from gpt_subtitle_translator.models.base_model import BaseModel
+
+
+class Budget(NamedTuple):
+    """
+    Spending limit of a job or of all jobs, in dollars at list prices, and in input plus output tokens.
+    None is unlimited.
+    """
+    max_cost: Optional[float] = None
+    max_tokens: Optional[int] = None
+
+
+class Usage:
+    __slots__ = ("requests", "input_tokens", "output_tokens", "cost")
+
+    def __init__(self):
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+
+    @property
+    def tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def add(self, input_tokens: int, output_tokens: int, cost: float):
+        self.requests += 1
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.cost += cost
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost": self.cost,
+        }
+
+
+class JobUsage(Usage):
+    """
+    Usage of one translation job, and the chunk tokens it has left to send and to complete,
+    which the cost of the rest of the job is projected on.
+    """
+    __slots__ = (
+        "ledger", "job_id", "lang", "budget", "pending_tokens", "running_tokens", "completed_tokens", "estimated_rates"
+    )
+
+    def __init__(self, ledger: "UsageLedger", job_id: str, lang: str, budget: Optional[Budget] = None):
+        super().__init__()
+        self.ledger = ledger
+        self.job_id = job_id
+        self.lang = lang
+        self.budget = budget
+        self.pending_tokens = 0
+        self.running_tokens = 0
+        self.completed_tokens = 0
+        self.estimated_rates = None
+
+    def start(self, num_tokens: int):
+        """
+        Set the chunk tokens the job has left to translate, when it starts.
+        """
+        with self.ledger.lock:
+            self.pending_tokens = num_tokens
+            self.running_tokens = 0
+
+    def finish(self):
+        """
+        Drop the chunks the job has left, once it's done or failed, so they no longer count towards the projected
+        spending of all jobs.
+        """
+        with self.ledger.lock:
+            self.pending_tokens = 0
+            self.running_tokens = 0
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.job_id, self.lang
+
+    @property
+    def label(self) -> str:
+        return f"{self.job_id} [{self.lang}]"
+
+    def record(self, model: BaseModel, input_tokens: int, output_tokens: int):
+        self.ledger.record(self, model, input_tokens, output_tokens)
+
+    def dispatch(self, num_tokens: int, estimated_cost: float, estimated_tokens: int):
+        """
+        Mark a chunk of `num_tokens` as sent, unless the job can't afford it along with the chunks left after it.
+
+        The cost and tokens of the chunks left are projected from those spent per chunk token on the completed chunks,
+        retries included, or from the estimates for this chunk before any completed. The spending of all jobs is
+        projected from the chunks every open job has left, each at its own rates. Raises `BudgetExceededError`
+        instead of letting the job or all jobs go over their budget.
+        """
+        with self.ledger.lock:
+            self.estimated_rates = estimated_cost / max(num_tokens, 1), estimated_tokens / max(num_tokens, 1)
+            cost_rate, token_rate = self.rates()
+            remaining = max(self.pending_tokens, num_tokens) + self.running_tokens
+            projected_cost, projected_tokens = cost_rate * remaining, token_rate * remaining
+            all_cost, all_tokens = projected_cost, projected_tokens
+            for job in self.ledger.jobs.values():
+                if job is not self and job.pending_tokens + job.running_tokens:
+                    # Jobs which haven't sent a chunk yet are assumed to cost as much as this one
+                    job_cost_rate, job_token_rate = job.rates() or (cost_rate, token_rate)
+                    all_cost += job_cost_rate * (job.pending_tokens + job.running_tokens)
+                    all_tokens += job_token_rate * (job.pending_tokens + job.running_tokens)
+            scopes = (
+                (self.budget, self, projected_cost, projected_tokens, "job"),
+                (self.ledger.budget, self.ledger.total, all_cost, all_tokens, "all jobs"),
+            )
+            for budget, spent, remaining_cost, remaining_tokens, scope in scopes:
+                if budget is None:
+                    continue
+                if budget.max_cost is not None and spent.cost + remaining_cost > budget.max_cost:
+                    raise BudgetExceededError(
+                        f"{self.label}: projected cost ${spent.cost + remaining_cost:.4f} is over the budget of "
+                        f"${budget.max_cost:.4f} for {scope}, ${spent.cost:.4f} spent."
+                    )
+                if budget.max_tokens is not None and spent.tokens + remaining_tokens > budget.max_tokens:
+                    raise BudgetExceededError(
+                        f"{self.label}: projected {spent.tokens + remaining_tokens:.0f} tokens are over the budget of "
+                        f"{budget.max_tokens} tokens for {scope}, {spent.tokens} spent."
+                    )
+            self.pending_tokens = max(0, self.pending_tokens - num_tokens)
+            self.running_tokens += num_tokens
+
+    def rates(self) -> Optional[tuple[float, float]]:
+        """
+        Cost and tokens spent per chunk token, on the completed chunks, or as estimated for the last chunk sent
+        before any completed. None before the job sent any chunk.
+        """
+        if self.completed_tokens:
+            return self.cost / self.completed_tokens, self.tokens / self.completed_tokens
+        return self.estimated_rates
+
+    def complete(self, num_tokens: int):
+        with self.ledger.lock:
+            self.running_tokens = max(0, self.running_tokens - num_tokens)
+            self.completed_tokens += num_tokens
+
+    def skip(self, num_tokens: int):
+        """
+        Drop a chunk which needs no request, such as a cached one, from the chunks left to send.
+        """
+        with self.ledger.lock:
+            self.pending_tokens = max(0, self.pending_tokens - num_tokens)
+
+
+class UsageLedger:
+    """
+    Tokens and cost of all requests, per job, per model and in total, updated atomically from all threads.
+    Jobs are kept by job id and language, so jobs translating into the same language are charged separately.
+
+    Requests are charged at the list prices of their model, without cache or batch discounts, so the totals are an
+    upper bound of the bill. With a `budget`, jobs stop sending chunks before all jobs together go over it.
+    """
+
+    def __init__(self, budget: Optional[Budget] = None):
+        self.budget = budget
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.models = defaultdict(Usage)
+        self.total = Usage()
+
+    def open_job(self, job_id: str, lang: str, budget: Optional[Budget] = None) -> JobUsage:
+        """
+        The usage of the job translating into `lang`, opened on first use. A job opened again, such as when its
+        translation is restarted, keeps adding to the same totals, which its budget is checked against.
+        """
+        with self.lock:
+            job = self.jobs.get((job_id, lang))
+            if job is None:
+                job = self.jobs[job_id, lang] = JobUsage(self, job_id, lang, budget)
+            return job
+
+    def close_job(self, job: JobUsage):
+        """
+        Drop a job from the per-job summary. Its usage stays in the per-model and global totals.
+        """
+        with self.lock:
+            self.jobs.pop(job.key, None)
+
+    def record(self, job: JobUsage, model: BaseModel, input_tokens: int, output_tokens: int):
+        cost = model.get_cost(input_tokens, output_tokens)
+        with self.lock:
+            for usage in (job, self.models[model.model_name], self.total):
+                usage.add(input_tokens, output_tokens, cost)
+
+    def summary(self) -> str:
+        def line(name: str, usage: Usage) -> str:
+            return (
+                f"{name}: {usage.requests} requests, {usage.input_tokens} input and {usage.output_tokens} output "
+                f"tokens, ${usage.cost:.5f}"
+            )
+
+        with self.lock:
+            lines = [line(f"Job {job.label}", job) for job in self.jobs.values()]
+            lines += [line(f"Model {name}", usage) for name, usage in sorted(self.models.items())]
+            lines.append(line("Total", self.total))
+        return "\n".join(lines)
+
+
+class BudgetExceededError(Exception):
+    pass
@@ -0,0 +1,93 @@
+import argparse
+import os
+
+from gpt_subtitle_translator.constants import DEFAULT_MODEL, TOKENS_PER_CHUNK, MAX_RETRIES, DEFAULT_TEMPERATURE, \
+    CACHE_PATH, CACHE_MAX_SIZE_MB, MAX_CONCURRENCY, SERVICE_PORT, SERVICE_WORKERS
+from gpt_subtitle_translator.logger import logger
+from gpt_subtitle_translator.request_scheduler import RequestScheduler
+from gpt_subtitle_translator.service import TranslationService, make_server
+from gpt_subtitle_translator.telemetry import Telemetry
+from gpt_subtitle_translator.translation_cache import TranslationCache
+from gpt_subtitle_translator.translation_memory import TranslationMemory
+from gpt_subtitle_translator.usage import UsageLedger, Budget
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve translations over HTTP, from a queue of jobs.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help='Port to listen on.')
+    parser.add_argument('--socket', type=str, default=None, help='Unix socket to listen on, instead of a port.')
+    parser.add_argument('-m', '--model', type=str, default=DEFAULT_MODEL, help='Model of jobs which do not set one.')
+    parser.add_argument('-w', '--workers', type=int, default=SERVICE_WORKERS, help='Number of jobs translated at once.')
+    parser.add_argument('-t', '--threads', type=int, default=4, help='Number of concurrent requests, across all jobs.')
+    parser.add_argument('-temp', '--temperature', type=float, default=DEFAULT_TEMPERATURE, help='Temperature for generation.')
+    parser.add_argument('-s', '--chunk_size', type=int, default=TOKENS_PER_CHUNK, help='Number of tokens per chunk.')
+    parser.add_argument('-r', '--retries', type=int, default=MAX_RETRIES, help='Number of retries.')
+    parser.add_argument('--cache', type=str, default='on', choices=TranslationCache.MODES,
+                        help='Read and write translated chunks to the cache, only read, only write, or bypass it.')
+    parser.add_argument('--cache_path', type=str, default=CACHE_PATH, help='Path of the cache database.')
+    parser.add_argument('--cache_size', type=int, default=CACHE_MAX_SIZE_MB, help='Maximum cache size in MB.')
+    parser.add_argument('--memory', type=str, default=None,
+                        help='Translation memory file, to reuse translations of repeated subtitles across jobs.')
+    parser.add_argument('--adaptive', action='store_true',
+                        help=f'Grow concurrency until the provider rate limits requests, up to {MAX_CONCURRENCY}. Ignores -t.')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream responses, and abort them early when stuck in a loop or running too long.')
+    parser.add_argument('--deadline', type=float, default=None,
+                        help='Seconds each job may take, it fails and stops sending requests after that.')
+    parser.add_argument('--telemetry', type=str, default=None,
+                        help='Append per-request and per-chunk metrics to this file, as JSON lines.')
+    parser.add_argument('--budget', type=float, default=None,
+                        help='Dollars each job may spend, it stops before the projected cost goes over.')
+    parser.add_argument('--total_budget', type=float, default=None,
+                        help='Dollars all jobs together may spend while the service runs.')
+    parser.add_argument('--rpm', type=int, default=None, help='Maximum requests per minute.')
+    parser.add_argument('--tpm', type=int, default=None, help='Maximum tokens per minute.')
+
+    args = parser.parse_args()
+
+    cache = TranslationCache(os.path.expanduser(args.cache_path), args.cache_size * 1024 * 1024, args.cache)
+    memory = TranslationMemory(args.memory)
+    telemetry = Telemetry(args.telemetry)
+    scheduler = RequestScheduler(
+        max_concurrency=MAX_CONCURRENCY if args.adaptive else args.threads,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        adaptive=args.adaptive
+    )
+    service = TranslationService(
+        default_model=args.model,
+        workers=args.workers,
+        scheduler=scheduler,
+        cache=cache,
+        memory=memory,
+        telemetry=telemetry,
+        ledger=UsageLedger(Budget(args.total_budget) if args.total_budget is not None else None),
+        translator_options={
+            "tokens_per_chunk": args.chunk_size,
+            "temperature": args.temperature,
+            "max_retries": args.retries,
+            "stream": args.stream,
+            "deadline": args.deadline,
+            "budget": Budget(args.budget) if args.budget is not None else None,
+        }
+    )
+    server = make_server(service, args.host, args.port, args.socket)
+    service.start()
+    logger.info(f"Serving on {args.socket or f'http://{args.host}:{server.server_address[1]}'}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        cache.close()
+        memory.save()
+        telemetry.close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == '__main__':
+    main()
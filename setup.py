@@ -10,7 +10,7 @@ setup(
     author='stri8ed',
     packages=find_packages(exclude=["tests", "tests.*"]),
     package_data={
-        'gpt_subtitle_translator': ['prompt.txt']
+        'gpt_subtitle_translator': ['prompt.txt', 'prompt_compact.txt', 'prompt_multi.txt']
     },
     include_package_data=True,
     install_requires=requirements
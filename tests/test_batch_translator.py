@@ -0,0 +1,191 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+
+from gpt_subtitle_translator.batch_translator import BatchJob, translate_batch
+from gpt_subtitle_translator.fanout import LanguageFanout
+from gpt_subtitle_translator.request_scheduler import RequestScheduler
+from gpt_subtitle_translator.subtitle_processor import SubtitleProcessor
+from gpt_subtitle_translator.subtitle_translator import SubtitleTranslator
+
+SRT_CONTENT = "1\n00:00:01,000 --> 00:00:04,000\nHola\n\n2\n00:00:05,000 --> 00:00:08,000\nAdios\n"
+TRANSLATIONS = {"French": ("Bonjour", "Au revoir"), "German": ("Hallo", "Tschüss")}
+
+
+def make_model():
+    model = MagicMock()
+    model.num_tokens_from_string.return_value = 5
+    model.num_tokens_from_strings.side_effect = lambda strings: [5] * len(strings)
+    model.max_output_tokens.return_value = 1000
+    return model
+
+
+def expected_srt(lang):
+    first, second = TRANSLATIONS[lang]
+    return f"1\n00:00:01,000 --> 00:00:04,000\n{first}\n\n2\n00:00:05,000 --> 00:00:08,000\n{second}"
+
+
+class TestBatchTranslator(unittest.TestCase):
+    def test_translate_batch_shares_scheduler(self):
+        model = MagicMock()
+        model.num_tokens_from_string.return_value = 5
+        model.num_tokens_from_strings.side_effect = lambda strings: [5] * len(strings)
+        model.max_output_tokens.return_value = 1000
+        in_flight = []
+        peak = []
+
+        async def generate(prompt, temperature, instructions=""):
+            in_flight.append(prompt)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.remove(prompt)
+            return ("<1>Hello</1>", 5) if "<1>" in prompt else ("<2>Goodbye</2>", 5)
+
+        model.agenerate_completion.side_effect = generate
+        scheduler = RequestScheduler(2, adaptive=False)
+        srt_content = "1\n00:00:01,000 --> 00:00:04,000\nHola\n\n2\n00:00:05,000 --> 00:00:08,000\nAdios\n"
+        jobs = [
+            BatchJob(f"episode {i}", SubtitleTranslator(model, "English", tokens_per_chunk=6, scheduler=scheduler),
+                     srt_content)
+            for i in range(3)
+        ]
+
+        results = asyncio.run(translate_batch(jobs))
+
+        expected = "1\n00:00:01,000 --> 00:00:04,000\nHello\n\n2\n00:00:05,000 --> 00:00:08,000\nGoodbye"
+        self.assertEqual(results, [expected] * 3)
+        self.assertEqual(model.agenerate_completion.call_count, 6)
+        self.assertEqual(max(peak), 2)
+
+    def test_translate_batch_returns_errors(self):
+        model = MagicMock()
+        model.num_tokens_from_string.return_value = 5
+        model.num_tokens_from_strings.side_effect = lambda strings: [5] * len(strings)
+        jobs = [BatchJob("broken", SubtitleTranslator(model, "English"), "not an srt file")]
+        results = asyncio.run(translate_batch(jobs))
+        self.assertIsInstance(results[0], Exception)
+
+    def test_languages_share_parsing_and_chunking(self):
+        model = make_model()
+
+        async def generate(prompt, temperature, instructions=""):
+            lang = "French" if "French" in instructions else "German"
+            return f"<1>{TRANSLATIONS[lang][0]}</1>\n<2>{TRANSLATIONS[lang][1]}</2>", 5
+
+        model.agenerate_completion.side_effect = generate
+        scheduler = RequestScheduler(2, adaptive=False)
+        jobs = [
+            BatchJob(lang, SubtitleTranslator(model, lang, tokens_per_chunk=100, scheduler=scheduler), SRT_CONTENT)
+            for lang in TRANSLATIONS
+        ]
+
+        with patch.object(SubtitleProcessor, "parse_srt", autospec=True, side_effect=SubtitleProcessor.parse_srt) \
+                as parse_srt, patch.object(SubtitleProcessor, "chunk_subtitles", autospec=True,
+                                           side_effect=SubtitleProcessor.chunk_subtitles) as chunk_subtitles:
+            results = asyncio.run(translate_batch(jobs))
+
+        self.assertEqual(results, [expected_srt("French"), expected_srt("German")])
+        self.assertEqual(parse_srt.call_count, 1)
+        self.assertEqual(chunk_subtitles.call_count, 1)
+        self.assertEqual(model.agenerate_completion.call_count, 2)
+
+    def test_languages_per_request(self):
+        model = make_model()
+        prompts = []
+
+        async def generate(prompt, temperature, instructions=""):
+            prompts.append(prompt)
+            ids = [i for i in (1, 2) if f"<{i}>" in prompt]
+            return "\n\n".join(
+                f"### {lang}\n" + "\n".join(f"<{i}>{TRANSLATIONS[lang][i - 1]}</{i}>" for i in ids)
+                for lang in TRANSLATIONS
+            ), 10
+
+        model.agenerate_completion.side_effect = generate
+        scheduler = RequestScheduler(2, adaptive=False)
+        jobs = [
+            BatchJob(lang, SubtitleTranslator(model, lang, tokens_per_chunk=6, scheduler=scheduler), SRT_CONTENT)
+            for lang in TRANSLATIONS
+        ]
+
+        results = asyncio.run(translate_batch(jobs, languages_per_request=2))
+
+        self.assertEqual(results, [expected_srt("French"), expected_srt("German")])
+        self.assertEqual(len(prompts), 2)
+        self.assertTrue(all("French, German" in prompt for prompt in prompts))
+
+    def test_grouped_request_falls_back_per_language(self):
+        model = make_model()
+        prompts = []
+
+        async def generate(prompt, temperature, instructions=""):
+            prompts.append(instructions)
+            if "French, German" in prompt:
+                return "### French\n<1>Bonjour</1>\n<2>Au revoir</2>\n\n### German\n<1>Hallo</1>", 10
+            return "<1>Hallo</1>\n<2>Tschüss</2>", 5
+
+        model.agenerate_completion.side_effect = generate
+        jobs = [BatchJob(lang, SubtitleTranslator(model, lang, tokens_per_chunk=100), SRT_CONTENT) for lang in TRANSLATIONS]
+
+        results = asyncio.run(translate_batch(jobs, languages_per_request=2))
+
+        self.assertEqual(results, [expected_srt("French"), expected_srt("German")])
+        self.assertEqual(len(prompts), 2)
+        self.assertIn("Translate movie subtitles to German", prompts[1])
+
+    def test_grouped_response_is_validated_per_language(self):
+        srt_content = "".join(f"{i}\n00:00:0{i},000 --> 00:00:0{i},500\nLinea {i}\n\n" for i in range(1, 6))
+        model = make_model()
+        prompts = []
+        grouped_tokens = [10]
+
+        async def generate(prompt, temperature, instructions=""):
+            prompts.append(prompt)
+            if "French, German" in prompt:
+                french = "\n".join(f"<{i}>Ligne {i}</{i}>" for i in (1, 2, 3, 5))
+                german = "\n".join(f"<{i}>Zeile {i}</{i}>" for i in range(1, 6))
+                return f"### French\n{french}\n\n### German\n{german}", grouped_tokens[0]
+            return "\n".join(f"<{i}>Ligne {i}</{i}>" for i in range(1, 6)), 5
+
+        model.agenerate_completion.side_effect = generate
+        jobs = [
+            BatchJob(lang, SubtitleTranslator(model, lang, tokens_per_chunk=100), srt_content)
+            for lang in ("French", "German")
+        ]
+
+        results = asyncio.run(translate_batch(jobs, languages_per_request=2))
+
+        self.assertIn("Ligne 4", results[0])
+        self.assertIn("Zeile 5", results[1])
+        # The missing subtitle is repaired on its own, instead of translating the whole chunk again
+        self.assertEqual(len(prompts), 2)
+        self.assertNotIn("<1>Linea 1</1>", prompts[1])
+
+        # A response at the output limit may be cut short, so no language is taken from it
+        grouped_tokens[0] = model.max_output_tokens()
+        prompts.clear()
+        results = asyncio.run(translate_batch([
+            BatchJob(lang, SubtitleTranslator(model, lang, tokens_per_chunk=100), srt_content)
+            for lang in ("French", "German")
+        ], languages_per_request=2))
+
+        self.assertEqual(len(prompts), 3)
+
+    def test_group_fits_output_limit(self):
+        model = make_model()
+        model.max_output_tokens.return_value = 50
+        fanout = LanguageFanout(SRT_CONTENT, languages_per_request=4)
+        translators = [SubtitleTranslator(model, lang) for lang in ("French", "German", "Italian", "Spanish")]
+        for translator in translators:
+            fanout.join(translator)
+            translator.prepare(SRT_CONTENT, fanout)
+        chunk = fanout.chunks[next(iter(fanout.chunks))][0]
+
+        self.assertEqual(chunk.num_tokens, 12)
+        self.assertEqual(fanout.group_of(translators[3], chunk), translators[2:])
+        model.max_output_tokens.return_value = 10
+        self.assertEqual(fanout.group_of(translators[3], chunk), [translators[3]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from gpt_subtitle_translator.chunk_sizer import ChunkSizer
+from gpt_subtitle_translator.models.mock_model import MockModel
+from gpt_subtitle_translator.subtitle_translator import SubtitleTranslator
+
+
+class TestChunkSizer(unittest.TestCase):
+    def test_learns_and_persists_ratio(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "chunk_sizes.json")
+            sizer = ChunkSizer(path)
+            self.assertIsNone(sizer.chunk_size("mock", "French", 4000))
+
+            sizer.observe("mock", "French", 1000, 1000)
+            sizer.observe("mock", "French", 1000, 1500)
+            self.assertAlmostEqual(sizer.ratio("mock", "French"), 1.25)
+            sizer.save()
+
+            loaded = ChunkSizer(path)
+            self.assertEqual(loaded.chunk_size("mock", "French", 4000), sizer.chunk_size("mock", "French", 4000))
+            self.assertIsNone(loaded.ratio("mock", "German"))
+
+    def test_resizes_chunks_after_first(self):
+        srt_content = "".join(f"{i}\n00:00:01,000 --> 00:00:02,000\nLine number {i}\n\n" for i in range(1, 201))
+        model = MockModel(max_tokens=1000)
+        sizer = ChunkSizer()
+        translator = SubtitleTranslator(model, "English", tokens_per_chunk=50, sizer=sizer)
+        num_chunks = len(translator.prepare(srt_content).chunks)
+
+        result = translator.translate_subtitles(srt_content)
+
+        self.assertEqual(result.count("Line number"), 200)
+        self.assertIsNotNone(sizer.ratio("mock", "English"))
+        self.assertGreater(num_chunks, 10)
+        self.assertLessEqual(model.request_count, 6)
+
+    def test_splits_chunk_with_response_too_long(self):
+        translator = SubtitleTranslator(MockModel(max_tokens=20), "English", max_retries=2, sizer=ChunkSizer())
+        chunk = translator.processor.make_chunks("\n".join(f"<{i}>Line {i}</{i}>" for i in range(1, 9)), 1000)[0]
+
+        _, response, attempts = translator.translate_chunk(chunk, threading.Event(), 0)
+
+        self.assertEqual(response, {i: f"Line {i}" for i in range(1, 9)})
+        self.assertEqual(attempts, 2)
+        self.assertEqual(translator.model.request_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
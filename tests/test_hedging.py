@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from gpt_subtitle_translator.hedging import HedgePolicy
+from gpt_subtitle_translator.models.mock_model import MockModel
+from gpt_subtitle_translator.subtitle_processor import Chunk
+from gpt_subtitle_translator.subtitle_translator import SubtitleTranslator
+from gpt_subtitle_translator.telemetry import Telemetry
+
+
+def make_translator(latency: float, budget: float = 1.0) -> SubtitleTranslator:
+    telemetry = Telemetry()
+    for _ in range(10):
+        telemetry.histograms[("latency", "slow")].observe(0.01)
+    hedging = HedgePolicy(MockModel(model_name="fast"), min_samples=10, budget=budget)
+    return SubtitleTranslator(MockModel(model_name="slow", latency=latency), "English", num_threads=2,
+                              telemetry=telemetry, hedging=hedging)
+
+
+class TestHedging(unittest.TestCase):
+    def setUp(self):
+        self.chunk = SubtitleTranslator(MockModel(), "English").processor.make_chunks(
+            "<1>Hello</1>\n<2>World</2>", 1000
+        )[0]
+
+    def test_hedged_request_wins(self):
+        translator = make_translator(latency=0.5)
+        start = time.perf_counter()
+        _, response, _ = translator.translate_chunk(self.chunk, threading.Event(), 0)
+
+        self.assertLess(time.perf_counter() - start, 0.4)
+        self.assertEqual(response, {1: "Hello", 2: "World"})
+        self.assertEqual((translator.hedging.hedge_count, translator.hedging.win_count), (1, 1))
+
+    def test_hedged_request_wins_async(self):
+        translator = make_translator(latency=0.5)
+        start = time.perf_counter()
+        _, response, _ = asyncio.run(translator.translate_chunk_async(self.chunk, 0))
+
+        self.assertLess(time.perf_counter() - start, 0.4)
+        self.assertEqual(response, {1: "Hello", 2: "World"})
+        self.assertEqual(translator.hedging.win_count, 1)
+
+    def test_budget_caps_hedging(self):
+        translator = make_translator(latency=0.1, budget=0)
+        _, response, _ = translator.translate_chunk(self.chunk, threading.Event(), 0)
+
+        self.assertEqual(response, {1: "Hello", 2: "World"})
+        self.assertEqual(translator.hedging.hedge_count, 0)
+        self.assertEqual(translator.hedging.model.request_count, 0)
+
+    def test_largest_chunks_first(self):
+        translator = SubtitleTranslator(MockModel(), "English", largest_first=True)
+        chunks = [Chunk("", num_tokens, idx) for idx, num_tokens in enumerate([10, 50, 5, 30])]
+
+        self.assertEqual([chunk.idx for chunk in translator.schedule(chunks)], [1, 3, 0, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import tempfile
+import unittest
+
+from gpt_subtitle_translator.job_journal import JobJournal
+
+
+class TestJobJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "job.journal.jsonl")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_resume(self):
+        journal = JobJournal(self.path)
+        journal.record((1, 2), ("Hola", "Adios"), {1: "Hello"})
+        journal.close()
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write('{"key": "trunc')
+
+        resumed = JobJournal(self.path, resume=True)
+        self.assertEqual(resumed.lookup((1, 2), ("Hola", "Adios")), {1: "Hello"})
+        self.assertEqual(resumed.lookup((1,), ("Hello",)), {})
+        resumed.close(remove=True)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_starts_fresh_without_resume(self):
+        journal = JobJournal(self.path)
+        journal.record((1,), ("Hola",), {1: "Hello"})
+        journal.close()
+
+        fresh = JobJournal(self.path)
+        self.assertEqual(fresh.lookup((1,), ("Hola",)), {})
+        fresh.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
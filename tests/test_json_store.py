@@ -0,0 +1,34 @@
+import os
+import tempfile
+import unittest
+
+from gpt_subtitle_translator.translation_memory import TranslationMemory
+
+
+class TestJsonStore(unittest.TestCase):
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "memory", "memory.json")
+            memory = TranslationMemory(path)
+            memory.update("French", {"Hello": "Bonjour"})
+            memory.save()
+
+            self.assertEqual(os.listdir(os.path.dirname(path)), ["memory.json"])
+            self.assertEqual(TranslationMemory(path).lookup("French"), {"Hello": "Bonjour"})
+
+    def test_corrupt_file_is_empty(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "memory.json")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write('{"French": {"Hel')
+
+            memory = TranslationMemory(path)
+            self.assertEqual(memory.lookup("French"), {})
+
+            memory.update("French", {"Hello": "Bonjour"})
+            memory.save()
+            self.assertEqual(TranslationMemory(path).lookup("French"), {"Hello": "Bonjour"})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import unittest
+
+from gpt_subtitle_translator.models.mock_model import MockModel
+from gpt_subtitle_translator.request_scheduler import RateLimitError
+from gpt_subtitle_translator.subtitle_translator import SubtitleTranslator, MissingSubtitlesError, \
+    ResponseRepetitiveError, RefuseToTranslateError
+
+PROMPT = "\n".join(f"<{i}>Line {i}</{i}>" for i in range(1, 6))
+
+
+class TestMockModel(unittest.TestCase):
+    def test_echoes_subtitles(self):
+        model = MockModel()
+        text, num_tokens = model.generate_completion(PROMPT + "\n\nEND", 0.3)
+        self.assertEqual(text, PROMPT)
+        self.assertEqual(num_tokens, model.num_tokens_from_string(PROMPT))
+        self.assertEqual(asyncio.run(model.agenerate_completion(PROMPT, 0.3)), (text, num_tokens))
+
+    def test_injected_failures(self):
+        translator = SubtitleTranslator(MockModel(), "English")
+        chunk = translator.processor.make_chunks(PROMPT, 1000)[0]
+        expected = {
+            "skip": MissingSubtitlesError, "merge": MissingSubtitlesError, "loop": ResponseRepetitiveError,
+            "refusal": RefuseToTranslateError, "rate_limit": RateLimitError,
+        }
+        for mode, error in expected.items():
+            translator.model = MockModel(failure_rates={mode: 1})
+            with self.assertRaises(error, msg=mode):
+                text, num_tokens = translator.model.generate_completion(PROMPT, 0.3)
+                translator.process_response(chunk, text, num_tokens, {})
+
+    def test_deterministic(self):
+        first = MockModel(failure_rates={"skip": 0.5}, seed=1)
+        second = MockModel(failure_rates={"skip": 0.5}, seed=1)
+        responses = [first.generate_completion(PROMPT, 0.3) for _ in range(10)]
+        self.assertEqual(responses, [second.generate_completion(PROMPT, 0.3) for _ in range(10)])
+        self.assertEqual(first.failure_counts, second.failure_counts)
+        self.assertGreater(first.failure_counts["skip"], 0)
+
+    def test_translator_recovers_from_failures(self):
+        model = MockModel(failure_rates={"skip": 0.2, "merge": 0.2, "loop": 0.1}, seed=3)
+        translator = SubtitleTranslator(model, "English", max_retries=10)
+        chunk = translator.processor.make_chunks(PROMPT, 1000)[0]
+
+        _, response, _ = translator.translate_chunk(chunk, threading.Event(), 0)
+
+        self.assertEqual(response, {i: f"Line {i}" for i in range(1, 6)})
+
+    def test_translator_with_compact_ids(self):
+        model = MockModel(failure_rates={"skip": 0.3, "loop": 0.1}, seed=2)
+        translator = SubtitleTranslator(model, "English", max_retries=10, compact_ids=True)
+        chunk = translator.processor.make_chunks("\n".join(f"<{i}>Line {i}</{i}>" for i in range(50, 60)), 1000)[0]
+
+        _, response, _ = translator.translate_chunk(chunk, threading.Event(), 0)
+
+        self.assertEqual(response, {i: f"Line {i}" for i in range(50, 60)})
+        self.assertIn("1|Line 50\n2|Line 51", "".join(model.sent))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from gpt_subtitle_translator.models import registry
+from gpt_subtitle_translator.models.mock_model import MockModel
+from gpt_subtitle_translator.models.token_ratios import TokenRatioCache
+from gpt_subtitle_translator.request_scheduler import TransientError
+
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+
+class TestModelRegistry(unittest.TestCase):
+    def test_resolves_providers(self):
+        self.assertIsInstance(registry.get_model("mock"), MockModel)
+        self.assertEqual(registry.get_model_class("gpt-4o-mini").__name__, "GPT")
+        self.assertEqual(registry.get_model_class("gemini-2.0-flash-001").__name__, "Gemini")
+        self.assertEqual(registry.get_model_class("anthropic.claude-3-haiku-20240307-v1:0").__name__, "Claude")
+        self.assertEqual(registry.get_model_class("some-other-model").__name__, "Claude")
+
+    def test_register(self):
+        with patch.dict(registry.PROVIDERS):
+            registry.register("local-", "gpt_subtitle_translator.models.mock_model:MockModel")
+            model = registry.get_model("local-echo")
+        self.assertIsInstance(model, MockModel)
+        self.assertEqual(model.model_name, "local-echo")
+
+    def test_imports_only_selected_provider(self):
+        code = (
+            "import sys, translate\n"
+            "from gpt_subtitle_translator.models.registry import get_model\n"
+            "get_model('mock')\n"
+            "print(sorted(m for m in ('openai', 'anthropic', 'google.genai') if m in sys.modules))"
+        )
+        env = {key: value for key, value in os.environ.items() if key != "OPENAI_API_KEY"}
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        result = subprocess.run([sys.executable, "-c", code], cwd=root, env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+
+class TestTokenRatioCache(unittest.TestCase):
+    def test_persists_latest_ratios(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "token_ratios.json")
+            cache = TokenRatioCache(path, max_entries=2)
+            for i in range(3):
+                cache.put(cache.make_key("model", f"text {i}"), i / 10)
+
+            loaded = TokenRatioCache(path)
+            self.assertIsNone(loaded.get(loaded.make_key("model", "text 0")))
+            self.assertEqual(loaded.get(loaded.make_key("model", "text 2")), 0.2)
+
+    def test_gemini_counts_each_text_once(self):
+        from gpt_subtitle_translator.models.gemini import Gemini
+
+        cache = TokenRatioCache()
+        with patch.object(Gemini, "_get_token_count", return_value=25) as count:
+            for _ in range(2):
+                model = Gemini(token_ratios=cache)
+                model.init_vocab("x" * 100)
+        self.assertEqual(count.call_count, 1)
+        self.assertEqual(model.num_tokens_from_string("x" * 40), 10)
+
+    def test_gemini_cached_content(self):
+        from gpt_subtitle_translator.models import gemini
+
+        model = gemini.Gemini(token_ratios=TokenRatioCache())
+        model.average_tokens_per_char = 0.25
+        model.client = MagicMock()
+        model.client.caches.create.side_effect = lambda **kwargs: SimpleNamespace(
+            name=f"cache {model.client.caches.create.call_count}"
+        )
+        long_instructions = "x" * 4 * model.params["min_cached_tokens"]
+
+        # Too short to be cached
+        self.assertIsNone(model._get_cached_content("x" * 100))
+        model.client.caches.create.assert_not_called()
+
+        with patch.object(gemini.time, "monotonic", return_value=1000):
+            first = model._get_cached_content(long_instructions)
+            self.assertEqual(model._get_cached_content(long_instructions), first)
+        # Recreated before it expires
+        with patch.object(gemini.time, "monotonic", return_value=1000 + gemini.CACHED_CONTENT_TTL - 30):
+            self.assertNotEqual(model._get_cached_content(long_instructions), first)
+        self.assertEqual(model.client.caches.create.call_count, 2)
+
+        # Dropped once the provider no longer finds it
+        error = gemini.errors.ClientError(404, {"error": {"message": "CachedContent not found"}})
+        self.assertIsInstance(model._handle_error(error, long_instructions), TransientError)
+        self.assertNotIn(long_instructions, model.cached_contents)
+
+
+if __name__ == '__main__':
+    unittest.main()
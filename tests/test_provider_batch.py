@@ -0,0 +1,158 @@
+import json
+import os
+import re
+import threading
+import unittest
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from gpt_subtitle_translator.models.gpt import GPT
+from gpt_subtitle_translator.subtitle_translator import SubtitleTranslator
+
+
+class FakeBatchServer(ThreadingHTTPServer):
+    """
+    Minimal stand-in for the OpenAI files and batches endpoints. Requests are "translated" by prefixing each subtitle,
+    and the subtitles listed in `drop_once` are left out of the first batch that contains them.
+    """
+
+    def __init__(self, drop_once=()):
+        super().__init__(("127.0.0.1", 0), FakeBatchHandler)
+        self.files = {}
+        self.batches = {}
+        self.drop_once = set(drop_once)
+        self.submitted = []
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def complete(self, request):
+        prompt = request["body"]["messages"][0]["content"]
+        subtitles = prompt.split("START")[-1]
+        lines = []
+        for id_, text in re.findall(r"^<(\d+)>(.*?)</\1>$", subtitles, re.DOTALL | re.MULTILINE):
+            if id_ in self.drop_once:
+                self.drop_once.remove(id_)
+                continue
+            lines.append(f"<{id_}>[fr] {text}</{id_}>")
+        body = {
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": request["body"]["model"],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "\n".join(lines)}}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 10 * len(lines), "total_tokens": 100 + 10 * len(lines)},
+        }
+        return {"id": "req-1", "custom_id": request["custom_id"], "error": None,
+                "response": {"status_code": 200, "request_id": "req-1", "body": body}}
+
+
+class FakeBatchHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def batch_object(self, batch_id):
+        batch = self.server.batches[batch_id]
+        return {
+            "id": batch_id, "object": "batch", "endpoint": "/v1/chat/completions", "completion_window": "24h",
+            "input_file_id": batch["input_file_id"], "created_at": 0, "status": batch["status"],
+            "output_file_id": batch["output_file_id"] if batch["status"] == "completed" else None,
+        }
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path == "/v1/files":
+            message = BytesParser().parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body
+            )
+            content = next(part.get_payload(decode=True) for part in message.get_payload()
+                           if part.get_filename())
+            file_id = f"file-{len(self.server.files) + 1}"
+            self.server.files[file_id] = content.decode("utf-8")
+            return self.send_json({"id": file_id, "object": "file", "bytes": len(content), "created_at": 0,
+                                   "filename": "batch.jsonl", "purpose": "batch", "status": "processed"})
+        if self.path == "/v1/batches":
+            payload = json.loads(body)
+            requests = [json.loads(line) for line in self.server.files[payload["input_file_id"]].splitlines()]
+            self.server.submitted.append(requests)
+            output = "\n".join(json.dumps(self.server.complete(request)) for request in requests)
+            output_file_id = f"file-{len(self.server.files) + 1}"
+            self.server.files[output_file_id] = output
+            batch_id = f"batch-{len(self.server.batches) + 1}"
+            self.server.batches[batch_id] = {
+                "input_file_id": payload["input_file_id"], "output_file_id": output_file_id, "status": "in_progress"
+            }
+            return self.send_json(self.batch_object(batch_id))
+        self.send_error(404)
+
+    def do_GET(self):
+        match = re.match(r"^/v1/batches/([\w-]+)$", self.path)
+        if match:
+            response = self.batch_object(match.group(1))
+            self.server.batches[match.group(1)]["status"] = "completed"
+            return self.send_json(response)
+        match = re.match(r"^/v1/files/([\w-]+)/content$", self.path)
+        if match:
+            data = self.server.files[match.group(1)].encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/jsonl")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            return self.wfile.write(data)
+        self.send_error(404)
+
+
+class TestProviderBatch(unittest.TestCase):
+    def setUp(self):
+        self.srt_content = "".join(
+            f"{i}\n00:00:0{i},000 --> 00:00:0{i},500\nLine {i}\n\n" for i in range(1, 7)
+        )
+
+    def run_server(self, server):
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+    def make_translator(self, server):
+        model = GPT("gpt-4o-mini", params={"base_url": server.base_url, "max_retries": 0})
+        patcher = patch.object(model, "num_tokens_from_strings", side_effect=lambda strings: [10] * len(strings))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return model, SubtitleTranslator(model, "French", tokens_per_chunk=22, max_retries=2, partial_repair=False)
+
+    def test_translate_subtitles_batch(self):
+        server = FakeBatchServer()
+        self.run_server(server)
+        model, translator = self.make_translator(server)
+
+        result = translator.translate_subtitles_batch(self.srt_content, poll_interval=0)
+
+        self.assertEqual(len(server.submitted), 1)
+        self.assertEqual(len(server.submitted[0]), 3)
+        self.assertIn("00:00:06,000 --> 00:00:06,500\n[fr] Line 6", result)
+        self.assertGreater(model.get_total_cost(), 0)
+
+    def test_failed_chunks_go_into_follow_up_batch(self):
+        server = FakeBatchServer(drop_once={"3"})
+        self.run_server(server)
+        _, translator = self.make_translator(server)
+
+        result = translator.translate_subtitles_batch(self.srt_content, poll_interval=0)
+
+        self.assertEqual(len(server.submitted), 2)
+        self.assertEqual([request["custom_id"] for request in server.submitted[1]], ["1"])
+        self.assertIn("00:00:03,000 --> 00:00:03,500\n[fr] Line 3", result)
+
+
+if __name__ == '__main__':
+    unittest.main()
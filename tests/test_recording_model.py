@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+from gpt_subtitle_translator.models.mock_model import MockModel
+from gpt_subtitle_translator.models.recording_model import RecordingModel, CassetteMissError
+from gpt_subtitle_translator.request_scheduler import RateLimitError
+from gpt_subtitle_translator.subtitle_translator import SubtitleTranslator, RefuseToTranslateError
+
+SRT_CONTENT = "1\n00:00:01,000 --> 00:00:04,000\nHola\n\n2\n00:00:05,000 --> 00:00:08,000\nAdios\n"
+
+
+class TestRecordingModel(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "cassette.jsonl")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_replays_translation_offline(self):
+        mock = MockModel(failure_rates={"skip": 0.5}, seed=6)
+        recorder = RecordingModel(mock, self.path)
+        expected = SubtitleTranslator(recorder, "English", max_retries=1).translate_subtitles(SRT_CONTENT)
+        recorder.close()
+        self.assertEqual(mock.failure_counts["skip"], 1)
+
+        offline = MockModel(failure_rates={"refusal": 1})
+        player = RecordingModel(offline, self.path, "replay", latency_scale=0)
+        result = SubtitleTranslator(player, "English", max_retries=1).translate_subtitles(SRT_CONTENT)
+
+        self.assertEqual(result, expected)
+        self.assertEqual(offline.request_count, 0)
+        self.assertEqual(player.total_output_tokens, recorder.total_output_tokens)
+        self.assertEqual(player.get_total_cost(), 0.0)
+
+    def test_replays_shuffled_retries_without_model(self):
+        class RefusingModel(MockModel):
+            def generate_completion(self, prompt, temperature, instructions="", timeout=None):
+                if self.request_count < 2:
+                    self.request_count += 1
+                    raise RefuseToTranslateError("No")
+                return super().generate_completion(prompt, temperature, instructions, timeout)
+
+        srt_content = "".join(f"{i}\n00:00:{i:02},000 --> 00:00:{i:02},500\nLine {i}\n\n" for i in range(1, 21))
+        recorder = RecordingModel(RefusingModel(), self.path)
+        translator = SubtitleTranslator(recorder, "English", max_retries=2, retry_on_refusal=True)
+        expected = translator.translate_subtitles(srt_content)
+        recorder.close()
+
+        for _ in range(2):
+            player = RecordingModel(None, self.path, "replay", latency_scale=0, model_name="mock")
+            translator = SubtitleTranslator(player, "English", max_retries=2, retry_on_refusal=True)
+            self.assertEqual(translator.translate_subtitles(srt_content), expected)
+            self.assertEqual(player.max_output_tokens(), 4096)
+
+    def test_replays_errors(self):
+        recorder = RecordingModel(MockModel(failure_rates={"rate_limit": 1}), self.path)
+        with self.assertRaises(RateLimitError):
+            recorder.generate_completion("<1>Hola</1>", 0.3)
+        recorder.close()
+
+        player = RecordingModel(MockModel(), self.path, "replay", latency_scale=0)
+        with self.assertRaises(RateLimitError):
+            player.generate_completion("<1>Hola</1>", 0.3)
+        with self.assertRaises(CassetteMissError):
+            player.generate_completion("<1>Hola</1>", 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from gpt_subtitle_translator.request_scheduler import RequestScheduler, RateLimitError, TransientError, \
+    RequestCancelledError
+
+
+class TestRequestScheduler(unittest.TestCase):
+    def test_concurrency_limit(self):
+        scheduler = RequestScheduler(2, adaptive=False)
+        _, first = scheduler.try_acquire(10)
+        _, second = scheduler.try_acquire(10)
+        wait, third = scheduler.try_acquire(10)
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertIsNone(third)
+        self.assertIsNone(wait)
+        scheduler.release(first)
+        _, third = scheduler.try_acquire(10)
+        self.assertIsNotNone(third)
+
+    def test_adaptive_increase_and_decrease(self):
+        scheduler = RequestScheduler(8)
+        self.assertEqual(scheduler.concurrency, 1)
+        for _ in range(10):
+            _, slot = scheduler.try_acquire(10)
+            scheduler.release(slot, 20)
+        grown = scheduler.concurrency
+        self.assertGreater(grown, 1)
+        _, slot = scheduler.try_acquire(10)
+        scheduler.release(slot, rate_limited=True)
+        self.assertLess(scheduler.concurrency, grown)
+
+    def test_tokens_per_minute(self):
+        scheduler = RequestScheduler(10, adaptive=False, tokens_per_minute=100)
+        _, slot = scheduler.try_acquire(80)
+        scheduler.release(slot, 80)
+        wait, slot = scheduler.try_acquire(40)
+        self.assertIsNone(slot)
+        self.assertGreater(wait, 1)
+
+    def test_requests_per_minute(self):
+        scheduler = RequestScheduler(10, adaptive=False, requests_per_minute=1)
+        _, slot = scheduler.try_acquire(1)
+        scheduler.release(slot)
+        _, slot = scheduler.try_acquire(1)
+        self.assertIsNone(slot)
+
+    @patch("gpt_subtitle_translator.request_scheduler.time.sleep")
+    def test_run_retries_rate_limit_and_transient_errors(self, _):
+        scheduler = RequestScheduler(4, base_backoff=0)
+        call = MagicMock(side_effect=[RateLimitError("429"), TransientError("503"), ("<1>Hello</1>", 5)])
+        self.assertEqual(scheduler.run(call, 5), ("<1>Hello</1>", 5))
+        self.assertEqual(call.call_count, 3)
+        self.assertEqual(scheduler.retry_count, 2)
+        self.assertEqual(scheduler.rate_limit_count, 1)
+
+    def test_run_gives_up_after_max_retries(self):
+        scheduler = RequestScheduler(4, max_retries=1, base_backoff=0)
+        call = MagicMock(side_effect=TransientError("503"))
+        with self.assertRaises(TransientError):
+            scheduler.run(call, 5)
+        self.assertEqual(call.call_count, 2)
+        self.assertEqual(scheduler.in_flight, 0)
+
+    def test_run_does_not_retry_other_errors(self):
+        scheduler = RequestScheduler(4)
+        call = MagicMock(side_effect=ValueError("bad request"))
+        with self.assertRaises(ValueError):
+            scheduler.run(call, 5)
+        self.assertEqual(call.call_count, 1)
+
+    def test_run_async(self):
+        scheduler = RequestScheduler(4, base_backoff=0)
+        responses = iter([RateLimitError("429"), ("<1>Hello</1>", 5)])
+
+        async def call():
+            response = next(responses)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        self.assertEqual(asyncio.run(scheduler.run_async(call, 5)), ("<1>Hello</1>", 5))
+
+    def test_waiting_request_starts_on_release(self):
+        scheduler = RequestScheduler(1, adaptive=False)
+        _, slot = scheduler.try_acquire(10)
+        threading.Timer(0.1, scheduler.release, args=(slot,)).start()
+        start = time.perf_counter()
+
+        self.assertIsNotNone(scheduler.acquire(10))
+        self.assertLess(time.perf_counter() - start, 1)
+
+        async def acquire():
+            threading.Timer(0.1, scheduler.release, args=(scheduler.window[-1],)).start()
+            return await scheduler.acquire_async(10)
+
+        self.assertIsNotNone(asyncio.run(acquire()))
+        self.assertEqual(scheduler.in_flight, 1)
+
+    def test_cancel_interrupts_wait_for_slot(self):
+        scheduler = RequestScheduler(1, adaptive=False)
+        scheduler.try_acquire(10)
+        cancel = threading.Event()
+
+        def stop():
+            cancel.set()
+            scheduler.wake()
+
+        threading.Timer(0.1, stop).start()
+        with self.assertRaises(RequestCancelledError):
+            scheduler.acquire(10, cancel)
+
+    def test_reserves_prompt_and_output_tokens(self):
+        scheduler = RequestScheduler(4, adaptive=False)
+        reserved = []
+
+        def call():
+            reserved.append(scheduler.window[-1][1])
+            return "<1>Hello</1>", 5
+
+        scheduler.run(call, 850, output_tokens=50)
+        self.assertEqual(reserved, [900])
+        self.assertEqual(scheduler.window[-1][1], 855)
+
+    def test_cancel_interrupts_backoff(self):
+        scheduler = RequestScheduler(1, adaptive=False, base_backoff=30, max_backoff=30)
+        cancel = threading.Event()
+        call = MagicMock(side_effect=RateLimitError("429"))
+        threading.Timer(0.1, cancel.set).start()
+        start = time.perf_counter()
+
+        with patch("random.uniform", return_value=30), self.assertRaises(RequestCancelledError):
+            scheduler.run(call, 10, cancel)
+
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertEqual(call.call_count, 1)
+        self.assertEqual(scheduler.in_flight, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import http.client
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+from gpt_subtitle_translator.models.mock_model import MockModel
+from gpt_subtitle_translator.request_scheduler import RequestScheduler
+from gpt_subtitle_translator.service import TranslationService, make_server
+
+SRT_CONTENT = "1\n00:00:01,000 --> 00:00:04,000\nHola\n\n2\n00:00:05,000 --> 00:00:08,000\nAdios\n"
+EXPECTED = "1\n00:00:01,000 --> 00:00:04,000\nHola\n\n2\n00:00:05,000 --> 00:00:08,000\nAdios"
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str):
+        super().__init__("localhost")
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+
+class TestTranslationService(unittest.TestCase):
+    def setUp(self):
+        self.created = []
+
+        def make_model(model_name):
+            self.created.append(model_name)
+            return MockModel(model_name)
+
+        self.service = TranslationService(
+            default_model="mock", workers=2, scheduler=RequestScheduler(2, adaptive=False), model_factory=make_model
+        )
+        self.service.start()
+
+    def tearDown(self):
+        self.service.stop()
+
+    def test_jobs_reuse_models(self):
+        jobs = [self.service.submit(SRT_CONTENT, "English", name=f"episode {i}") for i in range(3)]
+        jobs.append(self.service.submit(SRT_CONTENT, "English", "mock-large"))
+
+        for job in jobs:
+            self.service.wait(job.id, timeout=5)
+            self.assertEqual(job.status, "done")
+            self.assertEqual(job.progress, 1.0)
+            self.assertEqual(job.result, EXPECTED)
+        self.assertEqual(sorted(self.created), ["mock", "mock-large"])
+
+    def test_failed_job(self):
+        job = self.service.submit("not an srt file")
+        self.service.wait(job.id, timeout=5)
+        self.assertEqual(job.status, "failed")
+        self.assertIsNotNone(job.error)
+
+    def test_stop_cancels_queued_jobs(self):
+        service = TranslationService(default_model="mock", workers=1, model_factory=lambda name: MockModel(latency=0.3))
+        service.start()
+        jobs = [service.submit(SRT_CONTENT) for _ in range(5)]
+        while jobs[0].status == "queued":
+            jobs[0].done.wait(0.01)
+
+        service.stop()
+
+        self.assertEqual(jobs[0].status, "done")
+        for job in jobs[1:]:
+            self.assertTrue(job.done.is_set())
+            self.assertEqual(job.status, "cancelled")
+            self.assertIsNone(job.started_at)
+
+    def test_prunes_finished_jobs(self):
+        self.service.job_history = 1
+        first = self.service.submit(SRT_CONTENT)
+        self.service.wait(first.id, timeout=5)
+        second = self.service.submit(SRT_CONTENT)
+        self.service.wait(second.id, timeout=5)
+        self.assertIsNone(self.service.get(first.id))
+        self.assertIs(self.service.get(second.id), second)
+
+    def test_http_api(self):
+        server = make_server(self.service)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            request = urllib.request.Request(
+                f"{url}/jobs", json.dumps({"srt": SRT_CONTENT, "language": "French", "chunk_size": 100}).encode(),
+                {"Content-Type": "application/json"}
+            )
+            with urllib.request.urlopen(request) as response:
+                self.assertEqual(response.status, 202)
+                job = json.load(response)
+            self.assertEqual(job["language"], "French")
+
+            self.service.wait(job["id"], timeout=5)
+            with urllib.request.urlopen(f"{url}/jobs/{job['id']}") as response:
+                self.assertEqual(json.load(response)["status"], "done")
+            with urllib.request.urlopen(f"{url}/jobs/{job['id']}/result") as response:
+                self.assertEqual(response.read().decode("utf-8"), EXPECTED)
+            with urllib.request.urlopen(f"{url}/metrics") as response:
+                self.assertIn("subtitle_translator_requests_total", response.read().decode("utf-8"))
+
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(urllib.request.Request(f"{url}/jobs", b"{}"))
+            self.assertEqual(context.exception.code, 400)
+            with self.assertRaises(urllib.error.HTTPError) as context:
+                urllib.request.urlopen(f"{url}/jobs/unknown")
+            self.assertEqual(context.exception.code, 404)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_unix_socket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "service.sock")
+            server = make_server(self.service, socket_path=path)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                connection = UnixHTTPConnection(path)
+                connection.request("POST", "/jobs", json.dumps({"srt": SRT_CONTENT}))
+                job = json.loads(connection.getresponse().read())
+                self.service.wait(job["id"], timeout=5)
+                connection.request("GET", f"/jobs/{job['id']}/result")
+                self.assertEqual(connection.getresponse().read().decode("utf-8"), EXPECTED)
+                connection.close()
+            finally:
+                server.shutdown()
+                server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,13 +2,14 @@ import unittest
 import re
 from unittest.mock import MagicMock
 
-from gpt_subtitle_translator.subtitle_processor import SubtitleProcessor
+from gpt_subtitle_translator.subtitle_processor import SubtitleProcessor, Chunk
 
 
 class TestSubtitleProcessor(unittest.TestCase):
     def setUp(self):
         mock_model = MagicMock()
         mock_model.num_tokens_from_string.return_value = 50
+        mock_model.num_tokens_from_strings.side_effect = lambda strings: [50] * len(strings)
         mock_model.max_output_tokens.return_value = 1000
         self.processor = SubtitleProcessor(mock_model)
 
@@ -30,6 +31,21 @@ class TestSubtitleProcessor(unittest.TestCase):
         expected = ["<1>Hello World</1>", "<2>Goodbye</2>"]
         self.assertEqual(self.processor.split_on_tags(tagged_text), expected)
 
+    def test_make_chunks(self):
+        tagged_text = "\n".join(f"<{i}>Line {i}</{i}>" for i in range(1, 6))
+        chunks = self.processor.make_chunks(tagged_text, 110)
+        self.assertEqual([chunk.text for chunk in chunks], [
+            "<1>Line 1</1>\n<2>Line 2</2>", "<3>Line 3</3>\n<4>Line 4</4>", "<5>Line 5</5>"
+        ])
+        self.assertEqual([chunk.num_tokens for chunk in chunks], [102, 101, 50])
+        self.assertEqual([chunk.ids for chunk in chunks], [(1, 2), (3, 4), (5,)])
+        self.assertEqual(chunks[2].texts, ("Line 5",))
+        self.processor.model.num_tokens_from_strings.assert_called_once()
+
+    def test_make_chunks_oversized_subtitle(self):
+        chunks = self.processor.make_chunks("<1>Long</1>\n<2>Long</2>", 10)
+        self.assertEqual([chunk.text for chunk in chunks], ["<1>Long</1>", "<2>Long</2>"])
+
     def test_randomize_ids(self):
         tagged_text = "<1>Hello World</1>\n<2>Goodbye</2>"
         randomized_text, mapping = self.processor.randomize_ids(tagged_text)
@@ -54,10 +70,72 @@ class TestSubtitleProcessor(unittest.TestCase):
         self.assertEqual(self.processor.post_process_text(content, original_subs), expected_output)
 
     def test_get_missing_subtitles(self):
-        original_text = "<1>Hello</1>\n<2>World</2>"
-        translated_text = "<1>Hello</1>"
-        missing = self.processor.get_missing_subtitles(translated_text, original_text)
-        self.assertIn("2", missing)
+        chunk = Chunk("<1>Hello</1>\n<2>World</2>", 10, 0, (1, 2), ("Hello", "World"))
+        missing = self.processor.get_missing_subtitles({1: "Hello"}, chunk)
+        self.assertEqual(missing, {2: "World"})
+
+    def test_parse_response(self):
+        response = "<30>Two</30>\n<7>One</7>\n<99>Extra</99>"
+        self.assertEqual(self.processor.parse_response(response, {7: 1, 30: 2}), {1: "One", 2: "Two", 99: "Extra"})
+
+    def test_render_chunk(self):
+        chunk = self.processor.make_chunks("<1>One</1>\n<2>Two</2>\n<3>Three</3>", 1000)[0]
+        self.assertEqual(self.processor.render_chunk(chunk, False, False), (chunk.text, {}))
+
+        text, mapping = self.processor.render_chunk(chunk, True, True)
+        self.assertEqual(self.processor.parse_response(text, mapping), {1: "One", 2: "Two", 3: "Three"})
+
+    def test_compact_render_chunk(self):
+        processor = SubtitleProcessor(self.processor.model, compact=True)
+        chunk = processor.make_chunks("<40>One</40>\n<41>Two\nlines</41>\n<42>Three</42>", 1000)[0]
+        self.assertEqual(chunk.text, "<40>One</40>\n<41>Two\nlines</41>\n<42>Three</42>")
+        self.assertEqual(
+            processor.render_chunk(chunk, False, False), ("1|One\n2|Two\nlines\n3|Three", {1: 40, 2: 41, 3: 42})
+        )
+
+        text, mapping = processor.render_chunk(chunk, True, True)
+        self.assertEqual(processor.parse_response(text, mapping), {40: "One", 41: "Two\nlines", 42: "Three"})
+
+    def test_compact_parse_response(self):
+        processor = SubtitleProcessor(self.processor.model, compact=True)
+        response = "START\n\n2|Two\n1|One\nmore\n\n9|Extra\n\nEND\n\nRemember"
+        self.assertEqual(processor.parse_response(response, {1: 40, 2: 41}), {40: "One\nmore", 41: "Two"})
+
+    def test_make_repair_subtitles(self):
+        chunk = self.processor.make_chunks("<1>One</1>\n<2>Two</2>\n<3>Three</3>\n<4>Four</4>\n<5>Five</5>", 1000)[0]
+        ids, texts = self.processor.make_repair_subtitles(chunk, {4: "Four"}, 1)
+        self.assertEqual(ids, [3, 4, 5])
+        self.assertEqual(texts, ["Three", "Four", "Five"])
+
+    def test_merge_translations(self):
+        merged = self.processor.merge_translations({1: "Uno", 3: "Tres"}, {2: "Dos", 3: "Tres?"}, {2: "Two"})
+        self.assertEqual(merged, {1: "Uno", 2: "Dos", 3: "Tres"})
+        self.assertEqual(list(merged), [1, 2, 3])
+
+    def test_deduplicate(self):
+        parsed_data = {
+            1: {"timestamp": "00:00:01,000 --> 00:00:02,000", "text": "[music]"},
+            2: {"timestamp": "00:00:03,000 --> 00:00:04,000", "text": "Hello"},
+            3: {"timestamp": "00:00:05,000 --> 00:00:06,000", "text": "Hello"},
+        }
+        remaining, translated, duplicates = self.processor.deduplicate(parsed_data, {"[music]": "[musique]"})
+        self.assertEqual(list(remaining), [2])
+        self.assertEqual(translated, {1: "[musique]"})
+        self.assertEqual(duplicates, {3: 2})
+
+    def test_post_process_text_fills_translations(self):
+        original_subs = {
+            1: {"timestamp": "00:00:01,000 --> 00:00:02,000", "text": "[music]"},
+            2: {"timestamp": "00:00:03,000 --> 00:00:04,000", "text": "Hello"},
+            3: {"timestamp": "00:00:05,000 --> 00:00:06,000", "text": "Hello"},
+        }
+        output = self.processor.post_process_text("<2>Bonjour</2>", original_subs, {1: "[musique]"}, {3: 2})
+        expected_output = (
+            "1\n00:00:01,000 --> 00:00:02,000\n[musique]\n\n"
+            "2\n00:00:03,000 --> 00:00:04,000\nBonjour\n\n"
+            "3\n00:00:05,000 --> 00:00:06,000\nBonjour"
+        )
+        self.assertEqual(output, expected_output)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,331 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from gpt_subtitle_translator import subtitle_translator
+from gpt_subtitle_translator.hedging import HedgePolicy
+from gpt_subtitle_translator.job_journal import JobJournal
+from gpt_subtitle_translator.subtitle_processor import Chunk, SubtitleProcessor
+from gpt_subtitle_translator.models.mock_model import MockModel
+from gpt_subtitle_translator.request_scheduler import RequestCancelledError
+from gpt_subtitle_translator.subtitle_translator import SubtitleTranslator, OutputMonitor, ResponseRepetitiveError, \
+    TranslationError, JobDeadlineError
+from gpt_subtitle_translator.telemetry import Telemetry
+
+
+def make_chunk(text, num_tokens, idx=0):
+    ids, texts = zip(*((int(id_), value) for id_, value in SubtitleProcessor.TAG_PATTERN.findall(text)))
+    return Chunk(text=text, num_tokens=num_tokens, idx=idx, ids=ids, texts=texts)
+
+
+class TestSubtitleTranslator(unittest.TestCase):
+    def setUp(self):
+        self.model = MagicMock()
+        self.model.num_tokens_from_string.return_value = 50
+        self.model.num_tokens_from_strings.side_effect = lambda strings: [50] * len(strings)
+        self.model.max_output_tokens.return_value = 1000
+        self.translator = SubtitleTranslator(self.model, "English", max_retries=2)
+
+    def test_repairs_only_missing_subtitles(self):
+        text = "\n".join(f"<{i}>Line {i}</{i}>" for i in range(1, 11))
+        chunk = make_chunk(text, 100)
+        first = "\n".join(f"<{i}>Translated {i}</{i}>" for i in range(1, 11) if i != 5)
+        self.model.generate_completion.side_effect = [
+            (first, 90),
+            ("<4>Translated 4</4>\n<5>Translated 5</5>\n<6>Translated 6</6>", 30),
+        ]
+
+        idx, response, attempts = self.translator.translate_chunk(chunk, threading.Event(), 0)
+
+        self.assertEqual(response, {i: f"Translated {i}" for i in range(1, 11)})
+        self.assertEqual(attempts, 2)
+        repair_prompt = self.model.generate_completion.call_args_list[1][0][0]
+        self.assertIn("<5>Line 5</5>", repair_prompt)
+        self.assertNotIn("<1>Line 1</1>", repair_prompt)
+
+    def test_repair_stopped_returns_nothing(self):
+        text = "\n".join(f"<{i}>Line {i}</{i}>" for i in range(1, 11))
+        chunk = make_chunk(text, 100)
+        stop_flag = threading.Event()
+
+        def generate_completion(prompt, temperature, instructions=""):
+            stop_flag.set()
+            return "\n".join(f"<{i}>Translated {i}</{i}>" for i in range(1, 11) if i != 5), 90
+
+        self.model.generate_completion.side_effect = generate_completion
+
+        _, response, attempts = self.translator.translate_chunk(chunk, stop_flag, 0)
+
+        self.assertEqual((response, attempts), ({}, 0))
+        self.assertEqual(self.model.generate_completion.call_count, 1)
+
+    def test_retries_whole_chunk_when_most_subtitles_missing(self):
+        text = "<1>One</1>\n<2>Two</2>\n<3>Three</3>"
+        chunk = make_chunk(text, 10)
+        translated = "<1>Uno</1>\n<2>Dos</2>\n<3>Tres</3>"
+        self.model.generate_completion.side_effect = [("<1>Uno</1>", 5), (translated, 10)]
+
+        _, response, _ = self.translator.translate_chunk(chunk, threading.Event(), 0)
+
+        self.assertEqual(response, {1: "Uno", 2: "Dos", 3: "Tres"})
+        self.assertIn("<1>One</1>", self.model.generate_completion.call_args_list[1][0][0])
+
+    def test_translate_subtitles_async(self):
+        srt_content = "1\n00:00:01,000 --> 00:00:04,000\nHola\n\n2\n00:00:05,000 --> 00:00:08,000\nAdios\n"
+        self.model.agenerate_completion = AsyncMock(return_value=("<1>Hello</1>\n<2>Goodbye</2>", 10))
+
+        result = asyncio.run(self.translator.translate_subtitles_async(srt_content))
+
+        self.assertEqual(
+            result, "1\n00:00:01,000 --> 00:00:04,000\nHello\n\n2\n00:00:05,000 --> 00:00:08,000\nGoodbye"
+        )
+        self.model.generate_completion.assert_not_called()
+
+    def test_translate_chunk_async_retries(self):
+        chunk = make_chunk("<1>One</1>\n<2>Two</2>\n<3>Three</3>", 10)
+        translated = "<1>Uno</1>\n<2>Dos</2>\n<3>Tres</3>"
+        self.model.agenerate_completion = AsyncMock(side_effect=[("<1>Uno</1>", 5), (translated, 10)])
+
+        _, response, attempts = asyncio.run(self.translator.translate_chunk_async(chunk, 0))
+
+        self.assertEqual(response, {1: "Uno", 2: "Dos", 3: "Tres"})
+        self.assertEqual(attempts, 2)
+
+    def test_output_monitor_aborts_repetition_loop(self):
+        self.model.num_tokens_from_string.side_effect = lambda text: len(text) // 4
+        monitor = OutputMonitor(self.model, 1, 100_000)
+        with self.assertRaises(ResponseRepetitiveError):
+            for _ in range(1000):
+                monitor("<5>Ha ha ha ha</5>\n")
+
+    def test_output_monitor_aborts_runaway_output(self):
+        self.model.num_tokens_from_string.side_effect = lambda text: len(text)
+        monitor = OutputMonitor(self.model, 1, 100)
+        with self.assertRaises(ResponseRepetitiveError):
+            for i in range(1000):
+                monitor(f"<{i}>{i * 7919}</{i}>\n")
+
+    def test_output_monitor_aborts_after_stop(self):
+        stop_flag = threading.Event()
+        monitor = OutputMonitor(self.model, 1, 100, stop_flag=stop_flag)
+        monitor("<1>One</1>\n")
+        stop_flag.set()
+        with self.assertRaises(RequestCancelledError):
+            monitor("<2>Two</2>\n")
+
+    def test_failure_does_not_wait_for_running_requests(self):
+        def generate_completion(prompt, temperature, instructions=""):
+            if "<1>" in prompt:
+                raise ValueError("Fatal error")
+            time.sleep(2)
+            raise ValueError("Too late")
+
+        self.model.generate_completion.side_effect = generate_completion
+        translator = SubtitleTranslator(self.model, "English", num_threads=2, tokens_per_chunk=60)
+        srt_content = "1\n00:00:01,000 --> 00:00:02,000\nOne\n\n2\n00:00:03,000 --> 00:00:04,000\nTwo\n"
+        start = time.perf_counter()
+
+        with self.assertRaises(TranslationError) as context:
+            translator.translate_subtitles(srt_content)
+
+        self.assertEqual(str(context.exception.original_exception), "Fatal error")
+        self.assertLess(time.perf_counter() - start, 1.5)
+
+    def test_failure_abandons_running_requests(self):
+        def generate_completion(prompt, temperature, instructions=""):
+            if "<1>" in prompt:
+                raise ValueError("Fatal error")
+            time.sleep(10)
+            raise ValueError("Too late")
+
+        self.model.generate_completion.side_effect = generate_completion
+        translator = SubtitleTranslator(self.model, "English", num_threads=2, tokens_per_chunk=60)
+        srt_content = "1\n00:00:01,000 --> 00:00:02,000\nOne\n\n2\n00:00:03,000 --> 00:00:04,000\nTwo\n"
+        threads = set(threading.enumerate())
+
+        with patch.object(subtitle_translator, "STOP_GRACE_PERIOD", 0.2):
+            with self.assertRaises(TranslationError):
+                translator.translate_subtitles(srt_content)
+            start = time.perf_counter()
+            # Only the abandoned request is left running, on a daemon thread which doesn't hold up the exit
+            for thread in set(threading.enumerate()) - threads:
+                if not thread.daemon:
+                    thread.join()
+        self.assertLess(time.perf_counter() - start, 1)
+
+    def test_deadline(self):
+        srt_content = "".join(f"{i}\n00:00:01,000 --> 00:00:02,000\nLine {i}\n\n" for i in range(1, 11))
+        for use_async in (False, True):
+            translator = SubtitleTranslator(
+                MockModel(latency=2), "English", num_threads=2, tokens_per_chunk=10, stream=True, deadline=0.2
+            )
+            start = time.perf_counter()
+
+            with self.assertRaises(TranslationError, msg=use_async) as context:
+                if use_async:
+                    asyncio.run(translator.translate_subtitles_async(srt_content))
+                else:
+                    translator.translate_subtitles(srt_content)
+
+            self.assertIsInstance(context.exception.original_exception, JobDeadlineError)
+            self.assertLess(time.perf_counter() - start, 1.5)
+
+    def test_deadline_times_out_requests(self):
+        srt_content = "".join(f"{i}\n00:00:01,000 --> 00:00:02,000\nLine {i}\n\n" for i in range(1, 11))
+        translator = SubtitleTranslator(
+            MockModel(latency=2), "English", num_threads=2, tokens_per_chunk=10, stream=False, deadline=0.2
+        )
+        threads = set(threading.enumerate())
+
+        with self.assertRaises(TranslationError) as context:
+            translator.translate_subtitles(srt_content)
+
+        self.assertIsInstance(context.exception.original_exception, JobDeadlineError)
+        start = time.perf_counter()
+        for thread in set(threading.enumerate()) - threads:
+            thread.join()
+        self.assertLess(time.perf_counter() - start, 1)
+
+    def test_stream_retries_after_abort(self):
+        chunk = make_chunk("<1>One</1>", 10)
+
+        def stream(prompt, temperature, on_text, instructions=""):
+            if self.model.generate_completion_stream.call_count == 1:
+                raise ResponseRepetitiveError("loop")
+            on_text("<1>Uno</1>")
+            return "<1>Uno</1>", 5
+
+        self.model.generate_completion_stream.side_effect = stream
+        translator = SubtitleTranslator(self.model, "English", max_retries=1, stream=True)
+
+        _, response, attempts = translator.translate_chunk(chunk, threading.Event(), 0)
+
+        self.assertEqual(response, {1: "Uno"})
+        self.assertEqual(attempts, 2)
+        self.assertEqual(self.model.generate_completion_stream.call_args_list[1][0][1], 1)
+
+    def test_resume_skips_completed_chunks(self):
+        srt_content = "1\n00:00:01,000 --> 00:00:04,000\nHola\n\n2\n00:00:05,000 --> 00:00:08,000\nAdios\n"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "job.journal.jsonl")
+            journal = JobJournal(path)
+            journal.record((1,), ("Hola",), {1: "Hello"})
+            journal.close()
+
+            journal = JobJournal(path, resume=True)
+            translator = SubtitleTranslator(self.model, "English", tokens_per_chunk=60, journal=journal)
+            self.model.generate_completion.return_value = ("<2>Goodbye</2>", 5)
+
+            result = translator.translate_subtitles(srt_content)
+            journal.close()
+
+        self.assertEqual(
+            result, "1\n00:00:01,000 --> 00:00:04,000\nHello\n\n2\n00:00:05,000 --> 00:00:08,000\nGoodbye"
+        )
+        self.assertEqual(self.model.generate_completion.call_count, 1)
+        self.assertNotIn("<1>Hola</1>", self.model.generate_completion.call_args[0][0])
+
+    def test_resume_with_different_chunks(self):
+        srt_content = "".join(f"{i}\n00:00:{i:02},000 --> 00:00:{i:02},500\nLine {i}\n\n" for i in range(1, 7))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "job.journal.jsonl")
+            journal = JobJournal(path)
+            journal.record((1, 2, 3), ("Line 1", "Line 2", "Line 3"), {1: "One", 2: "Two", 3: "Three"})
+            journal.close()
+
+            journal = JobJournal(path, resume=True)
+            translator = SubtitleTranslator(MockModel(), "English", tokens_per_chunk=5, journal=journal)
+            result = translator.translate_subtitles(srt_content)
+            journal.close()
+
+        self.assertIn("One\n\n", result)
+        self.assertIn("Three\n\n", result)
+        self.assertEqual(translator.model.request_count, 3)
+
+    def test_instructions_sent_as_prefix(self):
+        chunk = make_chunk("<1>Hola</1>", 10)
+        self.model.generate_completion.return_value = ("<1>Hello</1>", 5)
+
+        self.translator.translate_chunk(chunk, threading.Event(), 0)
+
+        prompt, _, instructions = self.model.generate_completion.call_args[0]
+        self.assertNotIn("{target_language}", instructions)
+        self.assertNotIn("<1>Hola</1>", instructions)
+        self.assertTrue(prompt.startswith("<1>Hola</1>"))
+        expected = self.translator.prompt_template.replace("{subtitles}", "<1>Hola</1>") \
+            .replace("{target_language}", "English")
+        self.assertEqual(instructions + prompt, expected)
+
+    def test_fallback_cascade(self):
+        srt_content = "1\n00:00:01,000 --> 00:00:04,000\nHola\n\n2\n00:00:05,000 --> 00:00:08,000\nAdios\n"
+        cheap = MockModel("mock-cheap", failure_rates={"refusal": 1.0})
+        middle = MockModel("mock-middle", failure_rates={"skip": 1.0})
+        strong = MockModel("mock-strong")
+        telemetry = Telemetry()
+        translator = SubtitleTranslator(
+            cheap, "English", tokens_per_chunk=1000, max_retries=1, partial_repair=False, telemetry=telemetry,
+            fallback_models=[middle, strong]
+        )
+
+        result = translator.translate_subtitles(srt_content)
+
+        self.assertEqual(result, "1\n00:00:01,000 --> 00:00:04,000\nHola\n\n2\n00:00:05,000 --> 00:00:08,000\nAdios")
+        self.assertEqual((cheap.request_count, middle.request_count, strong.request_count), (1, 2, 1))
+        self.assertTrue(all(model.get_total_cost() > 0 for model in (cheap, middle, strong)))
+        self.assertEqual(telemetry.chunks[("mock-cheap", "English", "escalated")], 1)
+        self.assertEqual(telemetry.chunks[("mock-middle", "English", "escalated")], 1)
+        self.assertEqual(telemetry.chunks[("mock-strong", "English", "model")], 1)
+
+    def test_fallback_and_hedge_models_init_vocab(self):
+        class VocabModel(MockModel):
+            vocab = None
+
+            def init_vocab(self, text):
+                self.vocab = text
+
+            def num_tokens_from_string(self, string):
+                if self.vocab is None:
+                    raise TypeError("vocabulary not initialized")
+                return super().num_tokens_from_string(string)
+
+        srt_content = "1\n00:00:01,000 --> 00:00:04,000\nHola\n"
+        cheap = VocabModel("mock-cheap", failure_rates={"refusal": 1.0})
+        strong = VocabModel("mock-strong")
+        hedge = VocabModel("mock-hedge")
+        translator = SubtitleTranslator(
+            cheap, "English", max_retries=0, fallback_models=[strong], hedging=HedgePolicy(hedge)
+        )
+
+        result = translator.translate_subtitles(srt_content)
+
+        self.assertEqual(result, "1\n00:00:01,000 --> 00:00:04,000\nHola")
+        self.assertEqual(strong.vocab, "<1>Hola</1>")
+        self.assertEqual(hedge.vocab, cheap.vocab)
+
+    def test_fallback_cascade_async(self):
+        srt_content = "1\n00:00:01,000 --> 00:00:04,000\nHola\n"
+        cheap = MockModel("mock-cheap", failure_rates={"refusal": 1.0})
+        strong = MockModel("mock-strong")
+        translator = SubtitleTranslator(cheap, "English", max_retries=0, fallback_models=[strong])
+
+        result = asyncio.run(translator.translate_subtitles_async(srt_content))
+
+        self.assertEqual(result, "1\n00:00:01,000 --> 00:00:04,000\nHola")
+        self.assertEqual((cheap.request_count, strong.request_count), (1, 1))
+
+    def test_fallback_cascade_exhausted(self):
+        srt_content = "1\n00:00:01,000 --> 00:00:04,000\nHola\n"
+        models = [MockModel(f"mock-{i}", failure_rates={"refusal": 1.0}) for i in range(2)]
+        translator = SubtitleTranslator(models[0], "English", max_retries=0, fallback_models=models[1:])
+
+        with self.assertRaises(TranslationError):
+            translator.translate_subtitles(srt_content)
+        self.assertEqual([model.request_count for model in models], [1, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import io
+import unittest
+from unittest.mock import MagicMock
+
+from gpt_subtitle_translator.subtitle_translator import SubtitleTranslator
+from gpt_subtitle_translator.subtitle_writer import SubtitleWriter
+from gpt_subtitle_translator.translation_memory import TranslationMemory
+
+
+class TestSubtitleWriter(unittest.TestCase):
+    def setUp(self):
+        self.model = MagicMock()
+        self.model.num_tokens_from_string.return_value = 5
+        self.model.num_tokens_from_strings.side_effect = lambda strings: [5] * len(strings)
+        self.model.max_output_tokens.return_value = 1000
+        self.srt_content = "".join(
+            f"{i}\n00:00:0{i},000 --> 00:00:0{i},500\n{text}\n\n"
+            for i, text in enumerate(["[music]", "Hola", "Hola", "Adios", "Gracias"], start=1)
+        )
+        self.translator = self.make_translator()
+
+    def make_translator(self):
+        memory = TranslationMemory()
+        memory.update("English", {"[music]": "[music]"})
+        return SubtitleTranslator(self.model, "English", tokens_per_chunk=6, memory=memory)
+
+    def test_writes_chunks_in_order(self):
+        prepared = self.translator.prepare(self.srt_content)
+        self.assertEqual([chunk.ids for chunk in prepared.chunks], [(2,), (4,), (5,)])
+        output = io.StringIO()
+        writer = SubtitleWriter(output, self.translator.processor, prepared)
+
+        writer.add(1, {4: "Goodbye"})
+        self.assertEqual(output.getvalue(), "")
+
+        writer.add(0, {2: "Hello"})
+        self.assertEqual(output.getvalue(), (
+            "1\n00:00:01,000 --> 00:00:01,500\n[music]\n\n"
+            "2\n00:00:02,000 --> 00:00:02,500\nHello\n\n"
+            "3\n00:00:03,000 --> 00:00:03,500\nHello\n\n"
+            "4\n00:00:04,000 --> 00:00:04,500\nGoodbye"
+        ))
+
+        writer.add(2, {5: "Thanks"})
+        writer.close()
+        self.assertTrue(output.getvalue().endswith("\n\n5\n00:00:05,000 --> 00:00:05,500\nThanks"))
+
+    def test_incremental_output_matches_result(self):
+        responses = {"<2>Hola</2>": "<2>Hello</2>", "<4>Adios</4>": "<4>Goodbye</4>", "<5>Gracias</5>": "<5>Thanks</5>"}
+        self.model.generate_completion.side_effect = \
+            lambda prompt, temperature, instructions="": (responses[prompt.split("\n")[0]], 5)
+
+        expected = self.make_translator().translate_subtitles(self.srt_content)
+        output = io.StringIO()
+        result = self.translator.translate_subtitles(self.srt_content, output=output)
+
+        self.assertIsNone(result)
+        self.assertEqual(self.model.generate_completion.call_count, 6)
+        self.assertEqual(output.getvalue(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from gpt_subtitle_translator.models.mock_model import MockModel
+from gpt_subtitle_translator.subtitle_translator import SubtitleTranslator
+from gpt_subtitle_translator.telemetry import Telemetry
+
+
+class TestTelemetry(unittest.TestCase):
+    def test_records_requests_and_chunks(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "telemetry.jsonl")
+            telemetry = Telemetry(path)
+            translator = SubtitleTranslator(MockModel(), "English", stream=True, telemetry=telemetry)
+            chunk = translator.processor.make_chunks("\n".join(f"<{i}>Line {i}</{i}>" for i in range(1, 5)), 1000)[0]
+
+            translator.translate_chunk_with_cache(chunk, threading.Event())
+            telemetry.close()
+
+            with open(path) as f:
+                events = [json.loads(line) for line in f]
+
+        self.assertEqual([event["event"] for event in events], ["request", "chunk"])
+        request = events[0]
+        self.assertEqual(request["chunk"], 1)
+        self.assertEqual(request["calls"], 1)
+        self.assertIsNone(request["error"])
+        self.assertGreaterEqual(request["latency"], request["time_to_first_token"])
+        self.assertGreaterEqual(request["queue_wait"], 0)
+        self.assertGreater(request["compression_ratio"], 0)
+        self.assertEqual(events[1]["attempts"], 1)
+
+    def test_queue_wait_includes_wait_for_a_worker(self):
+        telemetry = Telemetry()
+        model = MockModel(latency=0.1)
+        translator = SubtitleTranslator(model, "English", tokens_per_chunk=1, telemetry=telemetry)
+        srt_content = "".join(f"{i}\n00:00:01,000 --> 00:00:02,000\nLine {i}\n\n" for i in range(1, 6))
+
+        translator.translate_subtitles(srt_content)
+
+        samples = sorted(
+            sample for (name, _), histogram in telemetry.histograms.items() if name == "queue_wait"
+            for sample in histogram.samples
+        )
+        self.assertEqual(len(samples), 5)
+        self.assertGreater(samples[-1], 0.3)
+        prompt_tokens = translator.get_prompt_tokens(model)
+        self.assertGreater(telemetry.tokens[("mock", "input")], 5 * prompt_tokens)
+
+    def test_failed_requests_and_export(self):
+        telemetry = Telemetry()
+        translator = SubtitleTranslator(
+            MockModel(failure_rates={"refusal": 1}), "English", max_retries=1, telemetry=telemetry
+        )
+        chunk = translator.processor.make_chunks("<1>One</1>\n<2>Two</2>", 1000)[0]
+
+        with self.assertRaises(Exception):
+            translator.translate_chunk_with_cache(chunk, threading.Event())
+
+        metrics = telemetry.prometheus()
+        self.assertIn('subtitle_translator_requests_total{model="mock",lang="English",error="RefuseToTranslateError"} 1',
+                      metrics)
+        self.assertIn('subtitle_translator_chunks_total{model="mock",lang="English",source="failed"} 1', metrics)
+        self.assertIn('subtitle_translator_latency_seconds_bucket{model="mock",le="+Inf"} 1', metrics)
+        self.assertIn("RefuseToTranslateError 1", telemetry.summary())
+
+
+if __name__ == '__main__':
+    unittest.main()
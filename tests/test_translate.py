@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from translate import get_input_files, get_journal_filename
+
+SRT_CONTENT = "1\n00:00:01,000 --> 00:00:04,000\nHola\n\n2\n00:00:05,000 --> 00:00:08,000\nAdios\n"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_translate(*args, home):
+    env = {**os.environ, "HOME": home}
+    return subprocess.run(
+        [sys.executable, "translate.py", "--model", "mock", "--cache", "off", *args],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+
+
+class TestTranslate(unittest.TestCase):
+    def test_batch_of_dotted_episode_names(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for episode in ("Show.S01E01", "Show.S01E02"):
+                with open(os.path.join(tmp_dir, f"{episode}.srt"), "w", encoding="utf-8") as f:
+                    f.write(SRT_CONTENT.replace("Hola", f"Hola {episode}"))
+
+            result = run_translate(tmp_dir, "--incremental", home=tmp_dir)
+
+            self.assertEqual(result.returncode, 0, result.stderr)
+            outputs = sorted(name for name in os.listdir(tmp_dir) if name.endswith("_translated.srt"))
+            self.assertEqual(len(outputs), 2)
+            for episode, name in zip(("Show.S01E01", "Show.S01E02"), outputs):
+                self.assertTrue(name.startswith(f"{episode}_"), name)
+                with open(os.path.join(tmp_dir, name), encoding="utf-8") as f:
+                    self.assertIn(f"Hola {episode}", f.read())
+
+    def test_jobs_have_their_own_journal(self):
+        episodes = get_input_files(["Show.S01E01.srt", "Show.S01E02.srt", "./Show.S01E01.srt"])
+
+        self.assertEqual(episodes, ["Show.S01E01.srt", "Show.S01E02.srt"])
+        self.assertEqual(
+            [get_journal_filename(episode, "English", "mock") for episode in episodes],
+            ["Show.S01E01.English.mock.journal.jsonl", "Show.S01E02.English.mock.journal.jsonl"]
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = [os.path.join(tmp_dir, name) for name in ("Show.srt", "Show.txt")]
+            for path in paths:
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(SRT_CONTENT)
+
+            result = run_translate(*paths, home=tmp_dir)
+
+            self.assertEqual(result.returncode, 2)
+            self.assertIn("would share the journal", result.stderr)
+            self.assertFalse(any(name.endswith(".journal.jsonl") for name in os.listdir(tmp_dir)))
+
+    def test_no_input_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for args in ([tmp_dir], [os.path.join(tmp_dir, "*.srt"), "--batch_api"]):
+                result = run_translate(*args, home=tmp_dir)
+
+                self.assertEqual(result.returncode, 2)
+                self.assertIn("no .srt files found", result.stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+
+from gpt_subtitle_translator.translation_cache import TranslationCache
+
+
+class TestTranslationCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_get_put(self):
+        cache = TranslationCache(self.path, 1024)
+        key = cache.make_key("<1>Hola</1>", "English", "gpt-4o-mini", 0.3, "prompt")
+        self.assertIsNone(cache.get(key))
+        cache.put(key, "<1>Hello</1>")
+        self.assertEqual(cache.get(key), "<1>Hello</1>")
+        cache.close()
+
+    def test_key_covers_all_parameters(self):
+        base = ("<1>Hola</1>", "English", "gpt-4o-mini", 0.3, "prompt")
+        keys = {TranslationCache.make_key(*base)}
+        for i, value in enumerate(["<1>Adios</1>", "French", "gpt-4", 0.5, "other prompt"]):
+            params = list(base)
+            params[i] = value
+            keys.add(TranslationCache.make_key(*params))
+        self.assertEqual(len(keys), 6)
+
+    def test_evicts_least_recently_used(self):
+        cache = TranslationCache(self.path, 10)
+        cache.put("a", "12345")
+        cache.put("b", "12345")
+        cache.get("a")
+        cache.put("c", "12345")
+        self.assertEqual(cache.get("a"), "12345")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "12345")
+        cache.close()
+
+    def test_modes(self):
+        TranslationCache(self.path, 1024).put("a", "value")
+        read_only = TranslationCache(self.path, 1024, mode="read")
+        read_only.put("b", "value")
+        self.assertEqual(read_only.get("a"), "value")
+        self.assertIsNone(read_only.get("b"))
+        write_only = TranslationCache(self.path, 1024, mode="write")
+        self.assertIsNone(write_only.get("a"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import threading
+import unittest
+
+from gpt_subtitle_translator.models.mock_model import MockModel
+from gpt_subtitle_translator.subtitle_translator import SubtitleTranslator, TranslationError
+from gpt_subtitle_translator.usage import UsageLedger, Budget, BudgetExceededError
+
+
+def make_srt(num_cues: int) -> str:
+    return "".join(
+        f"{i}\n00:00:{i:02},000 --> 00:00:{i:02},500\nSubtitle number {i} of the file\n\n" for i in range(1, num_cues + 1)
+    )
+
+
+class TestUsageLedger(unittest.TestCase):
+    def test_concurrent_records(self):
+        ledger = UsageLedger()
+        model = MockModel(price_input=1.0, price_output=2.0)
+        jobs = [ledger.open_job(f"job {i}", "English") for i in range(4)]
+
+        def record(job):
+            for _ in range(1000):
+                job.record(model, 10, 5)
+
+        threads = [threading.Thread(target=record, args=(job,)) for job in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(ledger.total.requests, 4000)
+        self.assertEqual((ledger.total.input_tokens, ledger.total.output_tokens), (40000, 20000))
+        self.assertAlmostEqual(ledger.total.cost, 4000 * (0.01 + 0.01))
+        self.assertEqual(ledger.models["mock"].requests, 4000)
+        self.assertTrue(all(job.requests == 1000 for job in jobs))
+
+    def test_projects_remaining_chunks(self):
+        ledger = UsageLedger()
+        job = ledger.open_job("job", "English", Budget(max_cost=1.0))
+        job.start(400)
+
+        # Estimated at $0.002 per chunk token, the 400 tokens left cost $0.8
+        job.dispatch(100, 0.2, 200)
+        job.record(MockModel(price_input=2.0, price_output=0.0), 150, 50)
+        job.complete(100)
+
+        # Observed $0.003 per chunk token, the 300 tokens left would bring the job to $1.2
+        with self.assertRaises(BudgetExceededError):
+            job.dispatch(100, 0.2, 200)
+        self.assertEqual(job.pending_tokens, 300)
+
+    def test_global_budget(self):
+        ledger = UsageLedger(Budget(max_tokens=1000))
+        first, second = ledger.open_job("first", "English"), ledger.open_job("second", "English")
+        first.record(MockModel(), 600, 300)
+        second.start(100)
+        with self.assertRaises(BudgetExceededError):
+            second.dispatch(100, 0.0, 200)
+
+    def test_global_budget_counts_chunks_of_all_jobs(self):
+        ledger = UsageLedger(Budget(max_tokens=1000))
+        first, second = ledger.open_job("first", "English"), ledger.open_job("second", "English")
+        first.start(200)
+        second.start(200)
+
+        # 2 tokens per chunk token, the 400 chunk tokens of both jobs would spend 800 tokens
+        first.dispatch(100, 0.0, 200)
+        second.dispatch(100, 0.0, 200)
+        # Nothing was spent yet, but the chunks both jobs have in flight and left would spend 1200 tokens
+        third = ledger.open_job("third", "English")
+        third.start(200)
+        with self.assertRaises(BudgetExceededError):
+            third.dispatch(100, 0.0, 200)
+
+        # Once a job is over, its chunks left no longer count
+        first.finish()
+        third.dispatch(100, 0.0, 200)
+
+    def test_translator_records_usage(self):
+        ledger = UsageLedger()
+        model = MockModel()
+        translator = SubtitleTranslator(model, "English", tokens_per_chunk=100, ledger=ledger)
+
+        translator.translate_subtitles(make_srt(20))
+
+        self.assertEqual(ledger.total.requests, model.request_count)
+        self.assertEqual(ledger.total.output_tokens, model.total_output_tokens)
+        self.assertGreater(ledger.total.cost, 0)
+        self.assertIs(ledger.jobs[translator.usage.key], translator.usage)
+
+    def test_jobs_of_same_language_are_separate(self):
+        ledger = UsageLedger()
+        budget = Budget(max_tokens=1500)
+        first = SubtitleTranslator(MockModel(), "English", tokens_per_chunk=100, ledger=ledger, budget=budget)
+        first.translate_subtitles(make_srt(10))
+        second = SubtitleTranslator(
+            MockModel(), "English", tokens_per_chunk=100, ledger=ledger, budget=budget, job_id="second"
+        )
+        second.translate_subtitles(make_srt(10))
+
+        self.assertIsNot(first.usage, second.usage)
+        self.assertEqual(first.usage.tokens, second.usage.tokens)
+        self.assertEqual(ledger.total.tokens, first.usage.tokens + second.usage.tokens)
+        self.assertGreater(ledger.total.tokens, 1500)
+        self.assertIs(ledger.open_job("second", "English"), second.usage)
+        self.assertIn("Job second [English]", ledger.summary())
+
+    def test_translator_stops_before_budget(self):
+        ledger = UsageLedger()
+        model = MockModel()
+        translator = SubtitleTranslator(
+            model, "English", tokens_per_chunk=100, ledger=ledger, budget=Budget(max_tokens=1500)
+        )
+
+        with self.assertRaises(TranslationError) as context:
+            translator.translate_subtitles(make_srt(40))
+
+        self.assertIsInstance(context.exception.original_exception, BudgetExceededError)
+        self.assertLessEqual(ledger.total.tokens, 1500)
+        self.assertEqual(ledger.total.requests, model.request_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import argparse
+import logging
+
+from gpt_subtitle_translator.constants import TOKENS_PER_CHUNK
+from gpt_subtitle_translator.logger import logger
+from gpt_subtitle_translator.models.registry import get_model
+from gpt_subtitle_translator.subtitle_processor import SubtitleProcessor
+from translate import read_srt
+
+
+def compare_wire_formats(model, srt_data: str, chunk_size: int = TOKENS_PER_CHUNK) -> dict:
+    """
+    Count the tokens of the subtitles of an SRT file, as sent to the model with tagged and with compact ids.
+    Responses repeat the markup of the prompt, so the savings apply to the output tokens as well.
+    """
+    tagged = SubtitleProcessor(model)
+    compact = SubtitleProcessor(model, compact=True)
+    remaining, _, _ = tagged.deduplicate(tagged.parse_srt(srt_data), {})
+    ids, texts = list(remaining), [value["text"] for value in remaining.values()]
+    chunks = tagged.chunk_subtitles(ids, texts, chunk_size)
+
+    text_tokens = sum(model.num_tokens_from_strings(texts))
+    tagged_tokens = sum(model.num_tokens_from_string(chunk.text) for chunk in chunks)
+    compact_tokens = sum(
+        model.num_tokens_from_string(compact.render_chunk(chunk, False, False)[0]) for chunk in chunks
+    )
+    return {
+        "model": model.model_name,
+        "cues": len(ids),
+        "text_tokens": text_tokens,
+        "tagged_tokens": tagged_tokens,
+        "compact_tokens": compact_tokens,
+        "saved_ratio": 1 - compact_tokens / tagged_tokens if tagged_tokens else 0.0,
+        "markup_per_cue": (
+            (tagged_tokens - text_tokens) / len(ids) if ids else 0.0,
+            (compact_tokens - text_tokens) / len(ids) if ids else 0.0,
+        ),
+    }
+
+
+def print_report(results: list[dict]):
+    print(f"{'model':<28} {'cues':>6} {'text':>8} {'tagged':>8} {'compact':>8} {'saved':>6}  markup/cue")
+    for r in results:
+        tagged_markup, compact_markup = r["markup_per_cue"]
+        print(
+            f"{r['model']:<28} {r['cues']:>6} {r['text_tokens']:>8} {r['tagged_tokens']:>8} "
+            f"{r['compact_tokens']:>8} {r['saved_ratio']:>6.1%}  {tagged_markup:.1f} -> {compact_markup:.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the tokens used by the tagged and compact id formats.')
+    parser.add_argument('file', help='The SRT file to measure.')
+    parser.add_argument('-m', '--models', type=str, nargs='+', default=["mock"],
+                        help='Models whose tokenizers to compare, "mock" counts 4 characters per token.')
+    parser.add_argument('-s', '--chunk_size', type=int, default=TOKENS_PER_CHUNK, help='Number of tokens per chunk.')
+
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    srt_data = read_srt(args.file)
+    models = [get_model(name) for name in args.models]
+    print_report([compare_wire_formats(model, srt_data, args.chunk_size) for model in models])
+
+
+if __name__ == '__main__':
+    main()
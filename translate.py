@@ -1,66 +1,263 @@
 import argparse
+import asyncio
+import glob
 import os
 import time
-from gpt_subtitle_translator.constants import TOKENS_PER_CHUNK, DEFAULT_MODEL, MAX_RETRIES, DEFAULT_TEMPERATURE
-from gpt_subtitle_translator.models.claude import Claude
-from gpt_subtitle_translator.models.gemini import Gemini
-from gpt_subtitle_translator.models.gpt import GPT
+from concurrent.futures import ThreadPoolExecutor
+from gpt_subtitle_translator.constants import TOKENS_PER_CHUNK, DEFAULT_MODEL, MAX_RETRIES, DEFAULT_TEMPERATURE, \
+    CACHE_PATH, CACHE_MAX_SIZE_MB, MAX_CONCURRENCY, CHUNK_SIZES_PATH, HEDGE_BUDGET
+from gpt_subtitle_translator.chunk_sizer import ChunkSizer
+from gpt_subtitle_translator.hedging import HedgePolicy
+from gpt_subtitle_translator.models.recording_model import RecordingModel
+from gpt_subtitle_translator.models.registry import get_model
 from gpt_subtitle_translator.subtitle_translator import SubtitleTranslator, TranslationError
+from gpt_subtitle_translator.translation_cache import TranslationCache
+from gpt_subtitle_translator.translation_memory import TranslationMemory
+from gpt_subtitle_translator.job_journal import JobJournal
 from gpt_subtitle_translator.logger import logger
+from gpt_subtitle_translator.request_scheduler import RequestScheduler
+from gpt_subtitle_translator.batch_translator import BatchJob, translate_batch
+from gpt_subtitle_translator.telemetry import Telemetry
+from gpt_subtitle_translator.usage import UsageLedger, Budget
 import chardet
 
-def get_output_filename(input_filename):
+def get_output_filename(input_filename, language=None):
     token = int(time.time())
     directory, filename = os.path.split(input_filename)
-    return os.path.join(directory, f"{filename.split('.')[0]}_{token}_translated.srt")
+    suffix = f"{language}_translated" if language else "translated"
+    return os.path.join(directory, f"{os.path.splitext(filename)[0]}_{token}_{suffix}.srt")
 
-def get_model(model_name):
-    if model_name.startswith("gpt"):
-        return GPT(model_name)
-    if model_name.startswith("gemini"):
-        return Gemini(model_name)
-    return Claude(model_name)
+def get_journal_filename(input_filename, language, model_name):
+    directory, filename = os.path.split(input_filename)
+    return os.path.join(directory, f"{os.path.splitext(filename)[0]}.{language}.{model_name}.journal.jsonl")
+
+def get_input_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.srt'))))
+        elif glob.has_magic(path):
+            files.extend(sorted(glob.glob(path)))
+        else:
+            files.append(path)
+    # A file matched by several paths is translated once
+    unique = {}
+    for file in files:
+        unique.setdefault(os.path.normpath(file), file)
+    return list(unique.values())
+
+def read_srt(path):
+    with open(path, 'rb') as f:
+        encoding = chardet.detect(f.read())['encoding']
+
+    with open(path, 'r', encoding=encoding) as f:
+        return f.read()
+
+def translate_with_batch_api(job):
+    try:
+        return job.translator.translate_subtitles_batch(job.srt_data, output=job.output)
+    except Exception as e:
+        return e
 
 def main():
-    parser = argparse.ArgumentParser(description='Translate a transcript file.')
-    parser.add_argument('file', help='The transcript file to translate.', nargs='?', default='')
-    parser.add_argument('-l', '--language', type=str, default="English", help='Language to translate to.')
+    parser = argparse.ArgumentParser(description='Translate transcript files.')
+    parser.add_argument('files', help='The transcript files, directories or glob patterns to translate.', nargs='+')
+    parser.add_argument('-l', '--language', type=str, nargs='+', default=["English"], help='Languages to translate to.')
     parser.add_argument('-t', '--threads', type=int, default=1, help='Number of threads to use.')
     parser.add_argument('-temp', '--temperature', type=float, default=DEFAULT_TEMPERATURE, help='Temperature for generation.')
     parser.add_argument('-s', '--chunk_size', type=int, default=TOKENS_PER_CHUNK, help='Number of tokens per chunk.')
     parser.add_argument('-m', '--model', type=str, default=DEFAULT_MODEL, help='Model to use.')
+    parser.add_argument('--fallback_models', type=str, nargs='+', default=[],
+                        help='Models chunks are escalated to, in order, '
+                             'once all their retries failed on the previous one.')
     parser.add_argument('-r', '--retries', type=int, default=MAX_RETRIES, help='Number of retries.')
+    parser.add_argument('--no_repair', action='store_true', help='Retry whole chunks instead of only missing subtitles.')
+    parser.add_argument('--cache', type=str, default='on', choices=TranslationCache.MODES,
+                        help='Read and write translated chunks to the cache, only read, only write, or bypass it.')
+    parser.add_argument('--cache_path', type=str, default=CACHE_PATH, help='Path of the cache database.')
+    parser.add_argument('--cache_size', type=int, default=CACHE_MAX_SIZE_MB, help='Maximum cache size in MB.')
+    parser.add_argument('--memory', type=str, default=None,
+                        help='Translation memory file, to reuse translations of repeated subtitles across a series.')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Run requests on an event loop instead of threads, -t sets the number of concurrent requests.')
+    parser.add_argument('--adaptive', action='store_true',
+                        help=f'Grow concurrency until the provider rate limits requests, up to {MAX_CONCURRENCY}. Ignores -t.')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream responses, and abort them early when stuck in a loop or running too long.')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume a failed translation, only translating the chunks it did not complete.')
+    parser.add_argument('--batch_api', action='store_true',
+                        help='Send all chunks as one job to the provider batch API, which is slower but cheaper.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Write each chunk to the output file as soon as it and all earlier chunks are translated.')
+    parser.add_argument('--record', type=str, default=None, help='Record all requests and responses to this cassette file.')
+    parser.add_argument('--replay', type=str, default=None,
+                        help='Replay responses from this cassette file, instead of calling the provider.')
+    parser.add_argument('--replay_speed', type=float, default=1.0,
+                        help='Latency multiplier of replayed responses, 0 replays them without waiting.')
+    parser.add_argument('--telemetry', type=str, default=None,
+                        help='Append per-request and per-chunk metrics to this file, as JSON lines.')
+    parser.add_argument('--metrics', type=str, default=None,
+                        help='Write Prometheus-style metrics to this file when done.')
+    parser.add_argument('--adaptive_chunks', action='store_true',
+                        help='Size chunks from the output/input token ratio learned for the model and language, '
+                             'and split failing chunks. -s sets the size until the ratio is known.')
+    parser.add_argument('--largest_first', action='store_true',
+                        help='Send the largest chunks first, so the job does not wait on a big chunk at the end.')
+    parser.add_argument('--hedge', action='store_true',
+                        help='Send a duplicate request for chunks running well past the p95 latency, '
+                             'and keep the first valid response.')
+    parser.add_argument('--hedge_model', type=str, default=None,
+                        help='Model to send hedged requests to, instead of the main one.')
+    parser.add_argument('--hedge_budget', type=float, default=HEDGE_BUDGET,
+                        help='Extra input tokens hedged requests may add, as a share of the regular requests.')
+    parser.add_argument('--compact_ids', action='store_true',
+                        help='Send subtitles as "id|text" lines numbered within each chunk, instead of tags, '
+                             'to save tokens.')
+    parser.add_argument('--languages_per_request', type=int, default=1,
+                        help='Translate each chunk into up to this many of the -l languages in one request, '
+                             'for models with a large output limit.')
+    parser.add_argument('--deadline', type=float, default=None,
+                        help='Seconds each translation may take, it fails and stops sending requests after that.')
+    parser.add_argument('--timeout', type=float, default=None, help='Seconds each request may take before being retried.')
+    parser.add_argument('--budget', type=float, default=None,
+                        help='Dollars each translation may spend, it stops before the projected cost goes over.')
+    parser.add_argument('--budget_tokens', type=int, default=None,
+                        help='Input and output tokens each translation may spend.')
+    parser.add_argument('--total_budget', type=float, default=None, help='Dollars all translations together may spend.')
+    parser.add_argument('--rpm', type=int, default=None, help='Maximum requests per minute.')
+    parser.add_argument('--tpm', type=int, default=None, help='Maximum tokens per minute.')
 
     args = parser.parse_args()
 
-    with open(args.file, 'rb') as f:
-        encoding = chardet.detect(f.read())['encoding']
-
-    with open(args.file, 'r', encoding=encoding) as f:
-        srt_data = f.read()
-
-    filename = get_output_filename(args.file)
-    model = get_model(args.model)
-    translator = SubtitleTranslator(
-        model=model,
-        lang=args.language,
-        num_threads=args.threads,
-        tokens_per_chunk=args.chunk_size,
-        max_retries=args.retries,
-        temperature=args.temperature
+    files = get_input_files(args.files)
+    if not files:
+        parser.error(f"no .srt files found in {', '.join(args.files)}")
+    args.language = list(dict.fromkeys(args.language))
+    journal_files = {}
+    for file in files:
+        for language in args.language:
+            journal_file = get_journal_filename(file, language, args.model)
+            if journal_file in journal_files:
+                parser.error(f"{file} and {journal_files[journal_file]} would share the journal {journal_file}")
+            journal_files[journal_file] = file
+    model_params = {"timeout": args.timeout} if args.timeout else None
+    if args.replay:
+        # Offline, without creating the provider's client, token counts are replayed from the cassette
+        model = RecordingModel(None, args.replay, "replay", latency_scale=args.replay_speed, model_name=args.model)
+    else:
+        model = get_model(args.model, model_params)
+        if args.record:
+            model = RecordingModel(model, args.record)
+    fallback_models = [get_model(name, model_params) for name in args.fallback_models]
+    cache = TranslationCache(os.path.expanduser(args.cache_path), args.cache_size * 1024 * 1024, args.cache)
+    memory = TranslationMemory(args.memory)
+    telemetry = Telemetry(args.telemetry)
+    ledger = UsageLedger(Budget(args.total_budget) if args.total_budget is not None else None)
+    budget = Budget(args.budget, args.budget_tokens) if args.budget is not None or args.budget_tokens else None
+    sizer = ChunkSizer(os.path.expanduser(CHUNK_SIZES_PATH)) if args.adaptive_chunks else None
+    hedging = HedgePolicy(
+        get_model(args.hedge_model, model_params) if args.hedge_model else None, budget=args.hedge_budget
+    ) if args.hedge else None
+    scheduler = RequestScheduler(
+        max_concurrency=MAX_CONCURRENCY if args.adaptive else args.threads,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        adaptive=args.adaptive
     )
 
+    jobs = []
+    for file in files:
+        srt_data = read_srt(file)
+        for language in args.language:
+            journal = JobJournal(get_journal_filename(file, language, args.model), resume=args.resume)
+            translator = SubtitleTranslator(
+                model=model,
+                lang=language,
+                num_threads=args.threads,
+                tokens_per_chunk=args.chunk_size,
+                max_retries=args.retries,
+                temperature=args.temperature,
+                partial_repair=not args.no_repair,
+                cache=cache,
+                memory=memory,
+                scheduler=scheduler,
+                stream=args.stream,
+                journal=journal,
+                telemetry=telemetry,
+                sizer=sizer,
+                hedging=hedging,
+                largest_first=args.largest_first,
+                compact_ids=args.compact_ids,
+                deadline=args.deadline,
+                fallback_models=fallback_models,
+                ledger=ledger,
+                budget=budget,
+                job_id=file
+            )
+            filename = get_output_filename(file, language if len(args.language) > 1 else None)
+            output = open(filename, 'w', encoding='utf-8') if args.incremental else None
+            jobs.append((BatchJob(f"{os.path.basename(file)} [{language}]", translator, srt_data, output), filename))
+
     try:
-        result = translator.translate_subtitles(srt_data)
+        if args.batch_api:
+            with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+                results = list(executor.map(translate_with_batch_api, [job for job, _ in jobs]))
+        elif len(jobs) > 1:
+            results = asyncio.run(translate_batch([job for job, _ in jobs], args.languages_per_request))
+        elif args.use_async:
+            job = jobs[0][0]
+            results = [asyncio.run(job.translator.translate_subtitles_async(job.srt_data, output=job.output))]
+        else:
+            job = jobs[0][0]
+            results = [job.translator.translate_subtitles(job.srt_data, output=job.output)]
     except TranslationError as e:
-        return logger.error(e)
+        results = [e]
     finally:
-        logger.info(f"Total API cost: ${model.get_total_cost():.5f}")
+        cache.close()
+        memory.save()
+        if sizer is not None:
+            sizer.save()
+        if isinstance(model, RecordingModel):
+            model.close()
+        telemetry.close()
+        if args.metrics:
+            with open(args.metrics, 'w', encoding='utf-8') as f:
+                f.write(telemetry.prometheus())
+        for job, _ in jobs:
+            if job.output is not None:
+                job.output.close()
+
+    failed = 0
+    for (job, filename), result in zip(jobs, results):
+        journal = job.translator.journal
+        if isinstance(result, Exception):
+            failed += 1
+            journal.close()
+            logger.error(f"{job.name}: {result}")
+            if isinstance(result, TranslationError):
+                logger.info(f"Completed chunks saved to {journal.path}, run again with --resume to continue.")
+            continue
 
-    with open(filename, 'w', encoding='utf-8') as f:
-        f.write(result)
+        if job.output is None:
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write(result)
+        journal.close(remove=True)
+        logger.info(f"Translated {job.name} with {args.model}, file written to {filename}")
 
-    logger.info(f"Translated subtitles with {args.model}, file written to {filename}")
+    if len(jobs) > 1:
+        logger.info(f"Translated {len(jobs) - failed} of {len(jobs)} jobs.")
+    logger.info(telemetry.summary())
+    logger.info(ledger.summary())
+    if hedging is not None:
+        logger.info(f"Hedged {hedging.hedge_count} requests, {hedging.win_count} of them answered first.")
+    models = [model] + fallback_models
+    if hedging is not None and hedging.model is not None:
+        models.append(hedging.model)
+    if len(models) > 1:
+        for used_model in models:
+            logger.info(f"API cost of {used_model.model_name}: ${used_model.get_total_cost():.5f}")
+    logger.info(f"Total API cost: ${sum(used_model.get_total_cost() for used_model in models):.5f}")
 
 if __name__ == '__main__':
     main()